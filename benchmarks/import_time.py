@@ -0,0 +1,108 @@
+"""Startup-time benchmark: import cost per module, each in a fresh interpreter.
+
+Run from the repository root:
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --top 15 server classes.excel_reader
+
+For every module it reports the cumulative import time from `python -X
+importtime` and its heaviest direct imports. It then reports how long the
+first use of each built-in process type takes once the server is imported,
+which is what the lazy loading moves out of startup.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_MODULES = [
+    "server",
+    "classes.upload_pipeline",
+    "classes.excel_reader",
+    "classes.excel_writer",
+    "classes.format_add_column",
+    "classes.valoare_sgr",
+    "classes.valoare_minus",
+    "classes.excel_data_extractor",
+]
+
+FIRST_USE_SCRIPT = """
+import time
+import server
+from classes import processor_registry
+start = time.perf_counter()
+processor_registry.get_processor({process_type!r})
+print(time.perf_counter() - start)
+"""
+
+
+def run_python(args):
+    """Run a fresh interpreter in the repository root; returns (seconds, stdout, stderr)"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{result.stderr}")
+    return elapsed, result.stdout, result.stderr
+
+
+def parse_importtime(stderr):
+    """(depth, name, self_us, cumulative_us) per line of -X importtime output"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def import_cost(module, top):
+    """Cumulative import time of module and its heaviest direct imports"""
+    wall, _, stderr = run_python(["-X", "importtime", "-c", f"import {module}"])
+    entries = parse_importtime(stderr)
+    total = next((cumulative for depth, name, _, cumulative in entries if depth == 0 and name == module), 0)
+    # Imports nest below the module that triggered them: depth 1 is imported by module itself
+    heaviest = sorted((entry for entry in entries if entry[0] == 1), key=lambda entry: -entry[3])[:top]
+    return wall, total, heaviest
+
+
+def first_use_cost(process_type):
+    _, stdout, _ = run_python(["-c", FIRST_USE_SCRIPT.format(process_type=process_type)])
+    return float(stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="modules to import (default: %(default)s)")
+    parser.add_argument("--top", type=int, default=8, help="heaviest imports listed per module")
+    parser.add_argument("--no-first-use", action="store_true", help="skip the first-use timings")
+    args = parser.parse_args()
+
+    print(f"{'module':<32} {'import ms':>10} {'process ms':>11}")
+    details = []
+    for module in args.modules:
+        wall, total, heaviest = import_cost(module, args.top)
+        print(f"{module:<32} {total / 1000:>10.1f} {wall * 1000:>11.1f}")
+        details.append((module, heaviest))
+
+    for module, heaviest in details:
+        print(f"\nHeaviest imports under {module}:")
+        for _, name, _, cumulative in heaviest:
+            print(f"  {name:<40} {cumulative / 1000:>8.1f} ms")
+
+    if not args.no_first_use:
+        from classes.processor_registry import BUILTIN_PROCESSORS
+
+        print("\nFirst use of each process type after importing server:")
+        for process_type in BUILTIN_PROCESSORS:
+            print(f"  {process_type:<10} {first_use_cost(process_type) * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Throughput benchmark: read, process and write timed separately for every process type.
+
+Run from the repository root:
+
+    python benchmarks/run_benchmarks.py --output baseline.json
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 --cases sgr-M1 minus
+    python benchmarks/run_benchmarks.py --output current.json --compare baseline.json
+    python benchmarks/run_benchmarks.py --compact --sizes 100000
+
+Inputs are synthetic workbooks (see workbooks.py), generated once per case
+and size and cached under benchmarks/.data. Each stage runs in its own child
+process so its peak RSS is its own: the frame it starts from is loaded from a
+pickle before the clock starts, and the RSS at that point is recorded next to
+the peak. With --compare, a stage that got slower than the baseline by more
+than --threshold is reported and the exit status is 1. Each stage also
+reports the deep memory of the frame it produced; --compact holds the frames
+in the compact dtypes (see classes/compact_dtypes.py) to compare against.
+"""
+import argparse
+import importlib
+import io
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from workbooks import CASES, workbook_path  # noqa: E402
+
+DATA_DIR = os.path.join(ROOT, "benchmarks", ".data")
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+STAGES = ["read", "process", "write"]
+# Slowdowns smaller than this many seconds are timer noise, never regressions
+NOISE_SECONDS = 0.01
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where it can't be measured"""
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+
+def run_stage(stage, case, path, workdir, compact=False):
+    """Run one stage in this process, leaving its output and measurements in workdir"""
+    from classes import processor_registry
+    from classes.compact_dtypes import compact_frame, frame_memory
+
+    process_type, filename, _ = CASES[case]
+    processor = processor_registry.get_processor(process_type)
+
+    if stage == "read":
+        from classes.excel_reader import ExcelReader
+
+        reader = ExcelReader(processor.reader_engine)
+        input_rss = peak_rss_mb()
+        start = time.perf_counter()
+        df = reader.read(path, usecols=processor.column_filter())
+        if compact:
+            df = compact_frame(df, processor.category_columns, processor.exact_columns)
+        seconds = time.perf_counter() - start
+        output = df
+    elif stage == "process":
+        with open(os.path.join(workdir, "read.pkl"), "rb") as f:
+            df = pickle.load(f)
+        df.name = filename
+        input_rss = peak_rss_mb()
+        start = time.perf_counter()
+        output = processor.process_dataframe(df)
+        if compact:
+            output = compact_frame(output, processor.category_columns)
+        seconds = time.perf_counter() - start
+    else:
+        from classes.excel_writer import ExcelWriter
+
+        with open(os.path.join(workdir, "process.pkl"), "rb") as f:
+            df = pickle.load(f)
+        input_rss = peak_rss_mb()
+        start = time.perf_counter()
+        ExcelWriter.write_frame(df, io.BytesIO(), column_formats=processor.column_formats())
+        seconds = time.perf_counter() - start
+        output = None
+
+    measured = {"seconds": seconds, "peak_rss_mb": peak_rss_mb(), "input_rss_mb": input_rss,
+                "frame_mb": frame_memory(output) / (1024 * 1024) if output is not None else None}
+    if output is not None:
+        with open(os.path.join(workdir, f"{stage}.pkl"), "wb") as f:
+            pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(workdir, f"{stage}.json"), "w") as f:
+        json.dump(measured, f)
+
+
+def measure(case, rows, workdir, compact=False):
+    """Run the three stages of case at rows in child processes; returns one result per stage"""
+    process_type, _, _ = CASES[case]
+    path = workbook_path(DATA_DIR, case, rows)
+    results = []
+    for stage in STAGES:
+        command = [sys.executable, os.path.abspath(__file__), "--stage", stage,
+                   "--case", case, "--input", path, "--workdir", workdir] + (["--compact"] if compact else [])
+        child = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+        if child.returncode != 0:
+            raise RuntimeError(f"{case} {rows} rows, {stage} failed:\n{child.stderr}")
+        with open(os.path.join(workdir, f"{stage}.json")) as f:
+            measured = json.load(f)
+        seconds = measured["seconds"]
+        results.append({
+            "case": case,
+            "process_type": process_type,
+            "rows": rows,
+            "stage": stage,
+            "seconds": round(seconds, 4),
+            "rows_per_sec": round(rows / seconds) if seconds else None,
+            "peak_rss_mb": _round(measured["peak_rss_mb"]),
+            "input_rss_mb": _round(measured["input_rss_mb"]),
+            "frame_mb": _round(measured["frame_mb"]),
+            "compact": compact,
+        })
+    return results
+
+
+def _round(value):
+    return None if value is None else round(value, 1)
+
+
+def environment():
+    """Where the numbers came from, so baselines from different commits can be told apart"""
+    import pandas as pd
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "pyarrow": _version("pyarrow"),
+        "platform": platform.platform(),
+    }
+
+
+def _version(module):
+    try:
+        return importlib.import_module(module).__version__
+    except ImportError:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print the change against baseline per stage; returns the stages that regressed"""
+    previous = {(r["case"], r["rows"], r["stage"]): r for r in baseline["results"]}
+    print(f"\nAgainst {baseline['meta'].get('commit')} ({baseline['meta'].get('date')}):")
+    regressions = []
+    for result in results:
+        before = previous.get((result["case"], result["rows"], result["stage"]))
+        if before is None or not before["seconds"]:
+            continue
+        change = result["seconds"] / before["seconds"] - 1
+        flag = ""
+        if change > threshold and result["seconds"] - before["seconds"] > NOISE_SECONDS:
+            flag = "  REGRESSION"
+            regressions.append(result)
+        print(f"  {result['case']:<16} {result['rows']:>9} {result['stage']:<8} "
+              f"{before['seconds']:>9.3f}s -> {result['seconds']:>9.3f}s {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="rows per workbook")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES), help="cases to run")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--compact", action="store_true",
+                        help="hold frames in the compact dtypes (categoricals, Arrow strings)")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown over the baseline reported as a regression (default: %(default)s)")
+    # A single stage in a child process, see measure
+    parser.add_argument("--stage", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--input", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        run_stage(args.stage, args.case, args.input, args.workdir, args.compact)
+        return
+
+    print(f"{'case':<16} {'rows':>9} {'stage':<8} {'seconds':>9} {'rows/s':>10} {'peak MB':>8} {'input MB':>9} "
+          f"{'frame MB':>9}")
+    results = []
+    for rows in args.sizes:
+        for case in args.cases:
+            with tempfile.TemporaryDirectory(prefix="excel_benchmark_") as workdir:
+                for result in measure(case, rows, workdir, args.compact):
+                    results.append(result)
+                    print(f"{case:<16} {rows:>9} {result['stage']:<8} {result['seconds']:>9.3f} "
+                          f"{result['rows_per_sec'] or 0:>10} {result['peak_rss_mb'] or 0:>8.1f} "
+                          f"{result['input_rss_mb'] or 0:>9.1f} {result['frame_mb'] or 0:>9.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": environment(), "results": results}, f, indent=2)
+        print(f"\nWrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Server throughput benchmark: requests per second of serve.py by worker count.
+
+Run from the repository root:
+
+    python benchmarks/serve_throughput.py
+    python benchmarks/serve_throughput.py --workers 1 2 4 --duration 30 --case sgr-M1 --rows 2000
+    python benchmarks/serve_throughput.py --server waitress --threads 8 --output serve.json
+
+For each worker count, serve.py is started on a local port with the result
+cache off, and the same generated workbook (see workbooks.py) is posted to
+/process from several client threads (--concurrency, by default twice the
+workers) for --duration seconds after a short warm-up. Requests/sec should
+grow with the workers up to the number of CPU cores, since each request is
+CPU-bound in one process.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run_benchmarks import DATA_DIR, environment  # noqa: E402
+from workbooks import CASES, workbook_path  # noqa: E402
+
+# Requests sent to each server before timing starts
+WARMUP_REQUESTS = 4
+# Seconds to wait for a server to answer after starting it
+STARTUP_TIMEOUT = 60
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def multipart_body(process_type, filename, data):
+    """(body, content type) of the form the upload page posts"""
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"process_type\"\r\n\r\n{process_type}\r\n"
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/vnd.openxmlformats-officedocument.spreadsheetml.sheet\r\n\r\n").encode()
+    body += data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def post(url, body, content_type) -> int:
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type})
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def start_server(server, workers, threads, port, log):
+    env = dict(os.environ, EXCEL_PROCESSOR_RESULT_CACHE_MAX_BYTES="0")
+    process = subprocess.Popen([sys.executable, "serve.py", "--server", server, "--port", str(port),
+                                "--workers", str(workers), "--threads", str(threads)],
+                               cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve.py exited with status {process.returncode}, see {log.name}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/"):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"serve.py did not answer within {STARTUP_TIMEOUT}s, see {log.name}")
+
+
+def load(url, body, content_type, concurrency, duration):
+    """Post from concurrency threads for duration seconds; (latencies of the successes, failures)"""
+    latencies, failures = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status = post(url, body, content_type)
+            elapsed = time.perf_counter() - start
+            with lock:
+                (latencies if status == 200 else failures).append(elapsed)
+
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return latencies, failures
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)] if values else None
+
+
+def measure(args, workers, body, content_type, log):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/process"
+    concurrency = args.concurrency or 2 * workers
+    process = start_server(args.server, workers, args.threads, port, log)
+    try:
+        for _ in range(WARMUP_REQUESTS):
+            post(url, body, content_type)
+        start = time.perf_counter()
+        latencies, failures = load(url, body, content_type, concurrency, args.duration)
+        elapsed = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        "workers": workers,
+        "threads": args.threads,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "failed": len(failures),
+        "requests_per_second": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+    }
+
+
+def main():
+    cores = os.cpu_count() or 1
+    default_workers = sorted({1, 2, *range(4, cores + 1, 4), cores})
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers,
+                        help="worker counts to measure (default: %(default)s)")
+    parser.add_argument("--threads", type=int, default=1, help="threads per worker (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, help="client threads (default: twice the workers)")
+    parser.add_argument("--duration", type=float, default=15, help="seconds per worker count (default: %(default)s)")
+    parser.add_argument("--case", choices=list(CASES), default="minus", help="workbook posted (default: %(default)s)")
+    parser.add_argument("--rows", type=int, default=1000, help="rows in the workbook (default: %(default)s)")
+    parser.add_argument("--server", choices=["auto", "gunicorn", "waitress"], default="auto",
+                        help="WSGI server serve.py runs (default: %(default)s)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    process_type, filename, _ = CASES[args.case]
+    with open(workbook_path(DATA_DIR, args.case, args.rows), "rb") as f:
+        body, content_type = multipart_body(process_type, filename, f.read())
+
+    results = []
+    with tempfile.NamedTemporaryFile("w", prefix="serve-", suffix=".log", delete=False) as log:
+        print(f"{args.case}, {args.rows} rows, {cores} cores; server output in {log.name}")
+        print(f"{'workers':>7} {'clients':>7} {'requests':>9} {'failed':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for workers in args.workers:
+            result = measure(args, workers, body, content_type, log)
+            results.append(result)
+            print(f"{result['workers']:>7} {result['concurrency']:>7} {result['requests']:>9} {result['failed']:>6} "
+                  f"{result['requests_per_second']:>8.2f} {result['p50_ms'] or 0:>8.1f} {result['p95_ms'] or 0:>8.1f}")
+
+    if args.output:
+        meta = {**environment(), "cpu_count": cores, "server": args.server, "case": args.case, "rows": args.rows}
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Synthetic input workbooks for every process type, shaped like the real exports.
+
+Each case maps to (process_type, upload filename, frame generator). The
+filename matters: sgr picks its column layout and extract its document type
+from it. Real exports leave some headers blank, which pandas reads back as
+'Unnamed: N'; the generators name those columns the same way, so the written
+workbooks read back with identical column names.
+"""
+import os
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+# TVA rates as the exports write them: fractions on older files, percents on newer ones
+TVA_RATES = [0.19, 0.09, 0.05, 0, 19, 9, 5, 21, 11]
+TVA_WEIGHTS = [0.3, 0.15, 0.05, 0.05, 0.2, 0.1, 0.05, 0.05, 0.05]
+
+PARTNERS = ["SC Alfa SRL", "Beta Distributie SA", "Gama Foods SRL", "Delta Impex SRL", "Omega Trade SA",
+            "Horeca Plus SRL", "Lactate Nord SA", "Panificatie Sud SRL"]
+
+
+def _rng(seed):
+    return np.random.default_rng(seed)
+
+
+def _amounts(rng, rows, scale=250.0):
+    """Positive amounts with two decimals and a long tail"""
+    return np.round(rng.lognormal(np.log(scale), 1.0, rows), 2)
+
+
+def _dates(rng, rows, year=2024):
+    days = rng.integers(0, 365, rows)
+    return pd.Timestamp(year, 1, 1) + pd.to_timedelta(days, unit="D")
+
+
+def _fiscal_codes(rng, rows):
+    """Partner codes: mostly VAT payers ('RO...'), some without the prefix"""
+    numbers = rng.integers(1_000_000, 49_999_999, rows).astype(str)
+    prefixed = rng.random(rows) < 0.8
+    return np.where(prefixed, np.char.add("RO", numbers), numbers).astype(object)
+
+
+def _tva_rates(rng, rows):
+    return rng.choice(np.array(TVA_RATES, dtype=object), rows, p=TVA_WEIGHTS)
+
+
+def sgr_frame(rows, seed=0):
+    """SGR sales report: 24 columns, blank headers, deposit amounts in columns 18-20"""
+    rng = _rng(seed)
+    quantity = rng.integers(1, 48, rows)
+    columns = {f"Unnamed: {i}": _amounts(rng, rows, 40.0) for i in range(24)}
+    columns["Unnamed: 0"] = np.arange(1, rows + 1)
+    columns["Unnamed: 1"] = np.char.add("ART", rng.integers(10_000, 99_999, rows).astype(str)).astype(object)
+    columns["Unnamed: 2"] = rng.choice(np.array(["Apa plata 0.5L", "Suc portocale 2L", "Bere doza 0.5L",
+                                                 "Apa minerala 1.5L", "Energizant 0.25L"], dtype=object), rows)
+    columns["Unnamed: 3"] = _dates(rng, rows).strftime("%d/%m/%Y").to_numpy(dtype=object)
+    columns["Unnamed: 4"] = quantity
+    deposit = np.round(quantity * 0.5, 2)
+    for i in (18, 19, 20):
+        columns[f"Unnamed: {i}"] = deposit
+    columns["Unnamed: 5"] = np.round(_amounts(rng, rows, 60.0) + deposit, 2)
+    return pd.DataFrame(columns)
+
+
+def minus_frame(rows, seed=0):
+    """Customer balances whose 'Valoare' is negated and 'Data Ultimei Incasari' reformatted"""
+    rng = _rng(seed)
+    return pd.DataFrame({
+        "Cod Client": rng.integers(1000, 99_999, rows),
+        "Nume Client": rng.choice(np.array(PARTNERS, dtype=object), rows),
+        "Numar Document": rng.integers(100_000, 999_999, rows),
+        "Data Ultimei Incasari": _dates(rng, rows),
+        "Valoare": _amounts(rng, rows, 800.0),
+        "Scadenta (zile)": rng.integers(0, 90, rows),
+    })
+
+
+def adaos_frame(rows, seed=0):
+    """Reception report with purchase/sale amounts and a mix of TVA rates"""
+    rng = _rng(seed)
+    purchase = _amounts(rng, rows, 500.0)
+    markup = np.round(purchase * rng.uniform(0.05, 0.6, rows), 2)
+    sale_tva = np.round((purchase + markup) * 0.19, 2)
+    difference = np.where(rng.random(rows) < 0.3, np.nan, np.round(markup * 0.19, 2))
+    return pd.DataFrame({
+        "NIR": rng.integers(1, 50_000, rows),
+        "Data NIR": _dates(rng, rows),
+        "Data": _dates(rng, rows),
+        "Furnizor": rng.choice(np.array(PARTNERS, dtype=object), rows),
+        "Numar Aviz": rng.integers(1, 999_999, rows),
+        "Data Aviz": _dates(rng, rows),
+        "Valoare Achizitie": purchase,
+        "TVA Achizitie": np.round(purchase * 0.19, 2),
+        "% TVA Ach": _tva_rates(rng, rows),
+        "Procent TVA": rng.choice([19, 9, 5], rows),
+        "Unnamed: 10": np.round(markup * 0.1, 2),
+        "TVVAaloare Diferenta": difference,
+        "Adaos": markup,
+        "Adaos Proc": np.round(markup / purchase * 100, 2),
+        "Valoare TVA": sale_tva,
+        "Valoare TVA.1": sale_tva,
+        "% TVA VANZARE": _tva_rates(rng, rows),
+        "TVAACH": np.round(purchase * 0.19, 2),
+    })
+
+
+# Source columns of the three ExcelDataExtractor input styles
+EXTRACT_STYLES = {
+    1: ("Numar Factura", "Data Document", "Valoare Achizitie", "Nume", "CUI/CNP", "TVA Achizitie"),
+    2: ("Numar Factura", "Data Factura", "ValoareAchizitie Fara TVA", "Partener", "Cod Fiscal Partener",
+        "Cota TVA B"),
+    3: ("NIR", "Data NIR", "Valoare", "Furnizor", "CUI", "% TVA Ach"),
+}
+
+
+def extract_frame(style, rows, seed=0):
+    """Purchase report in one of the extractor's input styles"""
+    rng = _rng(seed)
+    doc_num, date, price, partner, code, tva = EXTRACT_STYLES[style]
+    return pd.DataFrame({
+        doc_num: rng.integers(1, 999_999, rows),
+        date: _dates(rng, rows),
+        price: _amounts(rng, rows, 300.0),
+        partner: rng.choice(np.array(PARTNERS, dtype=object), rows),
+        code: _fiscal_codes(rng, rows),
+        tva: rng.choice([19, 9, 5, 0], rows, p=[0.5, 0.25, 0.1, 0.15]),
+        "Procent TVA": rng.choice([19, 9, 5], rows),
+    })
+
+
+# case -> (process_type, upload filename, frame generator taking (rows, seed))
+CASES = {
+    "adaos": ("adaos", "Adaos receptii.xlsx", adaos_frame),
+    "sgr-M1": ("sgr", "Vanzari M1.xlsx", sgr_frame),
+    "sgr-M2": ("sgr", "Vanzari M2.xlsx", sgr_frame),
+    "sgr-M3": ("sgr", "Vanzari M3.xlsx", sgr_frame),
+    "sgr-AMT": ("sgr", "Vanzari AMT.xlsx", sgr_frame),
+    "minus": ("minus", "Sold clienti.xlsx", minus_frame),
+    "extract-style1": ("extract", "Achizitii M1 stil1.xlsx", partial(extract_frame, 1)),
+    "extract-style2": ("extract", "Achizitii AUTOSERVIRE stil2.xlsx", partial(extract_frame, 2)),
+    "extract-style3": ("extract", "Achizitii M5 stil3.xlsx", partial(extract_frame, 3)),
+}
+
+
+def workbook_path(directory, case, rows, seed=0):
+    """Path of the generated workbook for case, writing it first if it does not exist yet"""
+    from classes.excel_writer import ExcelWriter
+
+    path = os.path.join(directory, f"{case}-{rows}-{seed}.xlsx")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        _, _, generate = CASES[case]
+        temp_path = path + ".tmp"
+        ExcelWriter.write_frame(generate(rows, seed), temp_path)
+        os.replace(temp_path, path)
+    return path
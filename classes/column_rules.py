@@ -0,0 +1,220 @@
+import operator
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from classes.date_normalizer import DateNormalizer
+
+
+class MissingColumnsError(KeyError):
+    """Columns a rule needs are not in the frame"""
+
+    def __init__(self, columns: List):
+        self.columns = columns
+        super().__init__(", ".join(f"'{column}'" for column in columns) + " not found in DataFrame columns.")
+
+
+class Rule:
+    """One vectorized column transform writing its result to target.
+
+    A new target column is inserted after the column named by after (at the
+    end without one); an existing target is replaced where it is. A rule given
+    when only runs if all of those columns are present and is skipped
+    otherwise; without it, missing input columns make the rules fail to compile.
+    """
+
+    def __init__(self, target, sources: Sequence = (), after=None, when: Optional[Sequence] = None):
+        self.target = target
+        self.sources = tuple(sources)
+        self.after = after
+        self.when = tuple(when) if when is not None else None
+
+    def compute(self, df: pd.DataFrame) -> pd.Series:
+        raise NotImplementedError
+
+    def _params(self) -> tuple:
+        """What besides the columns defines the transform"""
+        return ()
+
+    def _key(self) -> tuple:
+        return type(self), self.target, self.sources, self.after, self.when, self._params()
+
+    def __eq__(self, other):
+        return isinstance(other, Rule) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.target!r} <- {', '.join(map(repr, self.sources))})"
+
+
+class ToNumeric(Rule):
+    """Convert a column to numbers; what does not parse becomes NaN"""
+
+    def __init__(self, column, when=None):
+        super().__init__(column, (column,), when=when)
+
+    def compute(self, df):
+        return pd.to_numeric(df[self.target], errors='coerce')
+
+
+class Subtract(Rule):
+    """target = minuend - subtrahend"""
+
+    def __init__(self, target, minuend, subtrahend, after=None, when=None):
+        super().__init__(target, (minuend, subtrahend), after, when)
+
+    def compute(self, df):
+        return df[self.sources[0]] - df[self.sources[1]]
+
+
+class Add(Rule):
+    """target = left + right"""
+
+    def __init__(self, target, left, right, after=None, when=None):
+        super().__init__(target, (left, right), after, when)
+
+    def compute(self, df):
+        return df[self.sources[0]] + df[self.sources[1]]
+
+
+class Scale(Rule):
+    """target = source * factor, or source / divisor"""
+
+    def __init__(self, target, source, factor=None, divisor=None, after=None, when=None):
+        if (factor is None) == (divisor is None):
+            raise ValueError("Scale takes exactly one of factor and divisor")
+        super().__init__(target, (source,), after, when)
+        self.factor = factor
+        self.divisor = divisor
+
+    def _params(self):
+        return self.factor, self.divisor
+
+    def compute(self, df):
+        source = df[self.sources[0]]
+        return source * self.factor if self.factor is not None else source / self.divisor
+
+
+class Negate(Rule):
+    """Flip the sign of a column's values"""
+
+    def __init__(self, column, when=None):
+        super().__init__(column, (column,), when=when)
+
+    def compute(self, df):
+        column = df[self.target]
+        if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+            return -column
+        # Mixed or boolean columns: value by value, as Python negates them
+        return column.apply(operator.neg)
+
+
+class NormalizeDates(Rule):
+    """Rewrite a column's dates in one text format (see DateNormalizer)"""
+
+    def __init__(self, column, output_format: str = '%Y%m%d', errors: str = 'coerce', when=None):
+        super().__init__(column, (column,), when=when)
+        self.normalizer = DateNormalizer(output_format, errors=errors)
+
+    def _params(self):
+        return self.normalizer.output_format, self.normalizer.errors
+
+    def compute(self, df):
+        return self.normalizer.normalize(df[self.target])
+
+
+class StripText(Rule):
+    """Remove every occurrence of text from a column, as text"""
+
+    def __init__(self, column, text: str, when=None):
+        super().__init__(column, (column,), when=when)
+        self.text = text
+
+    def _params(self):
+        return (self.text,)
+
+    def compute(self, df):
+        return df[self.target].astype(str).str.replace(self.text, '', regex=False)
+
+
+class CompiledRules:
+    """Rules resolved against one header: which run, and where new columns go"""
+
+    def __init__(self, steps: List[Tuple[Rule, Optional[int]]], columns: Tuple):
+        # (rule, insert position or None to replace the existing column)
+        self.steps = steps
+        self.columns = columns
+
+    def run(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Apply the rules to df in place and return it; df must have the compiled header"""
+        for rule, position in self.steps:
+            values = rule.compute(df)
+            if position is None:
+                df[rule.target] = values
+            else:
+                df.insert(position, rule.target, values)
+        return df
+
+
+class ColumnRules:
+    """An ordered list of column rules, compiled once per header and run in place.
+
+    Compiling works out from the header alone which rules apply and where new
+    columns are inserted, so running a plan is only the column computations:
+    the frame is never copied or reindexed. Plans are kept per header, so the
+    chunks of a streamed upload and repeated uploads reuse them.
+    """
+
+    # Headers whose plans are kept
+    MAX_PLANS = 64
+
+    def __init__(self, *rules: Rule):
+        self.rules = list(rules)
+        self._plans: Dict[Tuple, CompiledRules] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def combine(cls, *rule_sets: "ColumnRules") -> "ColumnRules":
+        """Rules applying several rule sets in one pass; a rule shared by them runs once"""
+        return cls(*dict.fromkeys(rule for rule_set in rule_sets for rule in rule_set.rules))
+
+    def compile(self, columns: Iterable) -> CompiledRules:
+        """The plan for a frame with these columns; raises MissingColumnsError if a required one is absent"""
+        columns = tuple(columns)
+        with self._lock:
+            plan = self._plans.get(columns)
+        if plan is not None:
+            return plan
+
+        current = list(columns)
+        steps = []
+        missing = []
+        for rule in self.rules:
+            if rule.when is not None and not all(column in current for column in rule.when):
+                continue
+            absent = [column for column in rule.sources if column not in current and column not in missing]
+            if absent:
+                missing.extend(absent)
+                continue
+            if rule.target in current:
+                steps.append((rule, None))
+                continue
+            position = current.index(rule.after) + 1 if rule.after in current else len(current)
+            current.insert(position, rule.target)
+            steps.append((rule, position))
+        if missing:
+            raise MissingColumnsError(missing)
+
+        plan = CompiledRules(steps, columns)
+        with self._lock:
+            if len(self._plans) >= self.MAX_PLANS:
+                self._plans.pop(next(iter(self._plans)))
+            self._plans[columns] = plan
+        return plan
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Compile for df's header and run the plan on df in place"""
+        return self.compile(df.columns).run(df)
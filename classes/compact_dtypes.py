@@ -0,0 +1,105 @@
+import importlib.util
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Parsed sheets hold their text in object columns, one Python string per cell,
+# even where a column repeats a few TVA rates or supplier names. The compact
+# mode (see upload_pipeline) stores such columns as categoricals, each distinct
+# value once, and other text as Arrow strings.
+
+# A text column is made categorical when it has at most this many distinct
+# values per row: a few TVA rates or a few hundred suppliers over many rows
+MAX_CATEGORY_RATIO = 0.5
+
+
+def arrow_strings_available() -> bool:
+    """Whether text columns can be stored as Arrow strings"""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def string_dtype():
+    """Arrow-backed string dtype with NaN for missing values, like object columns; None without pyarrow.
+
+    Missing values stay NaN instead of pd.NA, so comparisons and masks
+    behave as they do on object columns.
+    """
+    if not arrow_strings_available():
+        return None
+    try:
+        return pd.StringDtype("pyarrow", na_value=np.nan)
+    except TypeError:
+        # pandas before 2.3 names this dtype differently
+        return pd.StringDtype("pyarrow_numpy")
+
+
+def supports_compaction(processors) -> bool:
+    """Whether every processor declares which of its input columns must keep their dtype"""
+    return all(getattr(processor, "exact_columns", None) is not None for processor in processors)
+
+
+def compact_frame(df: pd.DataFrame, categories: Iterable = (), exact: Iterable = ()) -> pd.DataFrame:
+    """A frame with df's values in smaller dtypes; df itself is left as it is.
+
+    Object columns with few distinct values, and the columns named in
+    categories, become categoricals; other all-text object columns become
+    Arrow strings when pyarrow is installed. Columns named in exact, and the
+    non-object ones, are kept as they are. Values are unchanged, except that
+    missing ones read back as NaN.
+    """
+    categories = set(categories)
+    exact = set(exact)
+    strings = string_dtype()
+    compacted = df.copy(deep=False)
+    for position, name in enumerate(df.columns):
+        column = df.iloc[:, position]
+        if name in exact or column.dtype != object:
+            continue
+        if name in categories or _is_repetitive(column):
+            compacted.isetitem(position, column.astype("category"))
+        elif strings is not None and pd.api.types.infer_dtype(column, skipna=True) == "string":
+            compacted.isetitem(position, column.astype(strings))
+    if hasattr(df, "name"):
+        compacted.name = df.name
+    return compacted
+
+
+def _is_repetitive(column: pd.Series) -> bool:
+    present = column.count()
+    return present > 1 and column.nunique() <= MAX_CATEGORY_RATIO * present
+
+
+def frame_memory(df: Optional[pd.DataFrame]) -> int:
+    """Bytes held by df, counting the Python objects in its object columns"""
+    if df is None:
+        return 0
+    return int(df.memory_usage(deep=True).sum())
+
+
+def concat_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """pd.concat(frames, ignore_index=True) that keeps categorical columns categorical.
+
+    pd.concat falls back to object dtype when a categorical column meets
+    other values or other categories; here the categories are unified first.
+    """
+    frames = list(frames)
+    names = frames[0].columns if frames else []
+    for name in names:
+        columns = [frame[name] for frame in frames if name in frame.columns]
+        if not any(isinstance(column.dtype, pd.CategoricalDtype) for column in columns):
+            continue
+        # Every frame's values, as the categories of the combined column
+        parts = [column.cat.categories if isinstance(column.dtype, pd.CategoricalDtype)
+                 else pd.Index(column.dropna().unique()) for column in columns]
+        categories = parts[0].astype(object).append([part.astype(object) for part in parts[1:]]).unique()
+        frames = [_with_categories(frame, name, categories) for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _with_categories(frame: pd.DataFrame, name, categories) -> pd.DataFrame:
+    if name not in frame.columns:
+        return frame
+    frame = frame.copy(deep=False)
+    frame[name] = pd.Categorical(frame[name], categories=categories)
+    return frame
@@ -0,0 +1,194 @@
+import datetime
+import re
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+# Accepted text date formats, in priority order: the first one that parses wins
+DATE_FORMATS = [
+    '%d/%m/%Y',    # DD/MM/YYYY
+    '%d-%m-%Y',    # DD-MM-YYYY
+    '%Y-%m-%d',    # YYYY-MM-DD
+    '%d.%m.%Y',    # DD.MM.YYYY
+    '%Y/%m/%d',    # YYYY/MM/DD
+    '%m/%d/%Y',    # MM/DD/YYYY
+    '%d-%b-%Y',    # DD-MMM-YYYY (14-Feb-2024)
+    '%d-%B-%Y',    # DD-MMMM-YYYY
+    '%d %b %Y',    # DD MMM YYYY
+    '%d %B %Y',    # DD MMMM YYYY
+    # The same dates with a time of day, as exports write datetimes as text
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d-%m-%Y %H:%M:%S',
+    '%d.%m.%Y %H:%M:%S',
+    '%d.%m.%Y %H:%M',
+]
+
+# Other ISO 8601 date-times ('2024-01-15T13:45:00.5', with an offset...) are
+# parsed by datetime.fromisoformat, as pd.to_datetime parses them
+_ISO_DATETIME = re.compile(r"\d{4}-\d{2}-\d{2}[T ]")
+
+# Excel serial number of 1970-01-01
+_EXCEL_UNIX_EPOCH = 25569
+
+
+@lru_cache(maxsize=65536)
+def parse_date_string(text: str) -> Optional[datetime.datetime]:
+    """Parse text with the first matching DATE_FORMATS entry, else as an ISO 8601 date-time, or return None"""
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    if _ISO_DATETIME.match(text):
+        try:
+            return datetime.datetime.fromisoformat(text)
+        except ValueError:
+            pass
+    return None
+
+
+def excel_serial_to_datetime(serial) -> datetime.datetime:
+    """Convert an Excel serial date (e.g. 45296.0) to a naive datetime"""
+    timestamp = round((serial - _EXCEL_UNIX_EPOCH) * 86400, 3)
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).replace(tzinfo=None)
+
+
+class DateNormalizer:
+    """Normalizes dates given as datetimes, text or Excel serials to one text format.
+
+    normalize() works on a whole Series: every distinct value is converted once,
+    the dominant text format is inferred from a sample and applied with a single
+    pd.to_datetime call, and only the leftovers go through the other formats.
+    The result per value is the same as normalize_value(), which tries the
+    formats in DATE_FORMATS order.
+
+    errors='ignore' leaves values that are not dates as they are (text is
+    stripped), missing ones included; errors='coerce' turns them into NaN,
+    as pd.to_datetime(errors='coerce') does.
+    """
+
+    # Distinct text values sampled to infer the dominant format
+    SAMPLE_SIZE = 200
+
+    def __init__(self, output_format: str = '%Y%m%d', errors: str = 'ignore'):
+        if errors not in ('ignore', 'coerce'):
+            raise ValueError(f"errors must be 'ignore' or 'coerce', got '{errors}'")
+        self.output_format = output_format
+        self.errors = errors
+
+    def _unparsed(self, value):
+        return np.nan if self.errors == 'coerce' else value
+
+    def normalize_value(self, value):
+        """Normalize a single value"""
+        if value is None:
+            return self._unparsed(None)
+
+        try:
+            if isinstance(value, datetime.date):
+                return value.strftime(self.output_format)
+
+            if isinstance(value, str):
+                value = value.strip()
+                parsed = parse_date_string(value)
+                if parsed is not None:
+                    return parsed.strftime(self.output_format)
+                return self._unparsed(value)
+
+            if isinstance(value, (int, float, np.number)):
+                return excel_serial_to_datetime(value).strftime(self.output_format)
+
+            return self._unparsed(value)
+
+        except Exception as e:
+            logger.debug(f"Could not normalize date {value!r}: {e}")
+            return self._unparsed(value)
+
+    def normalize(self, values: pd.Series) -> pd.Series:
+        """Normalize a whole Series, keeping its index and name"""
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            return values.dt.strftime(self.output_format).astype(object)
+
+        codes, uniques = pd.factorize(values.astype(object))
+        uniques = np.asarray(uniques, dtype=object)
+        results = np.empty(len(uniques), dtype=object)
+
+        is_text = np.array([isinstance(value, str) for value in uniques], dtype=bool)
+        is_number = np.array(
+            [isinstance(value, (int, float, np.number)) and not isinstance(value, str) for value in uniques],
+            dtype=bool
+        )
+        if is_text.any():
+            results[is_text] = self._normalize_text(uniques[is_text])
+        if is_number.any():
+            results[is_number] = self._normalize_serials(uniques[is_number])
+        others = ~(is_text | is_number)
+        if others.any():
+            results[others] = [self.normalize_value(value) for value in uniques[others]]
+
+        # Missing values (code -1) are passed through, or become NaN when coercing
+        normalized = values.to_numpy(dtype=object, copy=True)
+        if self.errors == 'coerce':
+            normalized[codes < 0] = np.nan
+        present = codes >= 0
+        normalized[present] = results[codes[present]]
+        return pd.Series(normalized, index=values.index, name=values.name, dtype=object)
+
+    def _normalize_text(self, texts: np.ndarray) -> np.ndarray:
+        """Normalize distinct strings with one vectorized parse per format"""
+        stripped = pd.Series([text.strip() for text in texts], dtype=object)
+        parsed = pd.Series(pd.NaT, index=stripped.index, dtype='datetime64[ns]')
+
+        dominant = self._dominant_format(stripped)
+        if dominant is not None:
+            parsed = pd.to_datetime(stripped, format=dominant, errors='coerce')
+            # Formats listed before the dominant one still take precedence
+            for date_format in DATE_FORMATS[:DATE_FORMATS.index(dominant)]:
+                claimed = parsed.notna()
+                if not claimed.any():
+                    break
+                earlier = pd.to_datetime(stripped[claimed], format=date_format, errors='coerce')
+                parsed.loc[earlier.dropna().index] = earlier.dropna()
+
+        for date_format in DATE_FORMATS:
+            if date_format == dominant:
+                continue
+            leftover = parsed.isna()
+            if not leftover.any():
+                break
+            parsed.loc[leftover] = pd.to_datetime(stripped[leftover], format=date_format, errors='coerce')
+
+        results = parsed.dt.strftime(self.output_format).to_numpy(dtype=object, copy=True)
+        # Whatever pandas could not parse (e.g. out-of-range years) goes through strptime
+        for i in np.flatnonzero(parsed.isna().to_numpy()):
+            results[i] = self.normalize_value(stripped.iat[i])
+        return results
+
+    def _dominant_format(self, texts: pd.Series) -> Optional[str]:
+        """The format that parses most of a sample of texts, earliest on ties"""
+        sample = texts.iloc[:self.SAMPLE_SIZE]
+        best, best_count = None, 0
+        for date_format in DATE_FORMATS:
+            count = int(pd.to_datetime(sample, format=date_format, errors='coerce').notna().sum())
+            if count > best_count:
+                best, best_count = date_format, count
+            if best_count == len(sample):
+                break
+        return best
+
+    def _normalize_serials(self, serials: np.ndarray) -> np.ndarray:
+        """Normalize distinct Excel serial numbers"""
+        numbers = pd.to_numeric(pd.Series(serials, dtype=object), errors='coerce').astype(float)
+        seconds = np.round((numbers - _EXCEL_UNIX_EPOCH) * 86400, 3)
+        converted = pd.to_datetime(seconds, unit='s', errors='coerce')
+
+        results = converted.dt.strftime(self.output_format).to_numpy(dtype=object, copy=True)
+        for i in np.flatnonzero(converted.isna().to_numpy()):
+            results[i] = self.normalize_value(serials[i])
+        return results
@@ -1,11 +1,31 @@
 import re
 from datetime import datetime
+import numpy as np
 import pandas as pd
 from loguru import logger
 import os
 from typing import Dict, Any, Optional, List, Tuple
+from app_info import __version__
+from classes.date_normalizer import DateNormalizer
 from classes.excel_processor import ExcelProcessor
+from classes.file_manifest import FileManifest
+from classes.processor_registry import register_processor
 
+class ExtractionContext:
+    """
+    Per-file state of one extraction.
+
+    Attributes:
+        filename (str): Name of the file being extracted
+        extracted_data (Dict[str, list]): Output columns collected so far
+    """
+
+    def __init__(self, filename: str, columns: List[str]):
+        self.filename = filename
+        self.extracted_data = {col: [] for col in columns}
+
+
+@register_processor('extract', label='Extract')
 class ExcelDataExtractor:
     """
     A class for extracting and processing data from Excel files with different formats.
@@ -13,9 +33,10 @@ class ExcelDataExtractor:
     This class handles various Excel file formats and extracts relevant data into a
     standardized structure, supporting multiple document types and processing styles.
 
+    Instances hold no per-file state (see ExtractionContext), so one extractor
+    can serve any number of files, also from several threads at once.
+
     Attributes:
-        excel_processor (ExcelProcessor): Handler for Excel file operations
-        extracted_data (Dict): Dictionary containing the extracted and processed data
         columns (List[str]): List defining the order of columns in the output
     """
 
@@ -67,10 +88,89 @@ class ExcelDataExtractor:
         "Centre de cost"
     ]
 
-    def __init__(self):
-        """Initialize the ExcelDataExtractor with necessary components."""
-        self.excel_processor = ExcelProcessor()
-        self.extracted_data = self._initialize_data_structure()
+    # Source columns read by each input layout, in the order _process_row tries them
+    input_styles = {
+        "Style 1": {
+            "doc_num": "Numar Factura",
+            "date": "Data Document",
+            "price": "Valoare Achizitie",
+            "partner": "Nume",
+            "code": "CUI/CNP",
+            "tva_field": "TVA Achizitie"
+        },
+        "Style 2": {
+            "doc_num": "Numar Factura",
+            "date": "Data Factura",
+            "price": "ValoareAchizitie Fara TVA",
+            "partner": "Partener",
+            "code": "Cod Fiscal Partener",
+            "tva_field": "Cota TVA B"
+        },
+        "Style 3": {
+            "doc_num": "NIR",
+            "date": "Data NIR",
+            "price": "Valoare",
+            "partner": "Furnizor",
+            "code": "CUI",
+            "tva_field": "% TVA Ach"
+        }
+    }
+
+    # Columns that identify each input layout
+    style_markers = {
+        "Style 1": ("Data Document", "CUI/CNP"),
+        "Style 2": ("Data Factura", "Cod Fiscal Partener"),
+        "Style 3": ("NIR", "Furnizor")
+    }
+
+    # Inputs holding one layout's markers are routed here (see schema_sniffer)
+    schemas = [set(markers) for markers in style_markers.values()]
+
+    # Compact dtype mode (see compact_dtypes): partners of every input layout
+    # and the output columns taking a few distinct values are made categorical
+    category_columns = ["Nume", "Partener", "Furnizor", "Nume partener", "Cota TVA", "Moneda",
+                        "Denumire articol", "Optiune TVA"]
+    # Values are boxed per row like iterrows does, whatever their dtype
+    exact_columns = ()
+
+    # Backend used to read input workbooks (see ExcelReader.ENGINES)
+    reader_engine = "auto"
+
+    # Each input row yields its own output row
+    row_local = True
+
+    def __init__(self, columnar: bool = True):
+        """
+        Initialize the ExcelDataExtractor with necessary components.
+
+        Args:
+            columnar (bool): Build the output with column operations instead of
+                walking the rows one at a time
+        """
+        self.columnar = columnar
+        self.date_normalizer = DateNormalizer()
+
+    def column_filter(self) -> None:
+        """
+        Input columns to read; all of them.
+
+        Only a handful of columns are read, but the row-wise path boxes each
+        value in the dtype shared by the whole sheet (see _extract_columnar),
+        so dropping unused columns could change how numbers are rendered.
+
+        Returns:
+            None: Read every column
+        """
+        return None
+
+    def column_formats(self) -> None:
+        """
+        Excel number formats for the output columns; none, every value is text.
+
+        Returns:
+            None: Default formats
+        """
+        return None
 
     def _initialize_data_structure(self) -> Dict[str, list]:
         """
@@ -91,6 +191,9 @@ class ExcelDataExtractor:
         """
         os.makedirs(output_dir, exist_ok=True)
         logger.info(f"Processing files from {input_dir}")
+        # Files already restructured into output_dir and unchanged since are skipped
+        manifest = FileManifest(output_dir, f"{type(self).__name__} {__version__}")
+        excel_processor = ExcelProcessor()
 
         for file_name in os.listdir(input_dir):
             try:
@@ -98,14 +201,17 @@ class ExcelDataExtractor:
                     continue
 
                 input_path = os.path.join(input_dir, file_name)
-                df = self.excel_processor.load_excel(input_path)
+                if manifest.is_processed(input_path):
+                    logger.info(f"Skipping unchanged file {file_name}")
+                    continue
+                df = excel_processor.load_excel(input_path)
 
                 if df is not None:
                     # Add filename to DataFrame for reference
                     df.name = file_name
-                    self.filename = file_name
+                    context = ExtractionContext(file_name, self.columns)
                     doc_type = self._determine_document_type(file_name)
-                    data = self.extract_data(df, doc_type)
+                    data = self.extract_data(df, doc_type, context)
 
                     # Verify and normalize data
                     self._normalize_data_lengths(data)
@@ -115,11 +221,10 @@ class ExcelDataExtractor:
 
                     output_file = f"Restructured--{''.join(str(file_name).split('.')[:-1])}.xlsx"
                     output_path = os.path.join(output_dir, output_file)
-                    self.excel_processor.save_to_excel(output_df, output_path)
+                    excel_processor.save_to_excel(output_df, output_path)
+                    manifest.record(input_path, output_path)
                     logger.success(f"Successfully processed {file_name}")
 
-                self.extracted_data = self._initialize_data_structure()
-
             except Exception as e:
                 logger.error(f"Error processing {file_name}: {str(e)}")
                 continue
@@ -156,13 +261,16 @@ class ExcelDataExtractor:
 
         return "UNKNOWN"
 
-    def extract_data(self, df: pd.DataFrame, type: str) -> Dict[str, list]:
+    def extract_data(self, df: pd.DataFrame, type: str,
+                     context: Optional[ExtractionContext] = None) -> Dict[str, list]:
         """
         Extract data from DataFrame based on document type.
 
         Args:
             df (pd.DataFrame): Input DataFrame containing the data
             type (str): Document type identifier
+            context (Optional[ExtractionContext]): State of the file being extracted;
+                a new one for df.name by default
 
         Returns:
             Dict[str, list]: Processed data in standardized format
@@ -183,19 +291,249 @@ class ExcelDataExtractor:
             tipMarfa = "marfa"
         else:
             tipMarfa = type_mapping.get(type)
+        if context is None:
+            context = ExtractionContext(getattr(df, 'name', 'UNKNOWN'), self.columns)
         print(type)
         try:
-            for idx, row in df.iterrows():
-                self._process_row(row, tipMarfa, idx + 1)
+            if self.columnar:
+                logger.info(f"Detected input layout: {self._detect_style(df) or 'unknown'}")
+                try:
+                    self._extract_columnar(df, tipMarfa, context)
+                except Exception as e:
+                    logger.warning(f"Columnar extraction failed, falling back to row-wise: {e}")
+                    self._extract_rows(df, tipMarfa, context)
+            else:
+                self._extract_rows(df, tipMarfa, context)
 
-            self._normalize_data_lengths(self.extracted_data)
-            return self.extracted_data
+            self._normalize_data_lengths(context.extracted_data)
+            return context.extracted_data
 
         except Exception as e:
             logger.error(f"Error in extract_data: {e}")
             return self._initialize_data_structure()
 
-    def _process_row(self, row: pd.Series, tipMarfa: str, idx: int) -> None:
+    def _extract_rows(self, df: pd.DataFrame, tipMarfa: str, context: ExtractionContext) -> None:
+        """
+        Extract data one row at a time through the processing styles.
+
+        Args:
+            df (pd.DataFrame): Input DataFrame containing the data
+            tipMarfa (str): Type of merchandise
+            context (ExtractionContext): State of the file being extracted
+        """
+        for idx, row in df.iterrows():
+            self._process_row(row, tipMarfa, idx + 1, context)
+
+    def _detect_style(self, df: pd.DataFrame) -> Optional[str]:
+        """
+        Detect the input layout of a file from its column set.
+
+        Args:
+            df (pd.DataFrame): Input DataFrame
+
+        Returns:
+            Optional[str]: Name of the matching style, or None if no layout matches
+        """
+        columns = set(df.columns)
+        for style_name, markers in self.style_markers.items():
+            if all(marker in columns for marker in markers):
+                return style_name
+        return None
+
+    def _extract_columnar(self, df: pd.DataFrame, tipMarfa: str, context: ExtractionContext) -> None:
+        """
+        Extract data for the whole DataFrame with column operations.
+
+        Produces exactly what _extract_rows appends. _process_row only moves past
+        Style 1 when it raises, and Style 1 reads every field with a default, so
+        the row-wise chain settles on Style 1 whatever the detected layout is.
+        Values the row-wise path cannot handle (e.g. pd.NA) raise here as well,
+        letting the caller fall back to it.
+
+        Args:
+            df (pd.DataFrame): Input DataFrame containing the data
+            tipMarfa (str): Type of merchandise
+            context (ExtractionContext): State of the file being extracted
+        """
+        if df.empty:
+            return
+
+        fields = self.input_styles["Style 1"]
+        # iterrows hands row.get values boxed in the frame's interleaved dtype
+        row_dtype = df.iloc[:0].to_numpy().dtype
+        n = len(df)
+
+        doc_nums = self._or_default_strings(self._row_values(df, fields["doc_num"], "", row_dtype), "")
+        dates = self._date_strings(df, fields["date"], row_dtype)
+        prices = self._or_default_strings(self._row_values(df, fields["price"], 0, row_dtype), "0")
+        partners = self._or_default_strings(self._row_values(df, fields["partner"], "", row_dtype), "")
+        codes = self._row_values(df, fields["code"], "", row_dtype).map(str)
+        tva_values = self._row_values(df, fields["tva_field"], "0", row_dtype).map(str)
+
+        articles, options = self._tva_logic_columnar(codes, tva_values, df, tipMarfa, row_dtype, context)
+
+        columns = {
+            "Numar document": doc_nums,
+            "Data": dates,
+            "Data scadenta": dates,
+            "Pret de lista": prices,
+            "Nume partener": partners,
+            "Cod fiscal": self._map_distinct(codes, lambda code: code.replace("RO", "").replace("RO ", "")),
+            "Cota TVA": tva_values,
+            "Moneda": ["RON"] * n,
+            "Cantitate": ["1"] * n,
+            "Denumire articol": articles,
+            "Optiune TVA": options,
+            "NR.linie": [str(idx + 1) for idx in df.index]
+        }
+
+        for key, values in columns.items():
+            if key not in context.extracted_data:
+                context.extracted_data[key] = []
+            context.extracted_data[key].extend(list(values))
+
+    def _tva_logic_columnar(self, codes: pd.Series, tva_values: pd.Series, df: pd.DataFrame,
+                            tipMarfa: str, row_dtype: np.dtype,
+                            context: ExtractionContext) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Column-wise equivalent of _process_tva_logic.
+
+        Args:
+            codes (pd.Series): Fiscal codes as strings
+            tva_values (pd.Series): TVA field values as strings
+            df (pd.DataFrame): Input DataFrame
+            tipMarfa (str): Type of merchandise
+            row_dtype (np.dtype): Dtype iterrows boxes the row values in
+            context (ExtractionContext): State of the file being extracted
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: "Denumire articol" and "Optiune TVA" values
+        """
+        n = len(codes)
+        tva_ok, tva_num, tva_labels = self._parse_int_column(tva_values, tipMarfa)
+
+        procent_field = "Procent TVA" if "Procent TVA" in df.columns else "% TVA Ach"
+        procent_values = self._row_values(df, procent_field, "0", row_dtype).map(str)
+        procent_ok, _, procent_labels = self._parse_int_column(procent_values, tipMarfa)
+
+        is_zero = tva_ok & (tva_num == 0)
+        exempt = is_zero & ~codes.str.startswith("RO").to_numpy(dtype=bool)
+        failed = ~tva_ok | (exempt & ~procent_ok)
+
+        def full(value):
+            return np.full(n, value, dtype=object)
+
+        taxable_article = full(tipMarfa) if "AMT" in context.filename else tva_labels
+        articles = np.select([failed, exempt, is_zero],
+                             [full(f"{tipMarfa} 0%"), procent_labels, full("SGR")],
+                             default=taxable_article)
+        options = np.select([failed, exempt | is_zero],
+                            [full("TAXABILE"), full("SCUTITE")],
+                            default=full("TAXABILE"))
+
+        if failed.any():
+            logger.error(f"Error in _process_tva_logic: unparsable TVA value on {int(failed.sum())} rows")
+        return articles, options
+
+    @staticmethod
+    def _row_values(df: pd.DataFrame, column: str, default: Any, row_dtype: np.dtype) -> pd.Series:
+        """
+        Column values as object Series, boxed the way row.get returns them.
+
+        Args:
+            df (pd.DataFrame): Input DataFrame
+            column (str): Column to read
+            default (Any): Value used when the column is missing
+            row_dtype (np.dtype): Dtype iterrows boxes the row values in
+
+        Returns:
+            pd.Series: Object Series aligned to df.index
+        """
+        if column not in df.columns:
+            return pd.Series([default] * len(df), index=df.index, dtype=object)
+        return pd.Series(df[column].to_numpy(dtype=row_dtype), index=df.index).astype(object)
+
+    def _date_strings(self, df: pd.DataFrame, column: str, row_dtype: np.dtype) -> pd.Series:
+        """
+        Column-wise _convert_date(str(value)).
+
+        Datetime columns go through the shared DateNormalizer, which gives the
+        same YYYYMMDD text; anything else keeps the textual rule.
+
+        Args:
+            df (pd.DataFrame): Input DataFrame
+            column (str): Date column
+            row_dtype (np.dtype): Dtype iterrows boxes the row values in
+
+        Returns:
+            pd.Series: String Series
+        """
+        if column in df.columns and row_dtype == object and pd.api.types.is_datetime64_dtype(df[column].dtype):
+            return self.date_normalizer.normalize(df[column]).fillna(str(pd.NaT))
+
+        dates = self._row_values(df, column, "", row_dtype).map(str)
+        return dates.str.split(" ", n=1).str[0].str.replace("-", "", regex=False)
+
+    @staticmethod
+    def _or_default_strings(values: pd.Series, default: str) -> pd.Series:
+        """
+        Column-wise str(value or default).
+
+        Args:
+            values (pd.Series): Object Series of raw values
+            default (str): Replacement for falsy values
+
+        Returns:
+            pd.Series: String Series
+        """
+        truthy = values.map(bool).to_numpy(dtype=bool)
+        return values.map(str).where(truthy, default)
+
+    @staticmethod
+    def _map_distinct(text: pd.Series, func) -> np.ndarray:
+        """
+        Apply a string function once per distinct value of a string Series.
+
+        Args:
+            text (pd.Series): String Series
+            func (Callable[[str], str]): Function to apply
+
+        Returns:
+            np.ndarray: Object array of results aligned to text
+        """
+        codes, uniques = pd.factorize(text)
+        results = np.empty(len(uniques), dtype=object)
+        results[:] = [func(value) for value in uniques]
+        return results[codes]
+
+    @staticmethod
+    def _parse_int_column(text: pd.Series, tipMarfa: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Column-wise int(str(value).replace(",", ".") or "0"), parsed once per distinct value.
+
+        Args:
+            text (pd.Series): String Series
+            tipMarfa (str): Type of merchandise used for the article labels
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: Parse success mask, parsed
+            integers and "<tipMarfa> <value>%" labels
+        """
+        codes, uniques = pd.factorize(text)
+        parsed = []
+        for value in uniques:
+            try:
+                parsed.append(int(value.replace(",", ".") or "0"))
+            except ValueError:
+                parsed.append(None)
+
+        ok = np.array([value is not None for value in parsed], dtype=bool)
+        numbers = np.empty(len(parsed), dtype=object)
+        numbers[:] = parsed
+        labels = np.array([f"{tipMarfa} {value}%" for value in parsed], dtype=object)
+        return ok[codes], numbers[codes], labels[codes]
+
+    def _process_row(self, row: pd.Series, tipMarfa: str, idx: int, context: ExtractionContext) -> None:
         """
         Process a single row of data using multiple processing styles.
 
@@ -203,6 +541,7 @@ class ExcelDataExtractor:
             row (pd.Series): Row data to process
             tipMarfa (str): Type of merchandise
             idx (int): Row index
+            context (ExtractionContext): State of the file being extracted
         """
         success = False
         errors = []
@@ -216,8 +555,8 @@ class ExcelDataExtractor:
 
         for process_func, style_name in processing_styles:
             try:
-                process_func(row, tipMarfa)
-                self.extracted_data["NR.linie"].append(str(idx))
+                process_func(row, tipMarfa, context)
+                context.extracted_data["NR.linie"].append(str(idx))
                 success = True
                 # logger.debug(f"Successfully processed row {idx} using {style_name}")
                 break
@@ -226,102 +565,103 @@ class ExcelDataExtractor:
                 continue
 
         if not success:
-            self._add_default_row(tipMarfa, idx)
+            self._add_default_row(tipMarfa, idx, context)
             logger.warning(f"Using default values for row {idx}. Errors: {'; '.join(errors)}")
 
-    def _add_default_row(self, tipMarfa: str, idx: int) -> None:
+    def _add_default_row(self, tipMarfa: str, idx: int, context: ExtractionContext) -> None:
         """
         Add a row with default values when processing fails.
 
         Args:
             tipMarfa (str): Type of merchandise
             idx (int): Row index
+            context (ExtractionContext): State of the file being extracted
         """
         # Add default values for required fields
-        self.extracted_data["NR.linie"].append(str(idx))
-        self.extracted_data["Denumire articol"].append(f"{tipMarfa} 0%")
-        self.extracted_data["Optiune TVA"].append("TAXABILE")
+        context.extracted_data["NR.linie"].append(str(idx))
+        context.extracted_data["Denumire articol"].append(f"{tipMarfa} 0%")
+        context.extracted_data["Optiune TVA"].append("TAXABILE")
 
         # Ensure all columns have a value
         for col in self.columns:
             if col not in ["NR.linie", "Denumire articol", "Optiune TVA"]:
-                if col not in self.extracted_data:
-                    self.extracted_data[col] = []
-                if len(self.extracted_data[col]) < len(self.extracted_data["NR.linie"]):
-                    self.extracted_data[col].append(self._get_default_value(col))
+                if col not in context.extracted_data:
+                    context.extracted_data[col] = []
+                if len(context.extracted_data[col]) < len(context.extracted_data["NR.linie"]):
+                    context.extracted_data[col].append(self._get_default_value(col))
 
-    def _process_row_style1(self, row: pd.Series, tipMarfa: str) -> None:
+    def _process_row_style1(self, row: pd.Series, tipMarfa: str, context: ExtractionContext) -> None:
         """
         Process row using the first data style format.
 
         Args:
             row (pd.Series): Row data
             tipMarfa (str): Type of merchandise
+            context (ExtractionContext): State of the file being extracted
         """
         try:
-            self._fill_basic_data(
-                row.get("Numar Factura", ""),
-                str(row.get('Data Document', "")),
-                row.get('Valoare Achizitie', 0),
-                row.get('Nume', ""),
-                str(row.get('CUI/CNP', "")),
-                row,
-                tipMarfa,
-                'TVA Achizitie'
-            )
+            self._fill_style_data(row, tipMarfa, "Style 1", context)
         except Exception as e:
             logger.error(f"Error in process_row_style1: {str(e)}")
             raise
 
-    def _process_row_style2(self, row: pd.Series, tipMarfa: str) -> None:
+    def _process_row_style2(self, row: pd.Series, tipMarfa: str, context: ExtractionContext) -> None:
         """
         Process row using the second data style format.
 
         Args:
             row (pd.Series): Row data
             tipMarfa (str): Type of merchandise
+            context (ExtractionContext): State of the file being extracted
         """
         try:
-            self._fill_basic_data(
-                row.get("Numar Factura", ""),
-                str(row.get('Data Factura', "")),
-                row.get('ValoareAchizitie Fara TVA', 0),
-                row.get('Partener', ""),
-                str(row.get('Cod Fiscal Partener', "")),
-                row,
-                tipMarfa,
-                'Cota TVA B'
-            )
+            self._fill_style_data(row, tipMarfa, "Style 2", context)
         except Exception as e:
             logger.error(f"Error in process_row_style2: {str(e)}")
             raise
 
-    def _process_row_style3(self, row: pd.Series, tipMarfa: str) -> None:
+    def _process_row_style3(self, row: pd.Series, tipMarfa: str, context: ExtractionContext) -> None:
         """
         Process row using the NIR data style format.
 
         Args:
             row (pd.Series): Row data
             tipMarfa (str): Type of merchandise
+            context (ExtractionContext): State of the file being extracted
         """
         try:
-            self._fill_basic_data(
-                row.get("NIR", ""),
-                str(row.get('Data NIR', "")),
-                row.get('Valoare', 0),
-                row.get('Furnizor', ""),
-                str(row.get('CUI', "")),
-                row,
-                tipMarfa,
-                '% TVA Ach'
-            )
+            self._fill_style_data(row, tipMarfa, "Style 3", context)
         except Exception as e:
             logger.error(f"Error in process_row_style3: {str(e)}")
             raise
 
+    def _fill_style_data(self, row: pd.Series, tipMarfa: str, style_name: str,
+                         context: ExtractionContext) -> None:
+        """
+        Fill basic data fields from the source columns of an input style.
+
+        Args:
+            row (pd.Series): Row data
+            tipMarfa (str): Type of merchandise
+            style_name (str): Key into input_styles
+            context (ExtractionContext): State of the file being extracted
+        """
+        fields = self.input_styles[style_name]
+        self._fill_basic_data(
+            row.get(fields["doc_num"], ""),
+            str(row.get(fields["date"], "")),
+            row.get(fields["price"], 0),
+            row.get(fields["partner"], ""),
+            str(row.get(fields["code"], "")),
+            row,
+            tipMarfa,
+            fields["tva_field"],
+            context
+        )
+
     def _fill_basic_data(self, doc_num: str, date: str, price: float,
                         partner: str, code: str, row: pd.Series,
-                        tipMarfa: str, tva_field: str) -> None:
+                        tipMarfa: str, tva_field: str, context: ExtractionContext) -> None:
         """
         Fill basic data fields with provided values.
 
@@ -334,6 +674,7 @@ class ExcelDataExtractor:
             row (pd.Series): Complete row data
             tipMarfa (str): Type of merchandise
             tva_field (str): TVA field identifier
+            context (ExtractionContext): State of the file being extracted
         """
         data = self._convert_date(date)
         code = str(code) if code else ""
@@ -351,11 +692,11 @@ class ExcelDataExtractor:
         }
 
         for key, value in base_data.items():
-            if key not in self.extracted_data:
-                self.extracted_data[key] = []
-            self.extracted_data[key].append(value)
+            if key not in context.extracted_data:
+                context.extracted_data[key] = []
+            context.extracted_data[key].append(value)
 
-        self._process_tva_logic(code, row, tipMarfa, tva_field)
+        self._process_tva_logic(code, row, tipMarfa, tva_field, context)
 
     def _convert_date(self, date_value: Any) -> str:
         if date_value is None:
@@ -369,7 +710,7 @@ class ExcelDataExtractor:
 
 
     def _process_tva_logic(self, code: str, row: pd.Series,
-                          tipMarfa: str, tva_field: str) -> None:
+                          tipMarfa: str, tva_field: str, context: ExtractionContext) -> None:
         """
         Process TVA logic and fill related fields.
 
@@ -378,6 +719,7 @@ class ExcelDataExtractor:
             row (pd.Series): Row data
             tipMarfa (str): Type of merchandise
             tva_field (str): TVA field identifier
+            context (ExtractionContext): State of the file being extracted
         """
         try:
             tva_value = int(str(row.get(tva_field, "0")).replace(",", ".") or "0")
@@ -389,29 +731,29 @@ class ExcelDataExtractor:
                 article = "SGR"
                 tva_option = "SCUTITE"
             else:
-                if "AMT" in self.filename:
+                if "AMT" in context.filename:
                     article = f"{tipMarfa}"
                     tva_option = "TAXABILE"
                 else:
                     article = f"{tipMarfa} {tva_value}%"
                     tva_option = "TAXABILE"
 
-            if "Denumire articol" not in self.extracted_data:
-                self.extracted_data["Denumire articol"] = []
-            self.extracted_data["Denumire articol"].append(article)
+            if "Denumire articol" not in context.extracted_data:
+                context.extracted_data["Denumire articol"] = []
+            context.extracted_data["Denumire articol"].append(article)
 
-            if "Optiune TVA" not in self.extracted_data:
-                self.extracted_data["Optiune TVA"] = []
-            self.extracted_data["Optiune TVA"].append(tva_option)
+            if "Optiune TVA" not in context.extracted_data:
+                context.extracted_data["Optiune TVA"] = []
+            context.extracted_data["Optiune TVA"].append(tva_option)
         except Exception as e:
             logger.error(f"Error in _process_tva_logic: {e}")
-            if "Denumire articol" not in self.extracted_data:
-                self.extracted_data["Denumire articol"] = []
-            self.extracted_data["Denumire articol"].append(f"{tipMarfa} 0%")
+            if "Denumire articol" not in context.extracted_data:
+                context.extracted_data["Denumire articol"] = []
+            context.extracted_data["Denumire articol"].append(f"{tipMarfa} 0%")
 
-            if "Optiune TVA" not in self.extracted_data:
-                self.extracted_data["Optiune TVA"] = []
-            self.extracted_data["Optiune TVA"].append("TAXABILE")
+            if "Optiune TVA" not in context.extracted_data:
+                context.extracted_data["Optiune TVA"] = []
+            context.extracted_data["Optiune TVA"].append("TAXABILE")
 
     def _get_default_value(self, column_name: str) -> Any:
         """
@@ -463,11 +805,11 @@ class ExcelDataExtractor:
     def process_dataframe(self, df):
         """Process the DataFrame and return the modified DataFrame"""
         print("Processing DataFrame with ExcelDataExtractor")
-        # Set the filename attribute for use in other methods
-        self.filename = getattr(df, 'name', 'UNKNOWN')
+        # Each call returns the rows of its own DataFrame only
+        context = ExtractionContext(getattr(df, 'name', 'UNKNOWN'), self.columns)
         # Use the document type detection logic if possible, else default to UNKNOWN
-        doc_type = self._determine_document_type(self.filename)
-        data = self.extract_data(df, doc_type)
+        doc_type = self._determine_document_type(context.filename)
+        data = self.extract_data(df, doc_type, context)
         self._normalize_data_lengths(data)
         # Ensure all columns are present, even if empty
         output_df = pd.DataFrame(data, columns=self.columns)
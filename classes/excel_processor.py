@@ -1,22 +1,58 @@
+import os
 import pandas as pd
 import re
-import xlwings as xw
-from datetime import datetime
+import sys
 from pathlib import Path
 from rich import print
 from loguru import logger
 
+from app_info import __version__
+from classes.date_normalizer import DateNormalizer
+from classes.excel_reader import ExcelReader
+from classes.excel_writer import ExcelWriter
+from classes.file_manifest import FileManifest
+
 
 class ExcelProcessor:
     """Base class for Excel file processing with common functionality"""
 
-    def __init__(self, input_folder="in", output_folder="out"):
+    # Backend used to read input workbooks (see ExcelReader.ENGINES)
+    reader_engine = "auto"
+
+    # Whether process_dataframe handles each row on its own, so a sheet can be
+    # processed in chunks with the same result (see upload_pipeline)
+    row_local = False
+
+    # Column sets an input must hold one of to be routed here (see schema_sniffer);
+    # none means the process type is only used when picked explicitly
+    schemas = ()
+
+    # Compact dtype mode (see compact_dtypes): columns always made categorical,
+    # in the input or the result, and input columns kept as parsed
+    category_columns = ()
+    exact_columns = ()
+
+    # Backends for the folder batch modes: xlwings drives Excel over COM,
+    # openpyxl edits the workbooks headless. auto picks xlwings on Windows only.
+    BATCH_ENGINES = ("auto", "xlwings", "openpyxl")
+
+    def __init__(self, input_folder="in", output_folder="out", batch_engine="auto"):
+        if batch_engine not in self.BATCH_ENGINES:
+            raise ValueError(f"Unknown batch engine '{batch_engine}', expected one of {self.BATCH_ENGINES}")
         self.input_folder = input_folder
         self.output_folder = output_folder
+        self.batch_engine = batch_engine
+        self.manifest = None
         self.app = None
         self.wb = None
         self.ws = None
 
+    def resolve_batch_engine(self):
+        """Return the concrete engine 'auto' stands for"""
+        if self.batch_engine != "auto":
+            return self.batch_engine
+        return "xlwings" if sys.platform == "win32" else "openpyxl"
+
     def initialize_excel(self):
         try:
             print("Attempting to launch Excel via COM...")
@@ -62,17 +98,20 @@ class ExcelProcessor:
             if self.wb:
                 self.wb.close()
 
+    def column_filter(self):
+        """Return a predicate selecting the input columns this processor uses, or None for all"""
+        return None
+
+    def column_formats(self):
+        """Return Excel number formats for output columns ({name: format}), or None"""
+        return None
+
     def load_excel(self, file_path):
         try:
-            df = pd.read_excel(file_path)
-            return df
+            return ExcelReader(self.reader_engine).read(file_path, usecols=self.column_filter())
         except Exception as e:
-            try:
-                df = pd.read_excel(file_path, engine='openpyxl')
-                return df
-            except Exception as e:
-                logger.error(f"Error loading Excel file {file_path}: {str(e)}")
-                return None
+            logger.error(f"Error loading Excel file {file_path}: {str(e)}")
+            return None
 
     def extract_type(self, file_name : str):
         pattern = r"_(AMTA|AMTR|AMTD|FF|M[4-6])_"
@@ -89,16 +128,7 @@ class ExcelProcessor:
 
     def save_to_excel(self, df: pd.DataFrame, output_path: str):
         try:
-            # Use pandas to save the DataFrame
-            with pd.ExcelWriter(output_path, engine='xlsxwriter') as writer:
-                df.to_excel(writer, index=False, sheet_name='Sheet1')
-                workbook = writer.book
-                worksheet = writer.sheets['Sheet1']
-
-                for i, col in enumerate(df.columns):
-                    column_width = max(df[col].astype(str).map(len).max(), len(col))
-                    worksheet.set_column(i, i, column_width + 2)
-
+            ExcelWriter.write_frame(df, output_path, column_formats=self.column_formats())
             logger.success(f"Successfully saved Excel file to {output_path}")
 
         except Exception as e:
@@ -113,15 +143,13 @@ class ExcelProcessor:
 
             date_range = self.ws.range(f"{column_letter}{start_row}:{column_letter}{last_row}")
 
-            for cell in date_range:
-                if cell.value is not None:
-                    try:
-                        formatted_date = self.format_date(cell.value)
-                        cell.clear_contents()
-                        cell.number_format = 'General'
-                        cell.value = formatted_date
-                    except Exception as e:
-                        print(f"[red]Failed to format value '{cell.value}' at {cell.address}: {e}[/red]")
+            # One read and one write for the whole column instead of a COM call per cell
+            values = pd.Series(date_range.options(ndim=1).value, dtype=object)
+            formatted = DateNormalizer().normalize(values)
+            filled = values.notna().to_numpy()
+
+            date_range.number_format = 'General'
+            date_range.value = [[value if is_filled else None] for value, is_filled in zip(formatted, filled)]
 
             print(f"[green]Date formatting completed for column {column_letter}[/green]")
             return last_row
@@ -130,50 +158,10 @@ class ExcelProcessor:
             print(f"[red]Error formatting dates: {str(e)}[/red]")
             return None
 
-
-
     @staticmethod
     def format_date(date_value):
         """Convert date to YYYYMMDD format"""
-        if date_value is None:
-            return None
-
-        try:
-            if isinstance(date_value, datetime):
-                return date_value.strftime('%Y%m%d')
-
-            if isinstance(date_value, str):
-                date_value = date_value.strip()
-                formats_to_try = [
-                    '%d/%m/%Y',    # DD/MM/YYYY
-                    '%d-%m-%Y',    # DD-MM-YYYY
-                    '%Y-%m-%d',    # YYYY-MM-DD
-                    '%d.%m.%Y',    # DD.MM.YYYY
-                    '%Y/%m/%d',    # YYYY/MM/DD
-                    '%m/%d/%Y',    # MM/DD/YYYY
-                    '%d-%b-%Y',    # DD-MMM-YYYY (14-Feb-2024)
-                    '%d-%B-%Y',    # DD-MMMM-YYYY
-                    '%d %b %Y',    # DD MMM YYYY
-                    '%d %B %Y'     # DD MMMM YYYY
-                ]
-
-                for date_format in formats_to_try:
-                    try:
-                        return datetime.strptime(date_value, date_format).strftime('%Y%m%d')
-                    except ValueError:
-                        continue
-
-            if isinstance(date_value, (int, float)):
-                try:
-                    return xw.utils.datetime_from_excel_date(date_value).strftime('%Y%m%d')
-                except:
-                    return date_value
-
-            return date_value
-
-        except Exception as e:
-            print(f"[red]Error formatting date {date_value}: {str(e)}[/red]")
-            return date_value
+        return DateNormalizer().normalize_value(date_value)
 
     def sort_column(self, column_letter, start_row, has_header=True):
         """Sort column alphabetically"""
@@ -199,7 +187,23 @@ class ExcelProcessor:
             print(f"[red]Error sorting column: {str(e)}[/red]")
             return None
 
-    def get_last_row(self, column_letter, start_row, max_rows=10000):
+    def get_last_row(self, column_letter, start_row, max_rows=10000, bulk=True):
+        """Last row before the first empty cell of a column, looking at most max_rows down.
+
+        bulk reads the column once (bounded by the used range) instead of
+        probing it cell by cell.
+        """
+        if bulk:
+            end_row = min(self.ws.used_range.last_cell.row, start_row + max_rows - 1)
+            if end_row < start_row:
+                return start_row - 1
+            values = self.ws.range(f"{column_letter}{start_row}:{column_letter}{end_row}").options(ndim=1).value
+            for offset, value in enumerate(values):
+                if value is None:
+                    return start_row + offset - 1
+            # Cells below the used range are empty
+            return end_row
+
         row = start_row
         while row < start_row + max_rows:
             if self.ws.range(f"{column_letter}{row}").value is None:
@@ -213,10 +217,11 @@ class ExcelProcessor:
         for file_name, df in processed_files.items():
             output_path = os.path.join(self.output_folder, f"Processed--{file_name}")
             self.save_to_excel(df, output_path)
+            self.mark_file_processed(os.path.join(self.input_folder, file_name), output_path)
             print(f"Saved processed file: {output_path}")
 
     def process_files(self):
-        """Main method to process all files, including old files"""
+        """Main method to process all new or modified files in the input folder"""
         self.create_folders()
         processed_files = {}
 
@@ -235,12 +240,29 @@ class ExcelProcessor:
                     df = self.process_dataframe(df)
                     if df is not None:
                         processed_files[file] = df
+                else:
+                    print(f"Skipping unchanged file: {file}")
 
         # Save all processed files
         self.save_all_processed_files(processed_files)
 
+    def get_manifest(self):
+        """Manifest of the files already processed into the output folder"""
+        if self.manifest is None:
+            self.manifest = FileManifest(self.output_folder, f"{type(self).__name__} {__version__}")
+        return self.manifest
+
     def is_file_processed(self, file_path):
-        """Check if a file has been processed based on its modification date"""
-        # Implement logic to check if the file has been processed
-        # For example, compare the modification date with a stored date
-        return False  # Placeholder logic
+        """Check if a file was processed before and is unchanged since (see FileManifest)"""
+        try:
+            return self.get_manifest().is_processed(file_path)
+        except Exception as e:
+            logger.warning(f"Could not check manifest for {file_path}: {str(e)}")
+            return False
+
+    def mark_file_processed(self, file_path, output_path):
+        """Record a processed file so later runs skip it while it is unchanged"""
+        try:
+            self.get_manifest().record(file_path, output_path)
+        except Exception as e:
+            logger.warning(f"Could not update manifest for {file_path}: {str(e)}")
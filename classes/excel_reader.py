@@ -0,0 +1,399 @@
+import importlib.util
+import pickle
+import tempfile
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+# The parser pd.read_excel hands the cell rows to. The stream and chunked
+# readers reproduce its inference on top of it; tests/test_excel_reader.py
+# checks them against pd.read_excel, to catch a pandas upgrade changing either.
+from pandas.io.parsers import TextParser
+
+# Column selector accepted by the readers: a predicate over header names
+ColumnFilter = Optional[Callable[[object], bool]]
+
+# Strings pandas reads as missing by default: the na_values list documented
+# for read_excel and read_csv. pandas only exposes the set privately
+# (pandas._libs.parsers.STR_NA_VALUES), so it is copied here.
+NA_STRINGS = frozenset({
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+})
+
+
+class ExcelReader:
+    """Reads the first sheet of a workbook into a DataFrame through a selectable backend.
+
+    Engines:
+        auto: calamine when python-calamine is installed, otherwise openpyxl-stream
+        calamine: pandas' Rust-based calamine reader
+        openpyxl-stream: read-only openpyxl pass over cell values that skips
+            pruned columns before pandas sees them
+        openpyxl: pandas' own openpyxl reader
+    """
+
+    ENGINES = ("auto", "calamine", "openpyxl-stream", "openpyxl")
+
+    # Rows per frame yielded by read_chunks
+    CHUNK_ROWS = 10000
+    # Chunk dtypes a column still parses as numbers from as a whole
+    NUMERIC_KINDS = {"bool", "int64", "uint64", "float64"}
+
+    def __init__(self, engine: str = "auto"):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown reader engine '{engine}', expected one of {self.ENGINES}")
+        self.engine = engine
+
+    @staticmethod
+    def calamine_available() -> bool:
+        """Whether the calamine backend can be used"""
+        return importlib.util.find_spec("python_calamine") is not None
+
+    def resolve_engine(self) -> str:
+        """Return the concrete engine 'auto' stands for"""
+        if self.engine != "auto":
+            return self.engine
+        return "calamine" if self.calamine_available() else "openpyxl-stream"
+
+    def read(self, source, usecols: ColumnFilter = None) -> pd.DataFrame:
+        """Read the first sheet of source (path or binary file object).
+
+        usecols is a predicate over header names; columns it rejects are not
+        loaded. Missing columns are ignored rather than raising.
+        """
+        engine = self.resolve_engine()
+        logger.debug(f"Reading workbook with the {engine} engine")
+        if engine == "openpyxl-stream":
+            return self._read_openpyxl_stream(source, usecols)
+        return pd.read_excel(source, engine=engine, usecols=usecols)
+
+    def _read_openpyxl_stream(self, source, usecols: ColumnFilter) -> pd.DataFrame:
+        """Read with openpyxl in read-only mode, producing what pd.read_excel would"""
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+        try:
+            sheet = workbook.worksheets[0]
+            sheet.reset_dimensions()
+            rows = sheet.iter_rows(values_only=True)
+
+            header = self._convert_row(next(rows, ()))
+            names = self._header_names(header)
+            header_width = len(header)
+
+            # Columns inside the header that survive pruning; cells past the
+            # header width are unnamed columns and are always carried along
+            keep = None
+            if usecols is not None:
+                keep = [i for i, name in enumerate(names) if usecols(name)]
+                if len(keep) == header_width:
+                    keep = None
+
+            data = []
+            last_row_with_data = -1
+            for row in rows:
+                if keep is None:
+                    converted_row = self._convert_row(row)
+                    has_data = bool(converted_row)
+                else:
+                    # A row counts as data even if only pruned cells are filled
+                    has_data = any(value is not None and value != "" for value in row)
+                    converted_row = self._convert_row(
+                        [row[i] if i < len(row) else None for i in keep] + list(row[header_width:])
+                    )
+                if has_data:
+                    last_row_with_data = len(data)
+                data.append(converted_row)
+        finally:
+            workbook.close()
+
+        # Trim trailing empty rows
+        data = data[: last_row_with_data + 1]
+        if not data and not header:
+            return pd.DataFrame()
+
+        if keep is None:
+            # Same layout pd.read_excel hands to its parser
+            data.insert(0, header)
+            max_width = max(len(data_row) for data_row in data)
+            data = [data_row + [""] * (max_width - len(data_row)) for data_row in data]
+            df = TextParser(data, header=0, skip_blank_lines=False).read()
+        else:
+            kept_width = len(keep)
+            extra = max([len(data_row) - kept_width for data_row in data] + [0])
+            column_names = [names[i] for i in keep] + [f"Unnamed: {header_width + j}" for j in range(extra)]
+            width = len(column_names)
+            if not width:
+                return self._no_columns()
+            data = [data_row + [""] * (width - len(data_row)) for data_row in data]
+            df = TextParser(data, names=column_names, header=None, skip_blank_lines=False).read()
+
+        if usecols is not None:
+            df = df.loc[:, [bool(usecols(name)) for name in df.columns]]
+        if df.columns.empty:
+            # pd.read_excel drops the row index along with the last column
+            return self._no_columns() if usecols is not None else pd.DataFrame()
+        return df
+
+    def read_chunks(self, source, chunk_rows: int = CHUNK_ROWS, usecols: ColumnFilter = None) -> Iterator[pd.DataFrame]:
+        """Read the first sheet of source in frames of at most chunk_rows rows.
+
+        Memory stays bounded by the chunk size whatever the sheet size: rows are
+        read with openpyxl in read-only mode (whatever the engine) and spilled to
+        a temporary file while the dtype pd.read_excel would give each column
+        of the whole sheet is worked out; every chunk is then parsed and cast to
+        those dtypes. The index runs on across chunks. A sheet without data rows
+        yields one empty frame.
+        """
+        with tempfile.TemporaryFile() as spill:
+            header, width, chunk_count, raw_kinds, canonical_kinds, first_seen = self._spill_rows(
+                source, spill, chunk_rows
+            )
+            if not header and not chunk_count:
+                return
+
+            names = self._header_names(header + [""] * (width - len(header)))
+            keep = [bool(usecols(name)) for name in names] if usecols is not None else None
+            if keep is not None and not any(keep):
+                # pd.read_excel drops the row index along with the last column
+                yield self._no_columns()
+                return
+
+            if not chunk_count:
+                df = TextParser([header + [""] * (width - len(header))], header=0, skip_blank_lines=False).read()
+                yield df.loc[:, keep] if keep is not None else df
+                return
+
+            dtypes = {}
+            canonical_columns = set()
+            for i, kinds in raw_kinds.items():
+                if kinds - {"missing"} <= self.NUMERIC_KINDS:
+                    dtypes[i] = self._combined_dtype(kinds)
+                else:
+                    # Not numeric as a whole: pandas canonicalizes the cells before trying booleans
+                    dtypes[i] = self._combined_dtype(canonical_kinds[i])
+                    canonical_columns.add(i)
+
+            spill.seek(0)
+            offset = 0
+            for _ in range(chunk_count):
+                rows = self._canonical_rows(pickle.load(spill), first_seen, canonical_columns)
+                df = self._parse_chunk(rows, names, width, dtypes)
+                df.index = pd.RangeIndex(offset, offset + len(df))
+                offset += len(df)
+                yield df.loc[:, keep] if keep is not None else df
+
+    def _spill_rows(self, source, spill, chunk_rows: int):
+        """First pass of read_chunks: pickle the converted rows to spill chunk by chunk.
+
+        Returns the header, the sheet width, the number of chunks, per column
+        position the dtypes the chunks parsed to as read and once canonicalized
+        (see _chunk_kinds and _canonical_rows), and the canonical values.
+        Trailing empty rows are dropped, as pd.read_excel does.
+        """
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+        try:
+            sheet = workbook.worksheets[0]
+            sheet.reset_dimensions()
+            rows = sheet.iter_rows(values_only=True)
+
+            header = self._convert_row(next(rows, ()))
+            width = len(header)
+            raw_kinds: Dict[int, set] = {}
+            canonical_kinds: Dict[int, set] = {}
+            first_seen: Dict[tuple, object] = {}
+            chunk_count = 0
+            narrowest_chunk = float("inf")
+            buffer = []
+            pending_empty = 0
+
+            def flush():
+                nonlocal chunk_count, narrowest_chunk
+                chunk_kinds = self._chunk_kinds(buffer)
+                canonical = self._canonical_rows(buffer, first_seen)
+                if canonical is not buffer:
+                    chunk_canonical_kinds = self._chunk_kinds(canonical)
+                else:
+                    chunk_canonical_kinds = chunk_kinds
+                for column_kinds, kinds_by_column in ((raw_kinds, chunk_kinds), (canonical_kinds, chunk_canonical_kinds)):
+                    for i, kinds in kinds_by_column.items():
+                        column_kinds.setdefault(i, set()).update(kinds)
+                narrowest_chunk = min(narrowest_chunk, len(chunk_kinds))
+                pickle.dump(buffer, spill, protocol=pickle.HIGHEST_PROTOCOL)
+                chunk_count += 1
+                buffer.clear()
+
+            for row in rows:
+                converted_row = self._convert_row(row)
+                if not converted_row:
+                    # Only kept if a row with data follows
+                    pending_empty += 1
+                    continue
+                for i, value in enumerate(converted_row):
+                    if type(value) in (bool, int) and value in (0, 1):
+                        first_seen.setdefault((i, value == 1), value)
+                width = max(width, len(converted_row))
+                for empty_row in [[]] * pending_empty + [converted_row]:
+                    buffer.append(empty_row)
+                    if len(buffer) == chunk_rows:
+                        flush()
+                pending_empty = 0
+            if buffer:
+                flush()
+        finally:
+            workbook.close()
+
+        # Columns past the width of a chunk are empty in it
+        for i in range(width):
+            if i >= narrowest_chunk:
+                for column_kinds in (raw_kinds, canonical_kinds):
+                    column_kinds.setdefault(i, set()).add("missing")
+        return header, width, chunk_count, raw_kinds, canonical_kinds, first_seen
+
+    @staticmethod
+    def _canonical_rows(rows: List[List], first_seen: Dict[tuple, object], columns=None) -> List[List]:
+        """rows with every 0/False and 1/True cell replaced by the first of them seen in its column.
+
+        When numbers fail to parse, pandas hands each cell equal to an earlier
+        one of its column that earlier value (so 1 after True becomes True)
+        before trying booleans. Only 0 and 1 can be equal across cell types,
+        since integral floats are read as ints. columns limits the columns
+        replaced; rows is returned as is when nothing changes.
+        """
+        canonical = None
+        for j, row in enumerate(rows):
+            for i, value in enumerate(row):
+                if type(value) not in (bool, int) or value not in (0, 1):
+                    continue
+                if columns is not None and i not in columns:
+                    continue
+                first = first_seen[(i, value == 1)]
+                if type(first) is not type(value):
+                    if canonical is None:
+                        canonical = [list(r) for r in rows]
+                    canonical[j][i] = first
+        return rows if canonical is None else canonical
+
+    @staticmethod
+    def _chunk_kinds(rows: List[List]) -> Dict[int, set]:
+        """The dtype each column of a chunk parses to on its own, by column position"""
+        width = max(len(row) for row in rows)
+        if not width:
+            return {}
+        data = [row + [""] * (width - len(row)) for row in rows]
+        df = TextParser(data, names=list(range(width)), header=None, skip_blank_lines=False).read()
+        column_kinds = {}
+        for i in range(width):
+            column = df[i]
+            kinds = column_kinds[i] = set()
+            if column.isna().all():
+                kinds.add("missing")
+                continue
+            kind = column.dtype.name
+            raw = [row[i] for row in rows if i < len(row)]
+            if kind == "float64" and column.hasnans and all(
+                    isinstance(value, bool) for value in raw
+                    if not (isinstance(value, str) and value in NA_STRINGS or pd.isna(value))):
+                # Real booleans next to empty cells parse as 1.0/0.0
+                kind = "bool"
+                kinds.add("missing")
+            elif kind == "bool" and any(isinstance(value, str) for value in raw):
+                # 'True'/'False' text parses to bool, but does not mix with numbers like real booleans
+                kind = "bool-text"
+            elif kind == "object" and all(isinstance(value, bool) for value in column.dropna()):
+                # The same text next to empty cells
+                kind = "bool-text"
+                kinds.add("missing")
+            kinds.add(kind)
+        return column_kinds
+
+    @staticmethod
+    def _combined_dtype(kinds: set) -> str:
+        """The dtype pandas infers for a whole column from the dtypes its chunks parse to.
+
+        'missing' marks chunks where the column is empty. Numbers (and real
+        booleans) merge numerically, datetimes only with empty cells, and any
+        other mix leaves the cell values as objects. 'object-bool' is an object
+        column of converted 'True'/'False' text and empty cells.
+        """
+        present = kinds - {"missing"}
+        missing = "missing" in kinds
+        if not present:
+            return "float64"
+        if present == {"bool"}:
+            return "float64" if missing else "bool"
+        if present <= {"bool", "bool-text"}:
+            return "object-bool" if missing else "bool"
+        if present <= {"bool", "int64", "float64"}:
+            return "float64" if missing or "float64" in present else "int64"
+        if present <= {"bool", "uint64", "float64"}:
+            return "float64" if missing or "float64" in present else "uint64"
+        if len(present) == 1:
+            (kind,) = present
+            if kind.startswith(("datetime64", "timedelta64")):
+                return kind
+        return "object"
+
+    @staticmethod
+    def _parse_chunk(rows: List[List], names: List, width: int, dtypes: Dict[int, str]) -> pd.DataFrame:
+        """Parse spilled rows and cast each column to the dtype of the whole sheet"""
+        data = [row + [""] * (width - len(row)) for row in rows]
+        df = TextParser(data, names=names, header=None, skip_blank_lines=False).read()
+        for i, dtype in dtypes.items():
+            column = df.iloc[:, i]
+            if dtype == "object":
+                # The column does not parse as a whole: cell values, with NA text as NaN
+                values = np.empty(len(data), dtype=object)
+                for j, row in enumerate(data):
+                    value = row[i]
+                    values[j] = np.nan if isinstance(value, str) and value in NA_STRINGS else value
+                df.isetitem(i, pd.Series(values, index=df.index, dtype=object))
+            elif column.dtype.name == dtype:
+                continue
+            elif dtype == "object-bool":
+                # Real booleans may have parsed as 1.0/0.0 in this chunk
+                values = column.to_numpy(dtype=object, copy=True)
+                for j, row in enumerate(data):
+                    if isinstance(row[i], bool):
+                        values[j] = row[i]
+                df.isetitem(i, pd.Series(values, index=df.index, dtype=object))
+            else:
+                df.isetitem(i, column.astype(dtype))
+        return df
+
+    @staticmethod
+    def _no_columns() -> pd.DataFrame:
+        """What pd.read_excel returns when usecols rejects every column"""
+        return pd.DataFrame(columns=pd.Index([], dtype=object))
+
+    @staticmethod
+    def _header_names(header: List) -> List:
+        """Column names pandas derives from a header row ('Unnamed: N', deduplication)"""
+        if not header:
+            return []
+        return list(TextParser([list(header)], header=0, skip_blank_lines=False).read().columns)
+
+    @staticmethod
+    def _convert_row(values) -> List:
+        """Convert cell values the way pandas' openpyxl reader does and trim trailing blanks"""
+        from openpyxl.cell.cell import ERROR_CODES
+
+        converted = []
+        for value in values:
+            if value is None:
+                converted.append("")
+            elif isinstance(value, float):
+                as_int = int(value)
+                converted.append(as_int if as_int == value else value)
+            elif isinstance(value, str) and value in ERROR_CODES:
+                converted.append(np.nan)
+            else:
+                converted.append(value)
+
+        while converted and converted[-1] == "":
+            converted.pop()
+        return converted
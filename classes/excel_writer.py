@@ -0,0 +1,119 @@
+import datetime
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class ExcelWriter:
+    """Writes DataFrames to a single-sheet xlsx using xlsxwriter's constant-memory mode.
+
+    Rows are streamed to disk as they are written, so memory stays flat however
+    many rows go in. Frames can be appended in several calls; the header and
+    column layout come from the first one.
+    """
+
+    # Rows sampled to size the columns
+    WIDTH_SAMPLE_ROWS = 1000
+    # Rows converted to Python values at a time
+    CHUNK_ROWS = 10000
+    # Excel's maximum column width
+    MAX_WIDTH = 255
+
+    DATETIME_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+    DATE_FORMAT = 'yyyy-mm-dd'
+
+    def __init__(self, target, sheet_name: str = 'Sheet1', column_formats: Optional[Dict[str, str]] = None):
+        """target is a path or a writable binary file object.
+
+        column_formats maps column names to Excel number formats, e.g.
+        {'Valoare Achizitie': '#,##0.00'}.
+        """
+        import xlsxwriter
+
+        self.workbook = xlsxwriter.Workbook(target, {'constant_memory': True})
+        self.worksheet = self.workbook.add_worksheet(sheet_name)
+        self.column_formats = column_formats or {}
+        self.header_format = self.workbook.add_format(
+            {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+        )
+        self.datetime_format = self.workbook.add_format({'num_format': self.DATETIME_FORMAT})
+        self.date_format = self.workbook.add_format({'num_format': self.DATE_FORMAT})
+        self.columns = None
+        self.cell_formats = []
+        self.next_row = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @classmethod
+    def write_frame(cls, df: pd.DataFrame, target, **kwargs):
+        """Write a whole DataFrame to target"""
+        with cls(target, **kwargs) as writer:
+            writer.append(df)
+
+    def append(self, df: pd.DataFrame):
+        """Append the rows of df, writing the header and column layout on the first call"""
+        if self.columns is None:
+            self._write_header(df)
+
+        for start in range(0, len(df), self.CHUNK_ROWS):
+            chunk = df.iloc[start:start + self.CHUNK_ROWS]
+            for row in self._to_python_rows(chunk):
+                self._write_row(row)
+
+    def close(self):
+        if self.columns is None:
+            # Nothing appended; still produce a valid, empty sheet
+            self.columns = []
+        self.workbook.close()
+
+    def _write_header(self, df: pd.DataFrame):
+        self.columns = list(df.columns)
+        sample = df.head(self.WIDTH_SAMPLE_ROWS)
+
+        for col_idx, col in enumerate(self.columns):
+            cell_format = None
+            if col in self.column_formats:
+                cell_format = self.workbook.add_format({'num_format': self.column_formats[col]})
+            elif pd.api.types.is_datetime64_any_dtype(df.dtypes.iloc[col_idx]):
+                cell_format = self.datetime_format
+            self.cell_formats.append(cell_format)
+
+            # Column formats must be set before rows are flushed in constant-memory mode
+            self.worksheet.set_column(col_idx, col_idx, self._column_width(sample.iloc[:, col_idx], col), cell_format)
+            self.worksheet.write(0, col_idx, col, self.header_format)
+        self.next_row = 1
+
+    def _column_width(self, sample: pd.Series, name) -> int:
+        """Width from the longest rendered value in the sample, vectorized"""
+        lengths = sample.astype(str).str.len()
+        longest = int(lengths.max()) if len(lengths) else 0
+        return min(max(longest, len(str(name))) + 2, self.MAX_WIDTH)
+
+    @staticmethod
+    def _to_python_rows(chunk: pd.DataFrame):
+        """Row tuples of plain Python values, with missing values as None and infinities as text"""
+        values = chunk.astype(object)
+        values = values.where(chunk.notna(), None)
+        for col_idx, dtype in enumerate(chunk.dtypes):
+            if pd.api.types.is_float_dtype(dtype):
+                column = chunk.iloc[:, col_idx].to_numpy()
+                infinite = np.isinf(column)
+                if infinite.any():
+                    values.iloc[infinite, col_idx] = np.where(column[infinite] > 0, 'inf', '-inf')
+        return values.itertuples(index=False, name=None)
+
+    def _write_row(self, row):
+        row_idx = self.next_row
+        for col_idx, value in enumerate(row):
+            if value is None:
+                continue
+            cell_format = self.cell_formats[col_idx]
+            if cell_format is None and isinstance(value, datetime.date):
+                cell_format = self.datetime_format if isinstance(value, datetime.datetime) else self.date_format
+            self.worksheet.write(row_idx, col_idx, value, cell_format)
+        self.next_row += 1
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+
+from loguru import logger
+
+
+class FileManifest:
+    """JSON index in an output folder of the input files already processed into it.
+
+    Each entry records the input's size, mtime, SHA-256, the processor version
+    that handled it and the output it produced. A file counts as processed while
+    its content and the processor version are unchanged and its output still
+    exists; a changed mtime alone only costs a hash check.
+    """
+
+    FILENAME = ".processed_manifest.json"
+
+    def __init__(self, folder: str, processor_version: str):
+        self.path = os.path.join(folder, self.FILENAME)
+        self.processor_version = processor_version
+        self.entries = self._load()
+
+    @staticmethod
+    def file_hash(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def is_processed(self, input_path: str) -> bool:
+        """Whether input_path was processed before and has not changed since"""
+        entry = self.entries.get(self._key(input_path))
+        if entry is None or entry.get("version") != self.processor_version:
+            return False
+        if not os.path.exists(entry.get("output", "")):
+            return False
+
+        stat = os.stat(input_path)
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+
+        # Touched but possibly unchanged (e.g. copied again): compare content
+        if self.file_hash(input_path) != entry["sha256"]:
+            return False
+        entry["mtime_ns"] = stat.st_mtime_ns
+        self.save()
+        return True
+
+    def record(self, input_path: str, output_path: str):
+        """Record that input_path was processed into output_path"""
+        stat = os.stat(input_path)
+        self.entries[self._key(input_path)] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": self.file_hash(input_path),
+            "version": self.processor_version,
+            "output": os.path.abspath(output_path),
+        }
+        self.save()
+
+    def save(self):
+        """Write the manifest atomically, so an interrupted run never leaves it half written"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": self.entries}, f, indent=1, sort_keys=True)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def _key(input_path: str) -> str:
+        return os.path.abspath(input_path)
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)["entries"]
+            if not isinstance(entries, dict) or not all(isinstance(entry, dict) for entry in entries.values()):
+                raise ValueError("entries are not a mapping of file entries")
+            return entries
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable manifest {self.path}: {e}")
+            return {}
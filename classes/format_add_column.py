@@ -4,11 +4,49 @@ from rich import print
 import os
 import sys
 
+from classes import instrumentation
+from classes.compact_dtypes import concat_frames
+from classes.date_normalizer import DateNormalizer
 from classes.excel_processor import ExcelProcessor
+from classes.processor_registry import register_processor
 
+@register_processor('adaos', label='Adaos')
 class FormatAddColumn(ExcelProcessor):
-    def __init__(self):
+    # Input columns removed from the output
+    DROP_COLUMNS = ["NIR", "Data NIR", "Adaos Proc", "Procent TVA", "Numar Aviz", "Data Aviz",
+                    "TVA Achizitie", "% TVA Ach", "TVAACH"]
+
+    # Headers of the per-rate summary table appended below the data
+    SUMMARY_COLUMNS = ['% TVA VANZARE', 'Total Valoare Achizitie', 'Total Valoare Achizitie TVA',
+                       'Total Valoare Vanzare', 'Total Valoare Vanzare TVA', 'Total Adaos']
+
+    # Amounts shown with thousands separators
+    CURRENCY_COLUMNS = ['Valoare Achizitie', 'TVVAaloare Diferenta']
+    CURRENCY_FORMAT = '#,##0.00'
+
+    # Columns an input must hold to be routed here (see schema_sniffer)
+    schemas = [{'Valoare Achizitie', 'TVVAaloare Diferenta', 'Adaos', 'Valoare TVA.1', '% TVA VANZARE'}]
+
+    # A handful of TVA rates and suppliers repeat over every row
+    category_columns = ['% TVA VANZARE', 'Furnizor']
+
+    def __init__(self, typed=False):
         super().__init__(input_folder="C:/in/format", output_folder="C:/out/format")
+        # Keep amounts as floats and TVA rates as ints, formatting them only in
+        # the written workbook, instead of round-tripping them through strings.
+        # The output changes: amounts become numeric cells, and rows keep their
+        # input order within each rate. Off by default (ADAOS_TYPED in server)
+        self.typed = typed
+
+    def column_filter(self):
+        """Skip the columns drop_columns would remove; nothing else reads them"""
+        return lambda name: name not in self.DROP_COLUMNS
+
+    def column_formats(self):
+        """Excel number formats for the output: the typed mode formats amounts in the workbook"""
+        if not self.typed:
+            return None
+        return {col: self.CURRENCY_FORMAT for col in self.CURRENCY_COLUMNS}
 
     def format_data(self, df):
         """Formats dates and numerical values in the DataFrame"""
@@ -19,9 +57,10 @@ class FormatAddColumn(ExcelProcessor):
         try:
             # Format date columns
             date_columns = ['Data NIR', 'Data']
+            date_normalizer = DateNormalizer('%d/%m/%Y', errors='coerce')
             for col in date_columns:
                 if col in df.columns:
-                    df[col] = pd.to_datetime(df[col], errors='coerce').dt.strftime('%d/%m/%Y')
+                    df[col] = date_normalizer.normalize(df[col])
 
             # Format numeric columns
             numeric_columns = ['Valoare Achizitie', 'TVVAaloare Diferenta', 'Adaos', 'Valoare TVA.1']
@@ -30,9 +69,12 @@ class FormatAddColumn(ExcelProcessor):
                     df[col] = pd.to_numeric(df[col], errors='coerce')
                     df[col] = df[col].fillna(0).round(2)
 
+            if self.typed:
+                # Thousands separators come from column_formats() at write time
+                return df
+
             # Format currency columns
-            currency_columns = ['Valoare Achizitie', 'TVVAaloare Diferenta']
-            for col in currency_columns:
+            for col in self.CURRENCY_COLUMNS:
                 if col in df.columns:
                     df[col] = df[col].apply(
                         lambda x: '{:,.2f}'.format(float(x)) if pd.notnull(x) and not isinstance(x, str) else x
@@ -58,6 +100,13 @@ class FormatAddColumn(ExcelProcessor):
             print(f"Error in fix_column: {e}")
             return None
 
+    @staticmethod
+    def tva_rates(values):
+        """Vectorized correct_format returning the rate number (e.g. 0.09 → 9), NaN if invalid"""
+        nums = pd.to_numeric(values.astype(str).str.replace("%", "", regex=False), errors='coerce')
+        nums = nums.where(np.isfinite(nums))
+        return np.trunc(nums.where(nums >= 1, nums * 100))
+
     @staticmethod
     def correct_format(value):
         """Fix formatting (e.g., %0.09 → %9)"""
@@ -75,10 +124,8 @@ class FormatAddColumn(ExcelProcessor):
             print("Warning: DataFrame is None in drop_columns")
             return None
 
-        dropcol = ["NIR","Data NIR", "Adaos Proc", "Procent TVA", "Numar Aviz", "Data Aviz",
-                  "TVA Achizitie", "% TVA Ach", "TVAACH"]
         try:
-            for col in dropcol:
+            for col in self.DROP_COLUMNS:
                 if col in df.columns:
                     df.drop(columns=[col], inplace=True)
             return df
@@ -97,6 +144,9 @@ class FormatAddColumn(ExcelProcessor):
                 print("Error: Column '% TVA VANZARE' not found")
                 return None
 
+            if self.typed:
+                return self.split_by_rate(df)
+
             df = df.copy()
             df['% TVA VANZARE'] = df['% TVA VANZARE'].apply(self.correct_format)
             df = df.dropna(subset=['% TVA VANZARE'])
@@ -112,111 +162,130 @@ class FormatAddColumn(ExcelProcessor):
             print(f"Error in split_by_tva_vanzare: {e}")
             return None
 
-    def merge_splits_with_clean_summary(self, split_dfs):
-        """Merges split DataFrames and adds summary table with headers - returns complete DataFrame"""
+    def split_by_rate(self, df):
+        """Typed split_by_tva_vanzare: '% TVA VANZARE' holds int rates, split in ascending order"""
+        return self.split_sorted(self.sort_by_rate(df))
+
+    def sort_by_rate(self, df):
+        """Rows with a valid '% TVA VANZARE', as int rates, stably sorted by rate.
+
+        The rows are gathered with a single take, so this is the only copy of the data.
+        """
+        rates = self.tva_rates(df['% TVA VANZARE']).to_numpy()
+        rows = np.flatnonzero(~np.isnan(rates))
+        # Stable, so rows keep their input order within each rate
+        order = rows[np.argsort(rates[rows], kind='stable')]
+
+        sorted_df = df.take(order)
+        sorted_df.index = pd.RangeIndex(len(order))
+        sorted_df['% TVA VANZARE'] = rates[order].astype(np.int64)
+        return sorted_df
+
+    @staticmethod
+    def split_sorted(sorted_df):
+        """Split a frame sorted by rate into per-rate row slices, without copying them"""
+        rates = sorted_df['% TVA VANZARE'].to_numpy()
+        if not len(rates):
+            return {}
+        bounds = np.flatnonzero(np.diff(rates)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(rates)]))
+        return {int(rates[start]): sorted_df.iloc[start:end] for start, end in zip(starts, ends)}
+
+    @staticmethod
+    def rate_labels(rates):
+        """'%N' labels for int rates, formatted once per distinct rate and kept categorical"""
+        codes, uniques = pd.factorize(rates)
+        labels = pd.Categorical.from_codes(codes, [f"%{rate}" for rate in uniques])
+        return pd.Series(labels, index=rates.index)
+
+    def merge_splits_with_clean_summary(self, split_dfs, merged_df=None):
+        """Merges split DataFrames and adds summary table with headers - returns complete DataFrame
+
+        merged_df can pass the splits already in one frame (the sorted frame
+        split_sorted slices), so they are not concatenated again.
+        """
         if not split_dfs:
             print("Warning: No data to merge")
             return None
 
         try:
             # Merge all DataFrames in split_dfs
-            merged_df = pd.concat(split_dfs.values(), ignore_index=True)
+            if merged_df is None:
+                merged_df = concat_frames(split_dfs.values())
             if merged_df.empty:
                 print("Warning: Merged DataFrame is empty")
                 return None
 
-            # Calculate summary data exactly like the original
-            summary_data = []
-            for key, split_df in split_dfs.items():
-                try:
-                    if key == "%19":
-                        achf19 = split_df['Valoare Achizitie'].str.replace(',', '').astype(float).sum()
-                        achtva19 = achf19 * 0.19
-                        vzf19 = split_df['Valoare TVA.1'].astype(float).sum() / 0.19
-                        vztva19 = split_df['Valoare TVA.1'].astype(float).sum()
-                        adaos19 = split_df['Adaos'].astype(float).sum()
-                        summary_data.append([key, achf19, achtva19, vzf19, vztva19, adaos19])
-                    elif key == "%9":
-                        achf9 = split_df['Valoare Achizitie'].str.replace(',', '').astype(float).sum()
-                        achtva9 = achf9 * 0.09
-                        vzf9 = split_df['Valoare TVA.1'].astype(float).sum() / 0.09
-                        vztva9 = split_df['Valoare TVA.1'].astype(float).sum()
-                        adaos9 = split_df['Adaos'].astype(float).sum()
-                        summary_data.append([key, achf9, achtva9, vzf9, vztva9, adaos9])
-                    elif key == "%21":
-                        achf21 = split_df['Valoare Achizitie'].str.replace(',', '').astype(float).sum()
-                        achtva21 = achf21 * 0.21
-                        vzf21 = split_df['Valoare TVA.1'].astype(float).sum() / 0.21
-                        vztva21 = split_df['Valoare TVA.1'].astype(float).sum()
-                        adaos21 = split_df['Adaos'].astype(float).sum()
-                        summary_data.append([key, achf21, achtva21, vzf21, vztva21, adaos21])
-                    elif key == "%11":
-                        achf11 = split_df['Valoare Achizitie'].str.replace(',', '').astype(float).sum()
-                        achtva11 = achf11 * 0.11
-                        vzf11 = split_df['Valoare TVA.1'].astype(float).sum() / 0.11
-                        vztva11 = split_df['Valoare TVA.1'].astype(float).sum()
-                        adaos11 = split_df['Adaos'].astype(float).sum()
-                        summary_data.append([key, achf11, achtva11, vzf11, vztva11, adaos11])
-                except Exception as e:
-                    print(f"Error processing summary for {key}: {e}")
-                    continue
-
-            if not summary_data:
+            summary_df = self.build_summary(merged_df)
+            if pd.api.types.is_integer_dtype(merged_df['% TVA VANZARE'].dtype):
+                merged_df['% TVA VANZARE'] = self.rate_labels(merged_df['% TVA VANZARE'])
+            if summary_df is None or summary_df.empty:
                 print("Warning: No summary data generated")
                 return merged_df
 
-            # Create the summary DataFrame with its own headers
-            summary_df = pd.DataFrame(
-                summary_data,
-                columns=['% TVA VANZARE', 'Total Valoare Achizitie',
-                        'Total Valoare Achizitie TVA', 'Total Valoare Vanzare',
-                        'Total Valoare Vanzare TVA', 'Total Adaos']
-            )
-
-            # Create empty rows for spacing (3 rows like original)
-            empty_rows = pd.DataFrame(
-                [[""] * len(merged_df.columns)] * 3,
-                columns=merged_df.columns
-            )
-
-            # Create the summary table headers row
-            summary_headers = [""] * len(merged_df.columns)
-            summary_headers[0] = "% TVA VANZARE"
-            summary_headers[1] = "Total Valoare Achizitie"
-            summary_headers[2] = "Total Valoare Achizitie TVA"
-            summary_headers[3] = "Total Valoare Vanzare"
-            summary_headers[4] = "Total Valoare Vanzare TVA"
-            summary_headers[5] = "Total Adaos"
-            
-            summary_headers_df = pd.DataFrame([summary_headers], columns=merged_df.columns)
-
-            # Convert summary_df to have the same number of columns as merged_df
-            summary_with_padding = pd.DataFrame(columns=merged_df.columns)
-            
-            # Add the summary data to the first few columns
-            for i, (_, row) in enumerate(summary_df.iterrows()):
-                new_row = [""] * len(merged_df.columns)
-                # Fill the first 6 columns with summary data
-                for j, value in enumerate(row.values):
-                    if j < len(new_row):
-                        new_row[j] = value
-                summary_with_padding.loc[i] = new_row
+            # 3 empty spacing rows, the summary headers and the summary rows,
+            # padded to the width of the data and allocated in one go
+            width = len(merged_df.columns)
+            summary_width = min(len(self.SUMMARY_COLUMNS), width)
+            block = np.full((4 + len(summary_df), width), "", dtype=object)
+            block[3, :summary_width] = self.SUMMARY_COLUMNS[:summary_width]
+            block[4:, :summary_width] = summary_df.to_numpy(dtype=object)[:, :summary_width]
+            summary_block = pd.DataFrame(block, columns=merged_df.columns)
 
             # Combine everything: main data + empty rows + summary headers + summary data
-            final_df = pd.concat([
-                merged_df,
-                empty_rows,
-                summary_headers_df,
-                summary_with_padding
-            ], ignore_index=True)
-
-            print(f"✅ DataFrame created with {len(merged_df)} data rows and {len(summary_with_padding)} summary rows")
+            final_df = concat_frames([merged_df, summary_block])
+
+            print(f"✅ DataFrame created with {len(merged_df)} data rows and {len(summary_df)} summary rows")
             return final_df
 
         except Exception as e:
             print(f"Error in merge_splits_with_clean_summary: {e}")
             return None
 
+    def build_summary(self, df):
+        """Totals per TVA rate, one row per '% TVA VANZARE' value in order of appearance.
+
+        The rate of each '%N' value is N/100, so any rate in the data gets a row.
+        Sales excluding TVA are derived from the TVA amount and are left empty
+        for a 0% rate.
+        """
+        missing = [col for col in ['% TVA VANZARE', 'Valoare Achizitie', 'Valoare TVA.1', 'Adaos'] if col not in df.columns]
+        if missing:
+            print(f"Error: Summary columns not found: {missing}")
+            return None
+
+        purchases = df['Valoare Achizitie']
+        if not pd.api.types.is_numeric_dtype(purchases.dtype):
+            purchases = pd.to_numeric(purchases.astype(str).str.replace(',', '', regex=False), errors='coerce')
+
+        amounts = pd.DataFrame({
+            'purchase': purchases,
+            'sale_tva': pd.to_numeric(df['Valoare TVA.1'], errors='coerce'),
+            'adaos': pd.to_numeric(df['Adaos'], errors='coerce'),
+        })
+        totals = amounts.groupby(df['% TVA VANZARE'], sort=False).sum()
+
+        # Rate table for the keys present in the data: '%N' labels or, typed, N itself
+        if pd.api.types.is_integer_dtype(totals.index.dtype):
+            rates = totals.index.to_numpy(dtype=float) / 100
+            totals.index = [f"%{rate}" for rate in totals.index]
+        else:
+            rates = pd.to_numeric(totals.index.str.lstrip('%'), errors='coerce').to_numpy(dtype=float) / 100
+        known_rate = rates > 0
+
+        sales = np.full(len(totals), np.nan)
+        np.divide(totals['sale_tva'].to_numpy(), rates, out=sales, where=known_rate)
+
+        return pd.DataFrame({
+            self.SUMMARY_COLUMNS[0]: totals.index,
+            self.SUMMARY_COLUMNS[1]: totals['purchase'].to_numpy(),
+            self.SUMMARY_COLUMNS[2]: totals['purchase'].to_numpy() * rates,
+            self.SUMMARY_COLUMNS[3]: sales,
+            self.SUMMARY_COLUMNS[4]: totals['sale_tva'].to_numpy(),
+            self.SUMMARY_COLUMNS[5]: totals['adaos'].to_numpy(),
+        })
+
     def process_dataframe(self, df):
         """Process a single DataFrame and return the result with summary"""
         if df is None:
@@ -224,23 +293,36 @@ class FormatAddColumn(ExcelProcessor):
             return None
 
         try:
-            df = self.format_data(df)
+            with instrumentation.stage("format_data"):
+                df = self.format_data(df)
             if df is None:
                 return None
 
-            df = self.fix_column(df)
+            with instrumentation.stage("fix_column"):
+                df = self.fix_column(df)
             if df is None:
                 return None
 
-            df = self.drop_columns(df)
+            with instrumentation.stage("drop_columns"):
+                df = self.drop_columns(df)
             if df is None:
                 return None
 
-            df_dict = self.split_by_tva_vanzare(df)
+            if self.typed and '% TVA VANZARE' in df.columns:
+                # The partitions are slices of the sorted frame, which is also the merged data
+                with instrumentation.stage("split"):
+                    sorted_df = self.sort_by_rate(df)
+                    split_dfs = self.split_sorted(sorted_df)
+                with instrumentation.stage("merge"):
+                    return self.merge_splits_with_clean_summary(split_dfs, merged_df=sorted_df)
+
+            with instrumentation.stage("split"):
+                df_dict = self.split_by_tva_vanzare(df)
             if df_dict is None:
                 return None
 
-            final_df = self.merge_splits_with_clean_summary(df_dict)
+            with instrumentation.stage("merge"):
+                final_df = self.merge_splits_with_clean_summary(df_dict)
             return final_df
 
         except Exception as e:
@@ -0,0 +1,247 @@
+import contextvars
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import quote
+
+try:
+    import resource
+except ImportError:
+    # Windows: peak memory is reported only when psutil is installed
+    resource = None
+
+# Upper bounds in seconds of the stage duration histogram buckets
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# The trace of the file being processed in this thread or task, if any
+_current = contextvars.ContextVar("file_trace", default=None)
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """High-water mark of this process' resident memory, or None where it can't be measured"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+    except (ImportError, AttributeError):
+        return None
+
+
+class FileTrace:
+    """Per-stage measurements of one processed file.
+
+    Stages are named after where they ran: "read", "process", "write", and
+    sub-steps nested inside one, like "process.format_data". A stage entered
+    more than once (each chunk of a streamed upload) accumulates its time and
+    rows. memory_bytes, when reported, is the largest frame the stage produced.
+    Traces are plain data, so they come back from worker processes intact.
+    """
+
+    def __init__(self, process_type: str, filename: str, input_bytes: int = 0):
+        self.process_type = process_type
+        self.filename = filename
+        self.input_bytes = input_bytes
+        self.status = "running"
+        # Stage name -> {"seconds", "calls", "rows", "columns", "bytes", "memory_bytes", "peak_rss_bytes"},
+        # in first-entered order
+        self.stages: Dict[str, Dict] = {}
+        self._open: List[str] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict]:
+        """Time the block as stage name; the yielded record takes rows, columns, bytes and memory_bytes"""
+        full_name = ".".join(self._open + [name])
+        record = self._record(full_name)
+        # Per-call annotations, added to the record's totals when the stage ends
+        annotations = {}
+        self._open.append(name)
+        start = time.perf_counter()
+        try:
+            yield annotations
+        finally:
+            record["seconds"] += time.perf_counter() - start
+            record["calls"] += 1
+            record["rows"] += annotations.get("rows", 0)
+            record["columns"] = max(record["columns"], annotations.get("columns", 0))
+            record["bytes"] += annotations.get("bytes", 0)
+            record["memory_bytes"] = max(record["memory_bytes"], annotations.get("memory_bytes", 0))
+            record["peak_rss_bytes"] = peak_rss_bytes()
+            self._open.pop()
+
+    @property
+    def seconds(self) -> float:
+        """Time spent in the top-level stages"""
+        return sum(record["seconds"] for name, record in self.stages.items() if "." not in name)
+
+    def add_stages(self, stages: Dict[str, Dict]):
+        """Merge stages measured elsewhere, e.g. another trace's stages from a worker process"""
+        for name, other in stages.items():
+            record = self._record(name)
+            for field in ("seconds", "calls", "rows", "bytes"):
+                record[field] += other[field]
+            record["columns"] = max(record["columns"], other["columns"])
+            record["memory_bytes"] = max(record["memory_bytes"], other["memory_bytes"])
+            if other["peak_rss_bytes"] is not None:
+                record["peak_rss_bytes"] = max(record["peak_rss_bytes"] or 0, other["peak_rss_bytes"])
+
+    def to_dict(self) -> Dict:
+        return {
+            "process_type": self.process_type,
+            "filename": self.filename,
+            "input_bytes": self.input_bytes,
+            "status": self.status,
+            "seconds": self.seconds,
+            "stages": {name: dict(record) for name, record in self.stages.items()},
+        }
+
+    def _record(self, name: str) -> Dict:
+        return self.stages.setdefault(name, {"seconds": 0.0, "calls": 0, "rows": 0, "columns": 0,
+                                             "bytes": 0, "memory_bytes": 0, "peak_rss_bytes": None})
+
+    def server_timing(self) -> List[str]:
+        """Server-Timing entries, one per top-level stage and sub-step.
+
+        The filename is percent-encoded: servers send headers as latin-1, which
+        the names of uploads (diacritics, quotes) need not fit.
+        """
+        description = quote(self.filename, safe=" ")
+        return [f'{name};dur={record["seconds"] * 1000:.1f};desc="{description}"'
+                for name, record in self.stages.items()]
+
+
+@contextmanager
+def trace_file(process_type: str, filename: str, input_bytes: int = 0) -> Iterator[FileTrace]:
+    """Collect the stages run inside the block into a new FileTrace"""
+    trace = FileTrace(process_type, filename, input_bytes)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[Dict]:
+    """Time the block as a stage of the file being traced; a no-op outside trace_file"""
+    trace = _current.get()
+    if trace is None:
+        yield {}
+        return
+    with trace.stage(name) as annotations:
+        yield annotations
+
+
+def describe_frame(annotations: Dict, df) -> None:
+    """Record the shape of the frame a stage produced"""
+    if df is not None:
+        annotations["rows"], annotations["columns"] = df.shape
+
+
+class Metrics:
+    """Process-wide totals of the traced files, rendered in the Prometheus text format.
+
+    The totals live in this process's memory: behind serve.py's gunicorn
+    workers each scrape only sees the files of the worker that answered it.
+    """
+
+    # Appended to the help text of the totals
+    SCOPE = ", in the server process that answered"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (process_type, status) -> files
+        self._files: Dict[tuple, int] = {}
+        # (process_type, stage) -> [count, seconds, rows, bytes, bucket counts]
+        self._stages: Dict[tuple, list] = {}
+        self._input_bytes: Dict[str, int] = {}
+        # (process_type, stage) -> largest frame
+        self._memory: Dict[tuple, int] = {}
+        self._peak_rss_bytes = 0
+
+    def observe(self, trace: Dict):
+        """Add a trace (FileTrace.to_dict()) to the totals"""
+        process_type = trace["process_type"]
+        with self._lock:
+            key = (process_type, trace["status"])
+            self._files[key] = self._files.get(key, 0) + 1
+            self._input_bytes[process_type] = self._input_bytes.get(process_type, 0) + trace["input_bytes"]
+            for name, record in trace["stages"].items():
+                totals = self._stages.setdefault((process_type, name), [0, 0.0, 0, 0, [0] * len(DURATION_BUCKETS)])
+                totals[0] += 1
+                totals[1] += record["seconds"]
+                totals[2] += record["rows"]
+                totals[3] += record["bytes"]
+                for i, bound in enumerate(DURATION_BUCKETS):
+                    if record["seconds"] <= bound:
+                        totals[4][i] += 1
+                if record.get("memory_bytes"):
+                    key = (process_type, name)
+                    self._memory[key] = max(self._memory.get(key, 0), record["memory_bytes"])
+                if record["peak_rss_bytes"]:
+                    self._peak_rss_bytes = max(self._peak_rss_bytes, record["peak_rss_bytes"])
+
+    def render(self, extra: Optional[Dict[str, tuple]] = None) -> str:
+        """The totals in the Prometheus text exposition format.
+
+        extra adds single-value metrics given as name -> (type, help, value).
+        """
+        lines = []
+
+        def metric(name, kind, help_text, scope=self.SCOPE):
+            lines.append(f"# HELP {name} {help_text}{scope}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            metric("excel_processor_files_total", "counter", "Uploaded files processed, by outcome")
+            for (process_type, status), count in sorted(self._files.items()):
+                lines.append(f'excel_processor_files_total{{process_type="{process_type}",status="{status}"}} {count}')
+
+            metric("excel_processor_input_bytes_total", "counter", "Bytes of uploaded workbooks processed")
+            for process_type, total in sorted(self._input_bytes.items()):
+                lines.append(f'excel_processor_input_bytes_total{{process_type="{process_type}"}} {total}')
+
+            metric("excel_processor_stage_seconds", "histogram", "Time spent per file in each pipeline stage")
+            for (process_type, name), (count, seconds, _, _, buckets) in sorted(self._stages.items()):
+                labels = f'process_type="{process_type}",stage="{name}"'
+                for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f'excel_processor_stage_seconds_bucket{{{labels},le="{bound}"}} {bucket_count}')
+                lines.append(f'excel_processor_stage_seconds_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"excel_processor_stage_seconds_sum{{{labels}}} {seconds:.6f}")
+                lines.append(f"excel_processor_stage_seconds_count{{{labels}}} {count}")
+
+            metric("excel_processor_stage_rows_total", "counter", "Rows produced by each pipeline stage")
+            for (process_type, name), (_, _, rows, _, _) in sorted(self._stages.items()):
+                if rows:
+                    lines.append(f'excel_processor_stage_rows_total{{process_type="{process_type}",stage="{name}"}} '
+                                 f'{rows}')
+
+            metric("excel_processor_stage_bytes_total", "counter", "Bytes read or written by each pipeline stage")
+            for (process_type, name), (_, _, _, total, _) in sorted(self._stages.items()):
+                if total:
+                    lines.append(f'excel_processor_stage_bytes_total{{process_type="{process_type}",stage="{name}"}} '
+                                 f'{total}')
+
+            if self._memory:
+                metric("excel_processor_stage_memory_bytes", "gauge",
+                       "Largest frame produced by each pipeline stage, in the compact dtype mode")
+                for (process_type, name), memory in sorted(self._memory.items()):
+                    lines.append(f'excel_processor_stage_memory_bytes{{process_type="{process_type}",stage="{name}"}} '
+                                 f'{memory}')
+
+            metric("excel_processor_peak_rss_bytes", "gauge",
+                   "Highest resident memory seen by a process handling a file")
+            lines.append(f"excel_processor_peak_rss_bytes {self._peak_rss_bytes}")
+
+        for name, (kind, help_text, value) in (extra or {}).items():
+            metric(name, kind, help_text, scope="")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Totals of every file processed by this server
+metrics = Metrics()
@@ -0,0 +1,245 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from classes.upload_pipeline import result_name, stream_zip
+
+
+class Job:
+    """One submitted batch of uploads and its progress"""
+
+    # Attributes saved to disk, from which another server process rebuilds the job
+    STATE = ("id", "process_types", "routes", "files", "rejected", "status", "error", "created", "finished",
+             "result_path", "result_name", "result_mimetype")
+
+    def __init__(self, process_types: List[str], filenames: List[str], routes: Optional[List[List[str]]] = None,
+                 rejected: Optional[List[Tuple[str, str]]] = None):
+        self.id = uuid.uuid4().hex
+        self.process_types = process_types
+        # The process types of each upload
+        self.routes = routes or [process_types] * len(filenames)
+        # Per upload: pending, done or failed
+        self.files = [{"name": name, "status": "pending", "process_type": "+".join(modes)}
+                      for name, modes in zip(filenames, self.routes)]
+        # Uploads turned away before processing, with the reason
+        self.rejected = [{"name": name, "reason": reason} for name, reason in rejected or []]
+        self.status = "queued"
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.result_path = None
+        self.result_name = None
+        self.result_mimetype = None
+
+    def to_dict(self) -> Dict:
+        counts = {state: sum(f["status"] == state for f in self.files) for state in ("pending", "done", "failed")}
+        return {
+            "id": self.id,
+            "process_type": "+".join(self.process_types),
+            "status": self.status,
+            "error": self.error,
+            "total": len(self.files),
+            **counts,
+            "files": [dict(f) for f in self.files],
+            "rejected": [dict(r) for r in self.rejected],
+        }
+
+    def state(self) -> Dict:
+        return {name: getattr(self, name) for name in self.STATE}
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "Job":
+        job = cls.__new__(cls)
+        for name in cls.STATE:
+            setattr(job, name, state.get(name))
+        return job
+
+
+class JobQueue:
+    """Runs upload batches in the background on a bounded thread pool.
+
+    A job's runner yields (result filename, bytes) for the uploads that
+    succeeded, in upload order and one per process type, and job progress
+    follows from it: the uploads skipped before a result failed. One result is
+    kept as it is, several are zipped. Results are written under directory and dropped, with their job,
+    once ttl seconds have passed since the job finished.
+
+    Each job's state is also saved in its directory as it changes, so with
+    several server processes sharing directory (see serve.py) any of them
+    can report on a job another one runs.
+    """
+
+    STATE_FILE = "job.json"
+    # Jobs of other server processes are looked for on disk at most this often, in seconds
+    SWEEP_INTERVAL = 60
+
+    def __init__(self, directory: str, workers: int = 2, ttl: float = 3600):
+        self.directory = directory
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._last_sweep = 0.0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, process_types: List[str], filenames: List[str],
+               runner: Callable[[], Iterable[Tuple[str, bytes]]], routes: Optional[List[List[str]]] = None,
+               rejected: Optional[List[Tuple[str, str]]] = None) -> Job:
+        """Queue a job running the uploads named filenames through process_types by calling runner.
+
+        routes gives each upload's own process types, rejected the uploads
+        turned away before the job (both see schema_sniffer.route_uploads).
+        """
+        self.expire()
+        job = Job(process_types, filenames, routes, rejected)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._save(job)
+        self._executor.submit(self._run, job, runner)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """The job with job_id, or None if it is unknown or expired; jobs of other processes come from disk"""
+        self.expire()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or not re.fullmatch(r"[0-9a-f]{32}", job_id):
+            return job
+        job = self._load(job_id)
+        if job is not None and job.finished is not None and time.time() - job.finished > self.ttl:
+            return None
+        return job
+
+    def expire(self):
+        """Forget finished jobs older than the TTL and delete their results"""
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.finished is not None and now - job.finished > self.ttl]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            logger.debug(f"Expiring job {job.id}")
+            shutil.rmtree(os.path.join(self.directory, job.id), ignore_errors=True)
+        if now - self._last_sweep > self.SWEEP_INTERVAL:
+            self._last_sweep = now
+            self._expire_on_disk(now)
+
+    def _expire_on_disk(self, now: float):
+        """Delete jobs of other processes whose state has not changed for the TTL: finished, or abandoned by a crash"""
+        with self._lock:
+            known = set(self._jobs)
+        for job_id in os.listdir(self.directory):
+            path = os.path.join(self.directory, job_id, self.STATE_FILE)
+            try:
+                stale = job_id not in known and now - os.stat(path).st_mtime > self.ttl
+            except OSError:
+                continue
+            if stale:
+                logger.debug(f"Expiring job {job_id}")
+                shutil.rmtree(os.path.join(self.directory, job_id), ignore_errors=True)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _save(self, job: Job):
+        """Write the job's state file, replacing the previous one in one step"""
+        job_dir = os.path.join(self.directory, job.id)
+        path = os.path.join(job_dir, self.STATE_FILE)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(job_dir, exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(job.state(), f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not save the state of job {job.id}: {e}")
+
+    def _load(self, job_id: str) -> Optional[Job]:
+        try:
+            with open(os.path.join(self.directory, job_id, self.STATE_FILE), encoding="utf-8") as f:
+                return Job.from_state(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def _run(self, job: Job, runner: Callable[[], Iterable[Tuple[str, bytes]]]):
+        job.status = "running"
+        self._save(job)
+        try:
+            results = self._track(job, runner())
+            self._store(job, results)
+            job.status = "done" if job.result_path else "failed"
+            if not job.result_path:
+                job.error = "No file could be processed"
+        except Exception as e:
+            traceback.print_exc()
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            for f in job.files:
+                if f["status"] == "pending":
+                    f["status"] = "failed"
+            job.finished = time.time()
+            self._save(job)
+
+    def _track(self, job: Job, results: Iterable[Tuple[str, bytes]]) -> Iterable[Tuple[str, bytes]]:
+        """Pass results through, marking the upload each one came from as done"""
+        position = 0
+        # Results already seen for the upload at position
+        seen = set()
+        for fname, data in results:
+            # Results come in upload order; uploads skipped on the way failed
+            while position < len(job.files):
+                expected = {result_name(mode, job.files[position]["name"]) for mode in job.routes[position]}
+                if fname in expected and fname not in seen:
+                    break
+                if not seen:
+                    job.files[position]["status"] = "failed"
+                position += 1
+                seen = set()
+            if position < len(job.files):
+                job.files[position]["status"] = "done"
+                seen.add(fname)
+            self._save(job)
+            yield fname, data
+
+    def _store(self, job: Job, results: Iterable[Tuple[str, bytes]]):
+        """Write the job's result file: the single workbook, or a zip of several"""
+        job_dir = os.path.join(self.directory, job.id)
+        os.makedirs(job_dir, exist_ok=True)
+        results = iter(results)
+
+        first = next(results, None)
+        if first is None:
+            return
+        second = next(results, None)
+        if second is None:
+            fname, data = first
+            path = os.path.join(job_dir, "result.xlsx")
+            with open(path, "wb") as f:
+                f.write(data)
+            job.result_name = fname
+            job.result_mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        else:
+            def all_results():
+                yield first
+                yield second
+                yield from results
+
+            path = os.path.join(job_dir, "result.zip")
+            with open(path, "wb") as f:
+                for chunk in stream_zip(all_results()):
+                    f.write(chunk)
+            job.result_name = "processed_files.zip"
+            job.result_mimetype = "application/zip"
+        job.result_path = path
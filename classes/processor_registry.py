@@ -0,0 +1,138 @@
+import importlib
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from loguru import logger
+
+# Built-in process types: the module whose import registers the processor, and
+# the UI label. A module is only imported when its process type is first used.
+BUILTIN_PROCESSORS = {
+    "adaos": ("classes.format_add_column", "Adaos"),
+    "sgr": ("classes.valoare_sgr", "SGR"),
+    "minus": ("classes.valoare_minus", "Minus"),
+    "extract": ("classes.excel_data_extractor", "Extract"),
+}
+
+# Columns an input must hold to be routed to each built-in process type (see
+# schema_sniffer). The processors declare the same sets as their schemas
+# attribute; they are repeated here so routing an upload imports none of them.
+BUILTIN_SCHEMAS = {
+    "adaos": [{"Valoare Achizitie", "TVVAaloare Diferenta", "Adaos", "Valoare TVA.1", "% TVA VANZARE"}],
+    # SGR reports have no header text: a blank row out to the deposit column
+    "sgr": [{f"Unnamed: {i}" for i in range(width)} for width in (21, 20, 19, 19)],
+    "minus": [{"Data Ultimei Incasari", "Valoare"}],
+    "extract": [{"Data Document", "CUI/CNP"}, {"Data Factura", "Cod Fiscal Partener"}, {"NIR", "Furnizor"}],
+}
+
+_lock = threading.RLock()
+# process_type -> processor class, in registration order
+_classes = {}
+# process_type -> label shown in the UI
+_labels = {process_type: label for process_type, (_, label) in BUILTIN_PROCESSORS.items()}
+# process_type -> the shared instance
+_instances = {}
+# process_type -> keyword arguments its processor is created with (see configure)
+_options: Dict[str, Dict] = {}
+# Modules imported for their registrations, so worker processes can import them too
+_modules: List[str] = []
+
+
+def register_processor(process_type: str, label: Optional[str] = None):
+    """Class decorator registering a processor under process_type.
+
+    Processors are created once and shared by every request and thread, so
+    process_dataframe must keep per-file state in locals (or a context object
+    like ExtractionContext), never on the instance.
+    """
+    def decorator(processor_class):
+        with _lock:
+            if process_type in _classes and _classes[process_type] is not processor_class:
+                raise ValueError(f"Process type '{process_type}' is already registered "
+                                 f"to {_classes[process_type].__name__}")
+            _classes[process_type] = processor_class
+            _labels[process_type] = label or _labels.get(process_type) or process_type.capitalize()
+        return processor_class
+    return decorator
+
+
+def load_processor_modules(modules: Iterable[str]):
+    """Import modules for the processors they register"""
+    with _lock:
+        for module in modules:
+            if module in _modules:
+                continue
+            importlib.import_module(module)
+            _modules.append(module)
+
+
+def configure(process_type: str, **options):
+    """Create the processor of process_type with these keyword arguments.
+
+    One already created is replaced on its next use.
+    """
+    with _lock:
+        _options[process_type] = dict(options)
+        _instances.pop(process_type, None)
+
+
+def options() -> Dict[str, Dict]:
+    """The keyword arguments given to configure, by process type"""
+    with _lock:
+        return {process_type: dict(kwargs) for process_type, kwargs in _options.items()}
+
+
+def loaded_modules() -> List[str]:
+    with _lock:
+        return list(_modules)
+
+
+def warm_up(modules: Iterable[str] = ()):
+    """Load the given modules and create every processor up front"""
+    load_processor_modules(modules)
+    for process_type in process_types():
+        get_processor(process_type)
+
+
+def process_types() -> List[str]:
+    with _lock:
+        return list(_labels)
+
+
+def labels() -> Dict[str, str]:
+    """Label of each process type: the built-in ones first, then in registration order"""
+    with _lock:
+        return dict(_labels)
+
+
+def schemas(process_type: str) -> List[set]:
+    """The column sets process_type's processor declares, read without creating it.
+
+    A built-in processor's come from BUILTIN_SCHEMAS until its module is imported.
+    """
+    with _lock:
+        if process_type in _classes:
+            return list(getattr(_classes[process_type], "schemas", ()))
+        return list(BUILTIN_SCHEMAS.get(process_type, ()))
+
+
+def is_registered(process_type: str) -> bool:
+    with _lock:
+        return process_type in _labels
+
+
+def get_processor(process_type: str):
+    """The shared processor for process_type, or None if it is unknown.
+
+    A built-in processor's module is imported on first use.
+    """
+    with _lock:
+        processor = _instances.get(process_type)
+        if processor is not None:
+            return processor
+        if process_type not in _classes and process_type in BUILTIN_PROCESSORS:
+            load_processor_modules([BUILTIN_PROCESSORS[process_type][0]])
+        if process_type not in _classes:
+            return None
+        logger.debug(f"Creating the {process_type} processor")
+        processor = _instances[process_type] = _classes[process_type](**_options.get(process_type, {}))
+        return processor
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+
+from loguru import logger
+
+from app_info import __version__
+from classes import processor_registry
+from classes.upload_spool import SpooledUpload, upload_digest
+
+
+class ResultCache:
+    """On-disk cache of processed workbooks, bounded in size with LRU eviction.
+
+    Entries are keyed by the SHA-256 of the uploaded file, the process type,
+    the app version, the upload's filename (the sgr and extract modes read
+    the file type from it) and the options the processor is configured with
+    (see processor_registry.configure). Entry files are named after the key, and their
+    modification time records the last use, so the LRU order survives restarts.
+    The index is kept in memory and updated as entries are stored and evicted;
+    the directory is only scanned on startup and then at most once every
+    rescan_seconds, on a write or a stats call. Server processes sharing the
+    directory (see serve.py) each keep their own index: an entry another one
+    wrote is picked up on first use, and the periodic rescan brings in the rest,
+    so between rescans the directory may run over the budget by what the other
+    processes wrote since.
+    """
+
+    SUFFIX = ".xlsx"
+
+    def __init__(self, directory: str, max_bytes: int, rescan_seconds: float = 60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rescan_seconds = rescan_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> entry size, least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+        self._scanned = 0.0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(process_type: str, filename: str, data: Union[bytes, SpooledUpload]) -> str:
+        # A spooled upload is hashed once, not once per process type
+        key = hashlib.sha256(upload_digest(data))
+        options = repr(sorted(processor_registry.options().get(process_type, {}).items()))
+        for part in (process_type, __version__, filename, options):
+            key.update(b"\0" + part.encode("utf-8"))
+        return key.hexdigest()
+
+    def get(self, process_type: str, filename: str, data: Union[bytes, SpooledUpload]) -> Optional[bytes]:
+        """Return the cached workbook bytes for an upload, or None on a miss"""
+        key = self.make_key(process_type, filename, data)
+        with self._lock:
+            if key not in self._entries and not self._adopt(key):
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), "rb") as f:
+                    result = f.read()
+                os.utime(self._path(key))
+            except OSError as e:
+                logger.warning(f"Dropping unreadable cache entry {key}: {e}")
+                self._forget(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, process_type: str, filename: str, data: Union[bytes, SpooledUpload], result: bytes):
+        """Store the processed workbook for an upload, evicting old entries to stay in budget"""
+        if len(result) > self.max_bytes:
+            return
+        key = self.make_key(process_type, filename, data)
+        with self._lock:
+            path = self._path(key)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(temp_path, "wb") as f:
+                    f.write(result)
+                os.replace(temp_path, path)
+            except OSError as e:
+                logger.warning(f"Could not write cache entry {key}: {e}")
+                return
+
+            self._size += len(result) - self._entries.pop(key, 0)
+            self._entries[key] = len(result)
+            if not self._rescan_if_due():
+                self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        """This process's hits and misses, and the entries of the directory as of the last rescan"""
+        with self._lock:
+            self._rescan_if_due()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def _adopt(self, key: str) -> bool:
+        """Index an entry file written by another process, if there is one"""
+        try:
+            size = os.stat(self._path(key)).st_size
+        except OSError:
+            return False
+        self._entries[key] = size
+        self._size += size
+        return True
+
+    def _rescan_if_due(self) -> bool:
+        """Rebuild the index if the last scan is older than rescan_seconds; True if it did"""
+        if time.monotonic() - self._scanned < self.rescan_seconds:
+            return False
+        self._load_index()
+        return True
+
+    def _load_index(self):
+        """Rebuild the index and LRU order from the entry files on disk, then evict down to the budget"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                # Evicted by another process meanwhile
+                continue
+            entries.append((stat.st_mtime, name[:-len(self.SUFFIX)], stat.st_size))
+        self._entries = OrderedDict()
+        self._size = 0
+        self._scanned = time.monotonic()
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._size += size
+        self._evict()
+
+    def _forget(self, key: str):
+        self._size -= self._entries.pop(key)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            logger.debug(f"Evicting cache entry {key}")
+            self._forget(key)
@@ -0,0 +1,300 @@
+import hashlib
+import io
+import posixpath
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+from xml.etree.ElementTree import ParseError, iterparse
+
+from loguru import logger
+
+from classes import processor_registry
+from classes.upload_spool import SpooledUpload, open_upload
+
+# Process type asking for each upload to be routed by its header
+AUTO = "auto"
+
+_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_RELATIONSHIPS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PACKAGE_RELATIONSHIPS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+# Legacy .xls workbooks are OLE compound files
+_OLE_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+
+class SheetHeader:
+    """Column names and size of a workbook's first sheet, as pd.read_excel would see them"""
+
+    def __init__(self, columns: List, rows: int):
+        self.columns = columns
+        # Data rows below the header, from the sheet's dimension (0 when it has none)
+        self.rows = rows
+
+    def fingerprint(self) -> str:
+        return fingerprint(self.columns)
+
+
+def fingerprint(columns) -> str:
+    """Stable digest of an ordered column set"""
+    digest = hashlib.sha1()
+    for column in columns:
+        digest.update(repr(column).encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+def sniff_header(data: Union[bytes, BinaryIO]) -> Optional[SheetHeader]:
+    """Read the header row and dimension of an xlsx upload's first sheet without loading its cells.
+
+    data is the upload's bytes or a seekable binary file over them. Only the
+    workbook index, the sheet's first row and the shared strings the header
+    refers to are parsed. Returns None for a legacy .xls workbook,
+    which has no such index; raises ValueError if data is not a readable xlsx.
+    The dimension some writers leave stale can add trailing 'Unnamed: N'
+    columns the full read would not have.
+    """
+    source = io.BytesIO(data) if isinstance(data, bytes) else data
+    source.seek(0)
+    if source.read(len(_OLE_MAGIC)) == _OLE_MAGIC:
+        return None
+    try:
+        with zipfile.ZipFile(source) as archive:
+            sheet_path = _first_sheet_path(archive)
+            with archive.open(sheet_path) as sheet:
+                cells, last_column, last_row = _header_cells(sheet)
+            strings = {}
+            indices = {int(value) for kind, value in cells.values() if kind == "s"}
+            if indices and "xl/sharedStrings.xml" in archive.namelist():
+                with archive.open("xl/sharedStrings.xml") as shared:
+                    strings = _shared_strings(shared, max(indices))
+    except (zipfile.BadZipFile, KeyError, ParseError, ValueError) as e:
+        raise ValueError(f"Not a readable xlsx workbook: {e}")
+
+    header = [""] * max([last_column] + [column + 1 for column in cells])
+    for column, (kind, value) in cells.items():
+        header[column] = _cell_value(kind, value, strings)
+    return SheetHeader(_column_names(header), max(last_row - 1, 0))
+
+
+def _first_sheet_path(archive: zipfile.ZipFile) -> str:
+    """Archive path of the workbook's first sheet"""
+    with archive.open("xl/workbook.xml") as workbook:
+        for _, element in iterparse(workbook):
+            if element.tag == _MAIN + "sheet":
+                relationship = element.get(_RELATIONSHIPS + "id")
+                break
+        else:
+            raise ValueError("the workbook has no sheets")
+    with archive.open("xl/_rels/workbook.xml.rels") as rels:
+        for _, element in iterparse(rels):
+            if element.tag == _PACKAGE_RELATIONSHIPS + "Relationship" and element.get("Id") == relationship:
+                target = element.get("Target")
+                if target.startswith("/"):
+                    return target[1:]
+                return posixpath.normpath(posixpath.join("xl", target))
+    raise ValueError(f"no part for sheet relationship {relationship}")
+
+
+def _header_cells(sheet) -> Tuple[Dict[int, Tuple[str, str]], int, int]:
+    """Cells of row 1 as column index -> (type, raw value), and the last column and row of the dimension"""
+    cells = {}
+    last_column = last_row = 0
+    for _, element in iterparse(sheet, events=("end",)):
+        if element.tag == _MAIN + "dimension":
+            last_column, last_row = _reference(element.get("ref", "A1").split(":")[-1])
+        elif element.tag == _MAIN + "row":
+            # pandas takes the sheet's first row as the header, even when it is blank
+            if int(element.get("r", 1)) == 1:
+                for position, cell in enumerate(element.iter(_MAIN + "c")):
+                    column = _reference(cell.get("r"))[0] - 1 if cell.get("r") else position
+                    kind = cell.get("t", "n")
+                    if kind == "inlineStr":
+                        value = "".join(text.text or "" for text in cell.iter(_MAIN + "t"))
+                    else:
+                        value = cell.findtext(_MAIN + "v")
+                    if value is not None:
+                        cells[column] = (kind, value)
+            break
+        elif element.tag == _MAIN + "sheetData":
+            break
+    return cells, last_column, last_row
+
+
+def _reference(reference: str) -> Tuple[int, int]:
+    """(column, row), both 1-based, of a cell reference like 'AB12'"""
+    column = 0
+    for position, char in enumerate(reference):
+        if not char.isalpha():
+            return column, int(reference[position:] or 0)
+        column = column * 26 + ord(char.upper()) - 64
+    return column, 0
+
+
+def _shared_strings(source, last_index: int) -> Dict[int, str]:
+    """The shared strings up to last_index; the rest of the table is not parsed"""
+    strings = {}
+    index = 0
+    for _, element in iterparse(source):
+        if element.tag != _MAIN + "si":
+            continue
+        # Phonetic runs (rPh) are annotations, not part of the text
+        phonetic = {id(text) for run in element.iter(_MAIN + "rPh") for text in run.iter(_MAIN + "t")}
+        strings[index] = "".join(text.text or "" for text in element.iter(_MAIN + "t") if id(text) not in phonetic)
+        element.clear()
+        if index == last_index:
+            break
+        index += 1
+    return strings
+
+
+def _cell_value(kind: str, value: str, strings: Dict[int, str]):
+    """A header cell's value, converted like pandas' readers do"""
+    if kind == "s":
+        return strings.get(int(value), "")
+    if kind in ("str", "inlineStr"):
+        return value
+    if kind == "b":
+        return value == "1"
+    if kind == "e":
+        return float("nan")
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def _column_names(header: List) -> List:
+    """Column names pandas derives from a header row: 'Unnamed: N' for blanks, '.N' suffixes for repeats"""
+    names = [f"Unnamed: {position}" if value == "" else value for position, value in enumerate(header)]
+    unnamed = [position for position, value in enumerate(header) if value == ""]
+    counts: Dict = {}
+    # Same order as pandas' python parser: named columns first, and a suffix
+    # already taken by a later header is skipped
+    for position in [i for i in range(len(names)) if header[i] != ""] + unnamed:
+        base = name = names[position]
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[base] = count + 1
+            name = f"{base}.{count}"
+            count = count + 1 if name in names else counts.get(name, 0)
+        names[position] = name
+        counts[name] = count + 1
+    return names
+
+
+def _unnamed(column) -> bool:
+    """Whether a column name is pandas' placeholder for a blank header cell"""
+    return isinstance(column, str) and column.startswith("Unnamed: ")
+
+
+class SchemaIndex:
+    """Memoized fingerprint -> matching process types.
+
+    A process type matches a header holding every column of one of its
+    processor's schemas (the processor's schemas attribute, a list of
+    required column sets, read through processor_registry.schemas so that
+    routing imports and creates no processor); its score is the size of the
+    largest such set, so the most specific layout wins. Between sets of the
+    same size, the one with more named columns wins: blank header cells
+    ('Unnamed: N') also turn up as stray trailing columns of other layouts.
+    Processors without schemas never match.
+    """
+
+    # Headers whose matches are kept
+    MAX_ENTRIES = 256
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (fingerprint, registered process types) -> {process_type: (columns, named columns)}
+        self._entries = OrderedDict()
+
+    def matches(self, columns) -> Dict[str, Tuple[int, int]]:
+        """Score of each process type whose schema the columns satisfy"""
+        process_types = tuple(processor_registry.process_types())
+        key = (fingerprint(columns), process_types)
+        with self._lock:
+            scores = self._entries.get(key)
+            if scores is not None:
+                self._entries.move_to_end(key)
+                return scores
+
+        present = set(columns)
+        scores = {}
+        for process_type in process_types:
+            sizes = [(len(schema), sum(not _unnamed(column) for column in schema))
+                     for schema in processor_registry.schemas(process_type) if set(schema) <= present]
+            if sizes:
+                scores[process_type] = max(sizes)
+        with self._lock:
+            self._entries[key] = scores
+            if len(self._entries) > self.MAX_ENTRIES:
+                self._entries.popitem(last=False)
+        return scores
+
+    def declares_schema(self, process_type: str) -> bool:
+        return bool(processor_registry.schemas(process_type))
+
+
+# Shared by every request
+schema_index = SchemaIndex()
+
+
+def route_upload(process_types: List[str], filename: str,
+                 data: Union[bytes, SpooledUpload]) -> Tuple[Optional[List[str]], Optional[str]]:
+    """Decide from an upload's header which process types it goes through.
+
+    With [AUTO], the upload goes to the process type whose schema it matches
+    best. With explicit process types, it goes through those of them its
+    header fits, is rejected if it only fits other process types, and goes
+    through all of them if it fits none at all. Returns (process types, None),
+    or (None, reason) for an upload to reject before it is read.
+    """
+    start = time.perf_counter()
+    try:
+        with open_upload(data) as source:
+            header = sniff_header(source)
+    except ValueError as e:
+        return None, str(e)
+    if header is None:
+        if process_types == [AUTO]:
+            return None, "Legacy .xls workbooks can't be routed automatically; pick a process type"
+        return process_types, None
+
+    scores = schema_index.matches(header.columns)
+    logger.debug(f"Sniffed {filename}: {len(header.columns)} columns, {header.rows} rows, "
+                 f"matches {scores or 'nothing'} in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    labels = processor_registry.labels()
+    if process_types == [AUTO]:
+        if not scores:
+            return None, "The columns match no known layout"
+        best = max(scores.values())
+        candidates = [process_type for process_type, score in scores.items() if score == best]
+        if len(candidates) > 1:
+            return None, "The columns match several layouts: " + ", ".join(labels[pt] for pt in candidates)
+        return candidates, None
+
+    fitting = [process_type for process_type in process_types
+               if process_type in scores or not schema_index.declares_schema(process_type)]
+    if fitting:
+        return fitting, None
+    if scores:
+        return None, (f"The columns fit {', '.join(labels[pt] for pt in scores)}, "
+                      f"not {', '.join(labels[pt] for pt in process_types)}")
+    # A layout nobody declares: the processors decide, as without sniffing
+    return process_types, None
+
+
+def route_uploads(process_types: List[str], uploads: List[Tuple[str, Union[bytes, SpooledUpload]]]):
+    """route_upload for each upload.
+
+    Returns (kept uploads, process types of each kept upload, [(filename, reason)] of the rejected ones).
+    """
+    kept, routes, rejected = [], [], []
+    for filename, data in uploads:
+        modes, reason = route_upload(process_types, filename, data)
+        if modes is None:
+            print(f"Rejecting {filename}: {reason}")
+            rejected.append((filename, reason))
+            continue
+        kept.append((filename, data))
+        routes.append(modes)
+    return kept, routes, rejected
@@ -0,0 +1,488 @@
+import io
+import traceback
+import zipfile
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from loguru import logger
+
+from classes import instrumentation, processor_registry
+from classes.upload_spool import SpooledUpload, open_upload
+
+if TYPE_CHECKING:
+    from classes.result_cache import ResultCache
+
+_pool = None
+_pool_workers = 0
+
+
+def result_name(process_type: str, filename: str) -> str:
+    """Filename of the processed workbook for an upload"""
+    return f"{process_type} - {filename}"
+
+
+def process_upload(process_type: str, filename: str, data: Union[bytes, SpooledUpload],
+                   stream_min_bytes: int = 0, compact: bool = False) -> Optional[Tuple[str, bytes]]:
+    """Read, process and write one uploaded workbook.
+
+    Returns (processed filename, workbook bytes), or None if the file failed.
+    See process_upload_modes.
+    """
+    results = process_upload_modes([process_type], filename, data, stream_min_bytes, compact)
+    return results[0] if results else None
+
+
+def process_upload_modes(process_types: List[str], filename: str, data: Union[bytes, SpooledUpload],
+                         stream_min_bytes: int = 0, compact: bool = False) -> List[Tuple[str, bytes]]:
+    """Read one uploaded workbook once and run it through each of process_types.
+
+    The sheet is parsed a single time, with the columns any of the processors
+    reads, and each processor gets its own frame over the same column data
+    (see _mode_frame). Uploads of at least stream_min_bytes (0 never streams)
+    go chunk by chunk when every processor is row-local, see
+    process_upload_stream. With compact, the parsed sheet and the results are
+    held in the compact dtypes (see _compact_input); uploads of at least
+    stream_min_bytes that do not stream are then read in chunks and compacted
+    as they are read (see _read_compact). data is the upload's
+    bytes or its SpooledUpload, whose spool file is parsed through a memory
+    map. Returns (processed filename, workbook bytes) for each process type
+    that succeeded, in order. Runs in worker processes, so everything it
+    needs travels in the arguments.
+    Its stages are timed when it runs inside instrumentation.trace_file; with
+    several process types, process and write are split per type.
+    """
+    # pandas and the Excel backends load with the first upload, not at startup
+    from classes.compact_dtypes import supports_compaction
+    from classes.excel_reader import ExcelReader
+    from classes.excel_writer import ExcelWriter
+
+    try:
+        processors = {process_type: processor_registry.get_processor(process_type) for process_type in process_types}
+        outputs = {process_type: io.BytesIO() for process_type in process_types}
+        if (stream_min_bytes and len(data) >= stream_min_bytes
+                and all(processor.row_local for processor in processors.values())):
+            failed = _stream_modes(processors, filename, data, outputs, compact)
+            return [(result_name(process_type, filename), output.getvalue())
+                    for process_type, output in outputs.items() if process_type not in failed]
+
+        # Large uploads are compacted chunk by chunk as they are read, so the
+        # whole sheet is never held as Python objects (see _read_compact)
+        compact_read = bool(compact and stream_min_bytes and len(data) >= stream_min_bytes
+                            and supports_compaction(processors.values()))
+        with instrumentation.stage("read") as annotations:
+            if compact_read:
+                df = _read_compact(processors, data)
+            else:
+                reader = ExcelReader(_shared_engine(processors))
+                with open_upload(data) as source:
+                    df = reader.read(source, usecols=_shared_filter(processors))
+            df.name = filename
+            annotations["bytes"] = len(data)
+            instrumentation.describe_frame(annotations, df)
+            if compact:
+                annotations["memory_bytes"] = _frame_memory(df)
+        if compact and not compact_read:
+            df = _compact_input(df, processors)
+    except Exception as e:
+        print(f"Error reading {filename}: {e}")
+        return []
+
+    results = []
+    for process_type, processor in processors.items():
+        try:
+            with _mode_stage("process", process_type, len(processors)) as annotations:
+                result_df = processor.process_dataframe(_mode_frame(df, processor, len(processors)))
+                if compact:
+                    result_df = _compact_result(result_df, processor, annotations)
+                instrumentation.describe_frame(annotations, result_df)
+
+            output = outputs[process_type]
+            with _mode_stage("write", process_type, len(processors)) as annotations:
+                ExcelWriter.write_frame(result_df, output, column_formats=processor.column_formats())
+                annotations["bytes"] = output.getbuffer().nbytes
+                instrumentation.describe_frame(annotations, result_df)
+            results.append((result_name(process_type, filename), output.getvalue()))
+        except Exception as e:
+            print(f"Error processing {filename} as {process_type}: {e}")
+    return results
+
+
+def process_upload_stream(processor, filename: str, data: Union[bytes, SpooledUpload], output):
+    """Process an upload chunk by chunk with a row-local processor, writing to output.
+
+    Only one chunk of input and its result are in memory at a time. Chunks
+    carry the dtypes and index of the whole sheet (see ExcelReader.read_chunks),
+    so the result is the one process_dataframe gives for the whole sheet.
+    """
+    failed = _stream_modes({None: processor}, filename, data, {None: output})
+    if failed:
+        raise failed[None]
+
+
+def _stream_modes(processors: Dict, filename: str, data: Union[bytes, SpooledUpload], outputs: Dict,
+                  compact: bool = False) -> Dict:
+    """process_upload_stream for several processors at once, reading each chunk once; compact as in process_upload_modes.
+
+    A processor failing on a chunk is dropped, and the others go on. Returns
+    the exception of each process type that failed; their outputs are incomplete.
+    """
+    from classes.excel_reader import ExcelReader
+    from classes.excel_writer import ExcelWriter
+
+    modes = len(processors)
+    writers = {}
+    failed = {}
+    try:
+        for process_type, processor in processors.items():
+            writers[process_type] = ExcelWriter(outputs[process_type], column_formats=processor.column_formats())
+        with open_upload(data) as source:
+            chunks = ExcelReader().read_chunks(source, usecols=_shared_filter(processors))
+            while writers:
+                # Each stage accumulates over the chunks
+                with instrumentation.stage("read") as annotations:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        annotations["bytes"] = len(data)
+                        break
+                    instrumentation.describe_frame(annotations, chunk)
+                    if compact:
+                        annotations["memory_bytes"] = _frame_memory(chunk)
+                chunk.name = filename
+                if compact:
+                    chunk = _compact_input(chunk, processors)
+                for process_type, processor in processors.items():
+                    if process_type not in writers:
+                        continue
+                    try:
+                        with _mode_stage("process", process_type, modes) as annotations:
+                            result = processor.process_dataframe(_mode_frame(chunk, processor, modes))
+                            if compact:
+                                result = _compact_result(result, processor, annotations)
+                            instrumentation.describe_frame(annotations, result)
+                        with _mode_stage("write", process_type, modes) as annotations:
+                            writers[process_type].append(result)
+                            instrumentation.describe_frame(annotations, result)
+                    except Exception as e:
+                        print(f"Error processing {filename} as {process_type}: {e}")
+                        failed[process_type] = e
+                        _discard_writer(writers.pop(process_type))
+    finally:
+        for process_type, writer in writers.items():
+            with _mode_stage("write", process_type, modes) as annotations:
+                writer.close()
+                annotations["bytes"] = outputs[process_type].getbuffer().nbytes
+    return failed
+
+
+def _discard_writer(writer):
+    """Close the writer of a failed process type; its output is dropped either way"""
+    try:
+        writer.close()
+    except Exception:
+        pass
+
+
+def enable_copy_on_write():
+    """Turn on pandas copy-on-write, the default from pandas 3 on, for the whole process.
+
+    Frames derived from one another then share their column data until one of
+    them writes to a column, which is what lets every process type of an
+    upload work on the same parsed sheet without copying it first. Called
+    once at startup (server.py, serve.py) and in each pool worker; without it
+    the process types get copies instead (see _mode_frame).
+    """
+    import pandas as pd
+
+    pd.set_option("mode.copy_on_write", True)
+
+
+def _frame_memory(df) -> int:
+    from classes.compact_dtypes import frame_memory
+
+    return frame_memory(df)
+
+
+def _compact_input(df, processors: Dict):
+    """The parsed sheet in compact dtypes, as a "compact" stage reporting its new size.
+
+    The categories and exact columns of all the processors apply. The sheet
+    is left as parsed when one of them has not opted in (see
+    compact_dtypes.supports_compaction).
+    """
+    from classes.compact_dtypes import compact_frame, supports_compaction
+
+    if not supports_compaction(processors.values()):
+        return df
+    categories = {name for processor in processors.values() for name in processor.category_columns}
+    exact = {name for processor in processors.values() for name in processor.exact_columns}
+    with instrumentation.stage("compact") as annotations:
+        compacted = compact_frame(df, categories, exact)
+        annotations["memory_bytes"] = _frame_memory(compacted)
+        instrumentation.describe_frame(annotations, compacted)
+    return compacted
+
+
+def _read_compact(processors: Dict, data: Union[bytes, SpooledUpload]):
+    """The sheet read in chunks (see ExcelReader.read_chunks), each put in the compact dtypes as it comes.
+
+    pandas builds a Python object for every cell before it applies any dtype,
+    so reading the whole sheet peaks at its size as objects whatever the
+    dtype_backend; here only one chunk is at a time.
+    """
+    import pandas as pd
+    from classes.compact_dtypes import compact_frame, concat_frames
+    from classes.excel_reader import ExcelReader
+
+    categories = {name for processor in processors.values() for name in processor.category_columns}
+    exact = {name for processor in processors.values() for name in processor.exact_columns}
+    with open_upload(data) as source:
+        chunks = [compact_frame(chunk, categories, exact)
+                  for chunk in ExcelReader().read_chunks(source, usecols=_shared_filter(processors))]
+    return concat_frames(chunks) if chunks else pd.DataFrame()
+
+
+def _compact_result(result_df, processor, annotations: Dict):
+    """A processor's result in compact dtypes, for the time it is held while being written"""
+    from classes.compact_dtypes import compact_frame, supports_compaction
+
+    if result_df is not None and supports_compaction([processor]):
+        result_df = compact_frame(result_df, processor.category_columns)
+        annotations["memory_bytes"] = _frame_memory(result_df)
+    return result_df
+
+
+def _shared_engine(processors: Dict) -> str:
+    """The reader engine all the processors use, or auto when they differ"""
+    engines = {processor.reader_engine for processor in processors.values()}
+    return engines.pop() if len(engines) == 1 else "auto"
+
+
+def _shared_filter(processors: Dict):
+    """Column filter keeping every column any of the processors reads"""
+    filters = [processor.column_filter() for processor in processors.values()]
+    if any(keep is None for keep in filters):
+        return None
+    if len(filters) == 1:
+        return filters[0]
+    return lambda name: any(keep(name) for keep in filters)
+
+
+def _mode_frame(df, processor, modes: int):
+    """The frame one of several processors works on: its columns of df, sharing their data.
+
+    A processor that writes to its frame copies only the columns it writes
+    (copy-on-write), so the others still see the sheet as parsed. Where
+    copy-on-write is off (see enable_copy_on_write), the frame is a copy.
+    """
+    import pandas as pd
+
+    if modes == 1:
+        return df
+    keep = processor.column_filter()
+    if keep is not None:
+        # A list of columns selects a copy when copy-on-write is off; the
+        # shallow copy clears pandas' note that it came from df, which would
+        # warn (SettingWithCopyWarning) when the processor writes to it
+        frame = df[[name for name in df.columns if keep(name)]].copy(deep=False)
+    else:
+        frame = df.copy(deep=not pd.options.mode.copy_on_write)
+    frame.name = df.name
+    return frame
+
+
+@contextmanager
+def _mode_stage(name: str, process_type: str, modes: int) -> Iterator[Dict]:
+    """instrumentation.stage(name), split per process type when an upload goes through several"""
+    with instrumentation.stage(name) as annotations:
+        if modes == 1:
+            yield annotations
+            return
+        with instrumentation.stage(process_type) as mode_annotations:
+            yield mode_annotations
+
+
+def process_upload_traced(process_types: List[str], filename: str, data: Union[bytes, SpooledUpload],
+                          stream_min_bytes: int = 0,
+                          compact: bool = False) -> Tuple[List[Tuple[str, bytes]], Dict[str, Dict]]:
+    """process_upload_modes, also returning the stages it timed (see FileTrace.stages)"""
+    with instrumentation.trace_file("+".join(process_types), filename, len(data)) as trace:
+        results = process_upload_modes(process_types, filename, data, stream_min_bytes, compact)
+    return results, trace.stages
+
+
+def shutdown_pool():
+    """Shut down the shared process pool, if one was started"""
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+    _pool_workers = 0
+
+
+def _initialize_worker(modules: List[str], options: Dict[str, Dict]):
+    """Set up a pool worker: copy-on-write on, and the plugin modules and processor options of the parent"""
+    enable_copy_on_write()
+    processor_registry.load_processor_modules(modules)
+    for process_type, kwargs in options.items():
+        processor_registry.configure(process_type, **kwargs)
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """Return the shared process pool, recreating it if the worker count changed"""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        shutdown_pool()
+        # Workers import the same plugin modules; built-in processors load on first use there too
+        _pool = ProcessPoolExecutor(max_workers=workers, initializer=_initialize_worker,
+                                    initargs=(processor_registry.loaded_modules(), processor_registry.options()))
+        _pool_workers = workers
+    return _pool
+
+
+def iter_processed_uploads(process_type: Union[str, List[str]],
+                           uploads: List[Tuple[str, Union[bytes, SpooledUpload]]], workers: int = 1,
+                           cache: Optional["ResultCache"] = None,
+                           stream_min_bytes: int = 0,
+                           traces: Optional[List[instrumentation.FileTrace]] = None,
+                           routes: Optional[List[List[str]]] = None,
+                           compact: bool = False) -> Iterator[Tuple[str, bytes]]:
+    """Yield the successful results in upload order as soon as each one is ready.
+
+    process_type may be a list: each upload is then parsed once and run through
+    every process type, giving one result per type (see process_upload_modes).
+    With more than one worker and more than one file, each file is read, processed
+    and written in its own process. Failed files are skipped. With a cache, results
+    seen before are answered from it and new results are stored in it. Uploads of
+    at least stream_min_bytes are processed in chunks (see process_upload_modes).
+    Every upload's trace goes to instrumentation.metrics and, when given, traces.
+    routes, when given, holds the process types of each upload in place of
+    process_type (see schema_sniffer.route_uploads). compact holds the frames
+    in the compact dtypes, see process_upload_modes. Uploads given as
+    SpooledUpload reach the worker processes as the path of their spool file.
+    """
+    process_types = [process_type] if isinstance(process_type, str) else list(process_type)
+    if routes is None:
+        routes = [process_types] * len(uploads)
+    file_traces = [instrumentation.FileTrace("+".join(modes), filename, len(data))
+                   for (filename, data), modes in zip(uploads, routes)]
+
+    def lookup(trace, filename, data, modes):
+        """The cached result of each process type for the upload, None where there is none"""
+        if cache is None:
+            return {mode: None for mode in modes}
+        with trace.stage("cache") as annotations:
+            hits = {mode: cache.get(mode, filename, data) for mode in modes}
+            annotations["bytes"] = sum(len(hit) for hit in hits.values() if hit is not None)
+        return hits
+
+    cached = [lookup(trace, filename, data, modes)
+              for trace, (filename, data), modes in zip(file_traces, uploads, routes)]
+    # Per upload needing work, the process types it still needs
+    misses = [(upload, [mode for mode, hit in hits.items() if hit is None])
+              for upload, hits in zip(uploads, cached) if None in hits.values()]
+
+    if workers <= 1 or len(misses) <= 1:
+        def compute(filename, data, modes):
+            return process_upload_traced(modes, filename, data, stream_min_bytes, compact)
+    else:
+        pool = get_pool(workers)
+        # Submitted up front; consumed in the same order as the misses below
+        futures = iter([pool.submit(process_upload_traced, modes, filename, data, stream_min_bytes, compact)
+                        for (filename, data), modes in misses])
+
+        def compute(filename, data, modes):
+            try:
+                return next(futures).result()
+            except BrokenProcessPool as e:
+                # A crashed worker poisons the pool; start a fresh one next time
+                print(f"Worker pool broke while processing {filename}: {e}")
+                shutdown_pool()
+            except Exception as e:
+                traceback.print_exc()
+                print(f"Worker failed on {filename}: {e}")
+            return [], {}
+
+    def finish(trace, status):
+        trace.status = status
+        logger.debug(f"{trace.filename}: {status} in {trace.seconds:.3f}s "
+                     + ", ".join(f"{name} {record['seconds']:.3f}s" for name, record in trace.stages.items()))
+        parsed = trace.stages.get("read", {}).get("memory_bytes")
+        compacted = trace.stages.get("compact", {}).get("memory_bytes")
+        if parsed and compacted:
+            logger.info(f"{trace.filename}: sheet held in {compacted / 2 ** 20:.1f} MB, "
+                        f"{parsed / 2 ** 20:.1f} MB as parsed")
+        instrumentation.metrics.observe(trace.to_dict())
+        if traces is not None:
+            traces.append(trace)
+
+    for (filename, data), hits, trace in zip(uploads, cached, file_traces):
+        missing = [mode for mode, hit in hits.items() if hit is None]
+        if not missing:
+            finish(trace, "cached")
+            for mode, hit in hits.items():
+                yield result_name(mode, filename), hit
+            continue
+
+        computed, stages = compute(filename, data, missing)
+        trace.add_stages(stages)
+        computed = dict(computed)
+        if cache is not None and computed:
+            with trace.stage("cache"):
+                for mode in missing:
+                    if result_name(mode, filename) in computed:
+                        cache.put(mode, filename, data, computed[result_name(mode, filename)])
+
+        results = [(result_name(mode, filename), hit if hit is not None else computed.get(result_name(mode, filename)))
+                   for mode, hit in hits.items()]
+        results = [(name, result) for name, result in results if result is not None]
+        if not results:
+            finish(trace, "failed")
+            continue
+        finish(trace, "done" if len(results) == len(hits) else "partial")
+        yield from results
+
+
+def process_uploads(process_type: Union[str, List[str]], uploads: List[Tuple[str, Union[bytes, SpooledUpload]]],
+                    workers: int = 1, cache: Optional["ResultCache"] = None, stream_min_bytes: int = 0,
+                    traces: Optional[List[instrumentation.FileTrace]] = None,
+                    routes: Optional[List[List[str]]] = None, compact: bool = False) -> List[Tuple[str, bytes]]:
+    """Process uploaded workbooks and return the successful results in upload order"""
+    return list(iter_processed_uploads(process_type, uploads, workers, cache, stream_min_bytes, traces, routes,
+                                       compact))
+
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable write target that hands out what zipfile wrote since the last drain"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(results: Iterable[Tuple[str, bytes]]) -> Iterator[bytes]:
+    """Yield a zip archive of (filename, data) pairs chunk by chunk.
+
+    Each entry is flushed as soon as it is written, so only the entry being
+    added is ever held in memory, never the whole archive.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w') as zipf:
+        for fname, data in results:
+            zipf.writestr(fname, data)
+            yield sink.drain()
+    # Central directory written on close
+    yield sink.drain()
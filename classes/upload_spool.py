@@ -0,0 +1,207 @@
+import errno
+import hashlib
+import io
+import mmap
+import os
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from typing import BinaryIO, Iterable, Iterator, Optional, Union
+
+from loguru import logger
+
+
+class SpooledUpload:
+    """One uploaded file: its bytes when it came in a small request, else the spool file it was written to.
+
+    len() is the file size, taken when the upload was spooled. Pickling one
+    only carries the path, so a worker process opens the spool file itself
+    instead of receiving the contents.
+    """
+
+    def __init__(self, size: int, data: Optional[bytes] = None, path: Optional[str] = None):
+        self.size = size
+        self.data = data
+        self.path = path
+        # SHA-256 of the contents, computed on first use
+        self._digest = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    @contextmanager
+    def open(self) -> Iterator[BinaryIO]:
+        """A seekable binary file over the contents; a spool file is memory-mapped, not read in"""
+        if self.path is None or self.size == 0:
+            yield io.BytesIO(self.data or b"")
+            return
+        with self._mapped() as mapping:
+            yield _MappedFile(mapping)
+
+    def digest(self) -> bytes:
+        """SHA-256 of the contents"""
+        if self._digest is None:
+            if self.path is None or self.size == 0:
+                self._digest = hashlib.sha256(self.data or b"").digest()
+            else:
+                with self._mapped() as mapping:
+                    self._digest = hashlib.sha256(mapping).digest()
+        return self._digest
+
+    def detach(self):
+        """Keep the spool file past the end of its request; it is then removed by discard()"""
+        if self.path is None:
+            return
+        kept = os.path.join(os.path.dirname(self.path), f"{UploadSpool.PREFIX}{uuid.uuid4().hex}.kept")
+        os.replace(self.path, kept)
+        self.path = kept
+
+    def discard(self):
+        """Remove the spool file, if there is one"""
+        if self.path is not None:
+            _remove(self.path)
+
+    @contextmanager
+    def _mapped(self) -> Iterator[mmap.mmap]:
+        with open(self.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                yield mapping
+
+
+class _MappedFile(io.RawIOBase):
+    """Read-only, seekable file object over a memory map, for zipfile and pd.read_excel.
+
+    A bare mmap lacks parts of the file interface zipfile relies on (seekable()
+    before Python 3.13).
+    """
+
+    def __init__(self, mapping: mmap.mmap):
+        super().__init__()
+        self._mapping = mapping
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        end = len(self._mapping) if size is None or size < 0 else self._position + size
+        data = self._mapping[self._position:end]
+        self._position += len(data)
+        return data
+
+    def readall(self) -> bytes:
+        return self.read()
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._mapping)
+        if offset < 0:
+            # As a real file does, which zipfile relies on to find a truncated archive
+            raise OSError(errno.EINVAL, f"negative seek position {offset}")
+        self._position = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._position
+
+
+class UploadSpool:
+    """Where the files of upload requests are written while the request body is parsed.
+
+    Werkzeug asks for a stream per uploaded file before reading it (see
+    SpoolingRequest in server). A request of at most memory_max_bytes keeps
+    its files in memory; the files of a larger one, or of one without a
+    length, go straight to their own file in directory, never held in memory
+    whole. Spool files go away with their request unless detached, and ones a
+    crash left behind are removed after STALE_SECONDS.
+    """
+
+    PREFIX = "upload-"
+    STALE_SECONDS = 24 * 60 * 60
+
+    def __init__(self, directory: str, memory_max_bytes: int):
+        self.directory = directory
+        self.memory_max_bytes = memory_max_bytes
+
+        os.makedirs(directory, exist_ok=True)
+        self._remove_stale()
+
+    def stream(self, total_content_length: Optional[int]) -> BinaryIO:
+        """A writable stream for one uploaded file of a request of total_content_length bytes"""
+        if total_content_length is not None and total_content_length <= self.memory_max_bytes:
+            return io.BytesIO()
+        return tempfile.NamedTemporaryFile("wb+", dir=self.directory, prefix=self.PREFIX, suffix=".part",
+                                           delete=False)
+
+    @staticmethod
+    def adopt(stream: BinaryIO) -> SpooledUpload:
+        """The upload held by a stream from stream() once werkzeug has written it; a spool file is closed.
+
+        The size comes from the stream's buffer or file metadata, not by reading it.
+        """
+        if isinstance(stream, io.BytesIO):
+            return SpooledUpload(stream.getbuffer().nbytes, data=stream.getvalue())
+        if isinstance(getattr(stream, "name", None), str):
+            stream.flush()
+            size = os.fstat(stream.fileno()).st_size
+            # Closed so the file can be mapped, renamed and removed on Windows too
+            stream.close()
+            return SpooledUpload(size, path=stream.name)
+        # Not one of ours (werkzeug's default factory): read into memory
+        stream.seek(0)
+        data = stream.read()
+        return SpooledUpload(len(data), data=data)
+
+    @staticmethod
+    def release(streams: Iterable[BinaryIO]):
+        """Remove the spool files of a finished request, apart from detached ones"""
+        for stream in streams:
+            name = getattr(stream, "name", None)
+            if isinstance(name, str):
+                stream.close()
+                _remove(name)
+
+    def _remove_stale(self):
+        cutoff = time.time() - self.STALE_SECONDS
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.startswith(self.PREFIX) and os.stat(path).st_mtime < cutoff:
+                    logger.debug(f"Removing stale spool file {name}")
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Could not remove spool file {path}: {e}")
+
+
+def open_upload(data: Union[bytes, SpooledUpload]):
+    """A seekable binary file over an upload's contents, as a context manager"""
+    if isinstance(data, SpooledUpload):
+        return data.open()
+    return nullcontext(io.BytesIO(data))
+
+
+def upload_digest(data: Union[bytes, SpooledUpload]) -> bytes:
+    """SHA-256 of an upload's contents"""
+    if isinstance(data, SpooledUpload):
+        return data.digest()
+    return hashlib.sha256(data).digest()
@@ -1,18 +1,36 @@
 import os
 import sys
-import xlwings as xw  # Import xlwings directly
+import numpy as np
 import pandas as pd  # Import pandas
 
 # Assuming ExcelProcessor is in a separate file (excel_processor.py)
 # If it's in the same file, you don't need this path manipulation
 # sys.path.append(os.path.abspath(r'D:\Programming\Python\MomAutomations'))
+from classes.column_rules import ColumnRules, MissingColumnsError, Negate, NormalizeDates
+from classes.date_normalizer import DateNormalizer
 from classes.excel_processor import ExcelProcessor  # Import the ExcelProcessor class
+from classes.processor_registry import register_processor
 
+@register_processor('minus', label='Minus')
 class ValoareMinus(ExcelProcessor):
-    def __init__(self):
-        super().__init__()
+    # Dates and amounts are converted cell by cell
+    row_local = True
+
+    DATE_COLUMN = "Data Ultimei Incasari"
+    AMOUNT_COLUMN = "Valoare"
+    RULES = ColumnRules(
+        NormalizeDates(DATE_COLUMN),
+        Negate(AMOUNT_COLUMN),
+    )
+    # Columns an input must hold to be routed here (see schema_sniffer)
+    schemas = [{DATE_COLUMN, AMOUNT_COLUMN}]
+
+    def __init__(self, bulk=True, batch_engine="auto"):
+        super().__init__(batch_engine=batch_engine)
         self.input_folder = "C:/in/minus"
         self.output_folder = "C:/out/minus"
+        # Read and write whole ranges instead of one cell per COM call
+        self.bulk = bulk
 
     @staticmethod
     def col_index_to_letter(index):
@@ -28,29 +46,23 @@ class ValoareMinus(ExcelProcessor):
         # Print the columns to verify the available columns
         print("Available columns:", df.columns)
 
-        
-        # Format the date column "Data Document"
-        
-        date_column = "Data Ultimei Incasari"
-        if date_column in df.columns:
-            df[date_column] = pd.to_datetime(df[date_column], errors='coerce').dt.strftime('%Y%m%d')
-            print(f"Formatted date column: {date_column}")
-        else:
-            print(f"Error: '{date_column}' does not exist in the DataFrame.")
-            raise KeyError(f"'{date_column}' not found in DataFrame columns.")
-
-        # Remove the multiplication and rounding for "% TVA VANZARE" column
-        tva_column = "Valoare"
-        if tva_column in df.columns:
-            df[tva_column] = df[tva_column].apply(lambda x: -x)
-        else:
-            print(f"Error: '{tva_column}' does not exist in the DataFrame.")
-            raise KeyError(f"'{tva_column}' not found in DataFrame columns.")
-
+        # Format the date column and negate the amounts, in place
+        try:
+            plan = self.RULES.compile(df.columns)
+        except MissingColumnsError as e:
+            for column in e.columns:
+                print(f"Error: '{column}' does not exist in the DataFrame.")
+            raise
+        plan.run(df)
+        print(f"Formatted date column: {self.DATE_COLUMN}")
         return df
 
     def process_files(self):
         """Process all Cu Minus files in the input folder"""
+        if self.resolve_batch_engine() == "openpyxl":
+            self.process_files_headless()
+            return
+
         # Initialize Excel and create folders only once at the beginning
         self.initialize_excel()
         self.create_folders()
@@ -61,31 +73,73 @@ class ValoareMinus(ExcelProcessor):
                     input_path = os.path.join(self.input_folder, file)
                     output_path = os.path.join(self.output_folder, "Minus--" + file)
 
+                    if self.is_file_processed(input_path):
+                        print(f"Skipping unchanged file: {file}")
+                        continue
+
                     if self.open_workbook(input_path):
                         self.process_single_file()  # Process the file
                         self.save_and_close(output_path)  # Save and close after processing
+                        if os.path.exists(output_path):
+                            self.mark_file_processed(input_path, output_path)
         except Exception as e:
             print(f"An error occurred: {e}")  # Handle errors during file processing
         finally:
             self.cleanup()  # Ensure cleanup happens even if there's an error
 
-    def find_date_column(self, header_row):
+    def header_values(self, header_row):
+        """Values of the header row, read in one call in bulk mode"""
+        column_count = self.ws.used_range.columns.count
+        if self.bulk:
+            return self.ws.range((header_row, 1), (header_row, column_count)).options(ndim=1).value
+        return [self.ws.cells(header_row, col).value for col in range(1, column_count + 1)]
+
+    def find_date_column(self, header_row, headers=None):
         # Find all columns that contain the word "data" in row 3
         data_columns = []
         columns_name_Date = "Data Ultimei Incasari".lower()
-        for col in range(1, self.ws.used_range.columns.count + 1):
-            cell = self.ws.cells(header_row, col)
-            if isinstance(cell.value, str) and columns_name_Date in cell.value.strip().lower():
+        if headers is None:
+            headers = self.header_values(header_row)
+        for col, value in enumerate(headers, start=1):
+            if isinstance(value, str) and columns_name_Date in value.strip().lower():
                 col_letter = self.col_index_to_letter(col)
                 data_columns.append(col_letter)
                 print("Column date found")
         return data_columns
 
+    @staticmethod
+    def negate_numbers(values):
+        """Negate the numeric values of a column; returns the new values and which ones changed"""
+        values = np.asarray(values, dtype=object)
+        numeric = np.fromiter((isinstance(value, (int, float)) for value in values), dtype=bool, count=len(values))
+        negated = values.copy()
+        if numeric.any():
+            negated[numeric] = -values[numeric]
+        return negated, numeric
+
+    def negate_column_bulk(self, col_letter, start_row, last_row):
+        """Negate a column with one range read and one write per run of numeric cells.
+
+        Text and date cells in between are left untouched rather than being
+        written back, so Excel does not re-interpret them.
+        """
+        if last_row < start_row:
+            return
+        column_range = self.ws.range(f"{col_letter}{start_row}:{col_letter}{last_row}")
+        negated, numeric = self.negate_numbers(column_range.options(ndim=1).value)
+
+        # Contiguous runs of numeric cells as [start, end) offsets
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], numeric.astype(np.int8), [0]))))
+        for run_start, run_end in zip(edges[::2], edges[1::2]):
+            target = self.ws.range(f"{col_letter}{start_row + run_start}:{col_letter}{start_row + run_end - 1}")
+            target.value = [[value] for value in negated[run_start:run_end]]
+
     def process_single_file(self):
         """Process a single CuMinus file"""
         start_row = 2
         header_row = 1
-        data_columns = self.find_date_column(header_row)
+        headers = self.header_values(header_row)
+        data_columns = self.find_date_column(header_row, headers)
 
         total_valoare_cols = []
 
@@ -96,8 +150,7 @@ class ValoareMinus(ExcelProcessor):
             self.format_date_column(col_letter, start_row)
         columns_name = "Valoare".lower()
         # Find all columns that contain "Total Valoare" in row 3
-        for col in range(1, self.ws.used_range.columns.count + 1):
-            cell_value = self.ws.cells(header_row, col).value
+        for col, cell_value in enumerate(headers, start=1):
             if cell_value and isinstance(cell_value, str) and columns_name in cell_value.strip().lower():
                 total_valoare_cols.append(self.col_index_to_letter(col))
                 print("Column Val found")
@@ -105,9 +158,13 @@ class ValoareMinus(ExcelProcessor):
 
         # Process each "Total Valoare" column
         for col_letter in total_valoare_cols:
-            last_row = self.get_last_row(col_letter, start_row)  # Get last row for current column
+            last_row = self.get_last_row(col_letter, start_row, bulk=self.bulk)  # Get last row for current column
 
             try:
+                if self.bulk:
+                    self.negate_column_bulk(col_letter, start_row, last_row)
+                    continue
+
                 for row_num in range(start_row, last_row + 1):
                     cell = self.ws.cells(row_num, col_letter)
                     # print(f"Row {row_num} | Original value: {cell.value}")
@@ -118,6 +175,109 @@ class ValoareMinus(ExcelProcessor):
                 pass
 
 
+    def process_files_headless(self):
+        """Process all Cu Minus files with openpyxl, without starting Excel"""
+        self.create_folders()
+
+        for file in os.listdir(self.input_folder):
+            if file.endswith('.xlsx'):
+                input_path = os.path.join(self.input_folder, file)
+                output_path = os.path.join(self.output_folder, "Minus--" + file)
+                if self.is_file_processed(input_path):
+                    print(f"Skipping unchanged file: {file}")
+                    continue
+                try:
+                    self.process_file_headless(input_path, output_path)
+                    self.mark_file_processed(input_path, output_path)
+                    print(f"[green]Saved processed file to {output_path}[/green]")
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+
+    def process_file_headless(self, input_path, output_path):
+        """Make the edits of process_single_file with openpyxl and save the result.
+
+        Cells are read with their calculated values, as xlwings sees them, and
+        only the cells process_single_file rewrites lose their formulas.
+        """
+        from openpyxl import load_workbook
+
+        start_row = 2
+        header_row = 1
+
+        workbook = load_workbook(input_path)
+        sheet = workbook.worksheets[0]
+        values = self._calculated_values(input_path)
+
+        def value(row, col):
+            row_values = values[row - 1] if row <= len(values) else ()
+            return row_values[col - 1] if col <= len(row_values) else None
+
+        headers = [value(header_row, col) for col in range(1, sheet.max_column + 1)]
+        last_used_row = sheet.max_row
+
+        date_name = "Data Ultimei Incasari".lower()
+        date_normalizer = DateNormalizer()
+        for col, header in enumerate(headers, start=1):
+            if not (isinstance(header, str) and date_name in header.strip().lower()):
+                continue
+            print("Column date found")
+            rows = [row for row in range(start_row, last_used_row + 1) if value(row, col) is not None]
+            formatted = date_normalizer.normalize(pd.Series([value(row, col) for row in rows], dtype=object))
+            for row, new_value in zip(rows, formatted):
+                # Excel stores digit-only text assigned through xlwings as a number
+                if isinstance(new_value, str) and new_value.isdigit():
+                    new_value = int(new_value)
+                cell = sheet.cell(row=row, column=col)
+                cell.value = new_value
+                cell.number_format = 'General'
+                self._set_value(values, row, col, new_value)
+            print(f"[green]Date formatting completed for column {self.col_index_to_letter(col)}[/green]")
+
+        value_name = "Valoare".lower()
+        for col, header in enumerate(headers, start=1):
+            if not (header and isinstance(header, str) and value_name in header.strip().lower()):
+                continue
+            print("Column Val found")
+            # Same bound as get_last_row: the first empty cell, at most 10,000 rows down
+            end_row = min(last_used_row, start_row + 10000 - 1)
+            for row in range(start_row, end_row + 1):
+                current = value(row, col)
+                if current is None:
+                    break
+                if isinstance(current, (int, float)):
+                    sheet.cell(row=row, column=col).value = -current
+
+        workbook.save(output_path)
+        workbook.close()
+
+    @staticmethod
+    def _calculated_values(input_path):
+        """Rows of cell values with formulas replaced by their last calculated results"""
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(input_path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            sheet.reset_dimensions()
+            return [list(row) for row in sheet.iter_rows(values_only=True)]
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def _set_value(values, row, col, new_value):
+        row_values = values[row - 1]
+        if col > len(row_values):
+            row_values.extend([None] * (col - len(row_values)))
+        row_values[col - 1] = new_value
+
+
 if __name__ == "__main__":
-    processor = ValoareMinus()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Negate the Valoare columns of the files in C:/in/minus")
+    parser.add_argument("--engine", choices=ValoareMinus.BATCH_ENGINES, default="auto",
+                        help="xlwings drives Excel; openpyxl runs without it")
+    args = parser.parse_args()
+
+    processor = ValoareMinus(batch_engine=args.engine)
     processor.process_files()
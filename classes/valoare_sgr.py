@@ -1,7 +1,7 @@
-import pandas as pd
-import numpy as np
-from openpyxl.utils import get_column_letter, column_index_from_string
+from classes.column_rules import Add, ColumnRules, MissingColumnsError, Scale, StripText, Subtract, ToNumeric
+from classes.processor_registry import register_processor
 
+@register_processor('sgr', label='SGR')
 class SGRValueProcessor:
     FILE_CONFIGS = {
         'M1': {'subtract_from': 'Unnamed: 5', 'subtract_this': 'Unnamed: 20'},
@@ -9,19 +9,39 @@ class SGRValueProcessor:
         'M3': {'subtract_from': 'Unnamed: 5', 'subtract_this': 'Unnamed: 18'},
         'AMT': {'subtract_from':'Unnamed: 5', 'subtract_this': 'Unnamed: 18'}
     }
+
+    # Backend used to read input workbooks (see ExcelReader.ENGINES)
+    reader_engine = "auto"
+
+    # Each output row depends on its input row only
+    row_local = True
+
+    # Columns an input must hold to be routed here (see schema_sniffer). The
+    # reports have no header text, so this is their blank header row from
+    # column A out to the column each file type subtracts
+    schemas = [{f"Unnamed: {i}" for i in range(int(config['subtract_this'].split(': ')[1]) + 1)}
+               for config in FILE_CONFIGS.values()]
+
+    # Compact dtype mode (see compact_dtypes): the rules convert what they compute on themselves
+    category_columns = ()
+    exact_columns = ()
+
+    def column_filter(self):
+        """Read every column: the FILE_CONFIGS columns are computed on, but the whole sheet is written back"""
+        return None
     
+    def column_formats(self):
+        """No number formats beyond the defaults"""
+        return None
+
     def get_file_type(self, filename):
         """Determine file type based on filename."""
-        for file_type in self.FILE_CONFIGS:
-            if file_type in filename:
-                return file_type
-        return None
-    
-    def format_date_column_simple(self, df, column_name):
-        """Format date column by removing forward slashes."""
-        if column_name in df.columns:
-            df[column_name] = df[column_name].astype(str).str.replace('/', '', regex=False)
-        return df
+        file_types = self.get_file_types(filename)
+        return file_types[0] if file_types else None
+
+    def get_file_types(self, filename):
+        """Every file type named in filename, in FILE_CONFIGS order"""
+        return [file_type for file_type in self.FILE_CONFIGS if file_type in filename]
     
     def process_dataframe(self, df):
         """Process the DataFrame and return the modified DataFrame"""
@@ -29,62 +49,73 @@ class SGRValueProcessor:
         
         # Get the filename from the DataFrame if it exists
         filename = getattr(df, 'name', '')
-        file_type = self.get_file_type(filename)
+        file_types = self.get_file_types(filename)
         
-        if not file_type:
+        if not file_types:
             print(f"No matching file type found for {filename}")
             return df
         
-        config = self.FILE_CONFIGS[file_type]
-        print(f"File type: {file_type}, Config: {config}")
+        for file_type in file_types:
+            print(f"File type: {file_type}, Config: {self.FILE_CONFIGS[file_type]}")
         
         # Check if required columns exist
-        if config['subtract_from'] not in df.columns or config['subtract_this'] not in df.columns:
+        try:
+            plan = self.rules_for(tuple(file_types)).compile(df.columns)
+        except MissingColumnsError:
             print(f"Required columns not found. Available columns: {list(df.columns)}")
             return df
         
-        # Create a copy of the dataframe to avoid modifying the original
-        result_df = df.copy()
-        
-        # Format date column D if it exists
-        if 'D' in result_df.columns:
-            result_df = self.format_date_column_simple(result_df, 'D')
-        
-        # Calculate Fara SGR values
-        subtract_from_col = config['subtract_from']
-        subtract_this_col = config['subtract_this']
-        
-        # Ensure numeric values for calculation
-        result_df[subtract_from_col] = pd.to_numeric(result_df[subtract_from_col], errors='coerce')
-        result_df[subtract_this_col] = pd.to_numeric(result_df[subtract_this_col], errors='coerce')
-        
-        # Find the position to insert the new column (after subtract_from column)
-        cols = list(result_df.columns)
-        insert_pos = cols.index(subtract_from_col) + 1
-        
-        # Calculate Fara SGR = subtract_from - subtract_this
-        fara_sgr_values = result_df[subtract_from_col] - result_df[subtract_this_col]
-        
-        # Insert the new column at the correct position
-        cols.insert(insert_pos, 'Fara SGR')
-        result_df = result_df.reindex(columns=cols)
-        result_df['Fara SGR'] = fara_sgr_values
-        
-        # Apply formula to column H if it exists
-        if 'H' in result_df.columns and 'I' in result_df.columns:
-            result_df = self.apply_formula_to_column_H(result_df)
+        # The rules replace and insert whole columns, so a shallow copy keeps the original intact
+        result_df = plan.run(df.copy(deep=False))
         
         print("SGR processing completed")
         return result_df
-    
-    def apply_formula_to_column_H(self, df):
-        """Apply the formula =(I/11%)+I to column H"""
-        if 'I' in df.columns:
-            # Ensure column I is numeric
-            df['I'] = pd.to_numeric(df['I'], errors='coerce')
-            # Apply the formula: (I/0.11) + I
-            df['H'] = (df['I'] / 0.11) + df['I']
-        return df
+
+    @classmethod
+    def rules_for(cls, file_types):
+        """Column rules of a file named after file_types.
+
+        A file named after several types gets every type's 'Fara SGR' column,
+        labelled with its type, from one combined pass over the sheet; the
+        rules the types share (column D, the numeric conversions, column H)
+        run once.
+        """
+        if len(file_types) == 1:
+            return cls.RULES[file_types[0]]
+        rules = cls._COMBINED_RULES.get(file_types)
+        if rules is None:
+            rule_sets = []
+            after = None
+            for file_type in file_types:
+                target = f'Fara SGR {file_type}'
+                rule_sets.append(cls.file_type_rules(cls.FILE_CONFIGS[file_type], target=target, after=after))
+                after = target
+            # Another thread may have combined them meanwhile; either result is the same
+            rules = cls._COMBINED_RULES.setdefault(file_types, ColumnRules.combine(*rule_sets))
+        return rules
+
+    @staticmethod
+    def file_type_rules(config, target='Fara SGR', after=None):
+        """Column rules of one file type; the difference goes in target, after subtract_from unless given"""
+        subtract_from, subtract_this = config['subtract_from'], config['subtract_this']
+        return ColumnRules(
+            # Dates in column D lose their slashes
+            StripText('D', '/', when=('D',)),
+            ToNumeric(subtract_from),
+            ToNumeric(subtract_this),
+            Subtract(target, subtract_from, subtract_this, after=after or subtract_from),
+            # Column H gets the formula =(I/11%)+I
+            ToNumeric('I', when=('H', 'I')),
+            Scale('H', 'I', divisor=0.11, when=('H', 'I')),
+            Add('H', 'H', 'I', when=('H', 'I')),
+        )
+
+
+# Compiled per header on first use
+SGRValueProcessor.RULES = {file_type: SGRValueProcessor.file_type_rules(config)
+                           for file_type, config in SGRValueProcessor.FILE_CONFIGS.items()}
+# Combinations of file types -> their combined rules, built on first use
+SGRValueProcessor._COMBINED_RULES = {}
 
 def main():
     # This main function is for standalone testing
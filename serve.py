@@ -0,0 +1,131 @@
+"""Production entry point: the app behind a multi-worker WSGI server.
+
+    python serve.py
+    python serve.py --workers 4 --threads 8 --port 8080
+
+Where gunicorn is installed (Linux, macOS) it runs the app in pre-forked
+worker processes. pandas, the Excel backends and every processor are imported
+once in the master before it forks, so the workers share those pages
+copy-on-write instead of each importing them on its first request. On Windows,
+or without gunicorn, it falls back to waitress: one process with a thread
+pool. Defaults come from app_info (address) and the SERVER_* settings in
+server.py, which the EXCEL_PROCESSOR_ environment variables override.
+`python server.py` remains the development server.
+
+Each gunicorn worker keeps its own counters: /metrics and the hit and miss
+counts of /cache/stats describe only the worker that answered the request
+(/cache/stats reports its pid). The result cache's entries and size are read
+from its shared directory, so they hold for the whole server.
+"""
+import argparse
+import gc
+import importlib
+import importlib.util
+import multiprocessing
+import os
+import sys
+
+from app_info import APP_NAME, DEFAULT_HOST, DEFAULT_PORT, __version__
+
+SERVERS = ("auto", "gunicorn", "waitress")
+# Imported in the master so the workers inherit them; the optional ones when installed
+PRELOAD_MODULES = ["pandas", "openpyxl", "xlsxwriter", "classes.excel_reader", "classes.excel_writer",
+                   "classes.compact_dtypes", "classes.schema_sniffer"]
+OPTIONAL_PRELOAD_MODULES = ["python_calamine"]
+
+
+def preload(app):
+    """Import everything requests use and create every processor, as the workers would on first use"""
+    from classes import processor_registry
+    from classes.upload_pipeline import enable_copy_on_write
+
+    for module in PRELOAD_MODULES:
+        importlib.import_module(module)
+    for module in OPTIONAL_PRELOAD_MODULES:
+        if importlib.util.find_spec(module) is not None:
+            importlib.import_module(module)
+    if app.config['COMPACT_DTYPES'] and importlib.util.find_spec("pyarrow") is not None:
+        importlib.import_module("pyarrow")
+    processor_registry.warm_up()
+    # Set once in the master; the forked workers inherit it
+    enable_copy_on_write()
+    # Objects that exist now are never collected, so the collector does not
+    # write to (and unshare) their pages in the workers
+    gc.freeze()
+
+
+def resolve_server(name: str) -> str:
+    """The server to run for name, 'auto' picking gunicorn where it can run"""
+    if name != "auto":
+        if importlib.util.find_spec(name) is None:
+            sys.exit(f"{name} is not installed: pip install {name}")
+        return name
+    if os.name != "nt" and importlib.util.find_spec("gunicorn") is not None:
+        return "gunicorn"
+    if importlib.util.find_spec("waitress") is not None:
+        return "waitress"
+    sys.exit("No production server installed: pip install gunicorn (Linux, macOS) or waitress (Windows)")
+
+
+def run_gunicorn(app, host: str, port: int, workers: int, threads: int, timeout: int):
+    from gunicorn.app.base import BaseApplication
+
+    class PreloadedApplication(BaseApplication):
+        """gunicorn running the already imported app instead of importing it by name"""
+
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("worker_class", "gthread" if threads > 1 else "sync")
+            self.cfg.set("timeout", timeout)
+            self.cfg.set("preload_app", True)
+
+        def load(self):
+            return app
+
+    PreloadedApplication().run()
+
+
+def run_waitress(app, host: str, port: int, threads: int):
+    from waitress import serve
+
+    serve(app, host=host, port=port, threads=threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on (default: %(default)s)")
+    parser.add_argument("--workers", type=int, help="worker processes, 0 for one per CPU core "
+                                                    "(default: SERVER_WORKERS)")
+    parser.add_argument("--threads", type=int, help="threads per worker (default: SERVER_THREADS)")
+    parser.add_argument("--timeout", type=int, help="seconds a request may take (default: SERVER_TIMEOUT)")
+    parser.add_argument("--server", choices=SERVERS, default="auto", help="WSGI server (default: %(default)s)")
+    args = parser.parse_args()
+
+    from server import app
+
+    requested_workers = args.workers if args.workers is not None else app.config['SERVER_WORKERS']
+    workers = requested_workers or os.cpu_count() or 1
+    threads = args.threads or app.config['SERVER_THREADS']
+    timeout = args.timeout or app.config['SERVER_TIMEOUT']
+    server = resolve_server(args.server)
+
+    preload(app)
+    if server == "gunicorn":
+        print(f"{APP_NAME} {__version__} on http://{args.host}:{args.port}: "
+              f"gunicorn, {workers} workers x {threads} threads")
+        run_gunicorn(app, args.host, args.port, workers, threads, timeout)
+    else:
+        if requested_workers > 1:
+            print("waitress serves from a single process: --workers is ignored "
+                  "(PROCESS_WORKERS still spreads multi-file uploads over processes)")
+        print(f"{APP_NAME} {__version__} on http://{args.host}:{args.port}: waitress, {threads} threads")
+        run_waitress(app, args.host, args.port, threads)
+
+
+if __name__ == "__main__":
+    # Needed for the process pool in the packaged executable
+    multiprocessing.freeze_support()
+    main()
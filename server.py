@@ -1,79 +1,241 @@
-from flask import Flask, render_template, request, send_file
-import pandas as pd
+from flask import Flask, Request, Response, jsonify, render_template, request, send_file, stream_with_context, url_for
 import io
+import itertools
+import os
+import tempfile
 import traceback
 import zipfile  # Add this import
+import multiprocessing
+from urllib.parse import quote
 
 try:
     # Import the processor modules
-    from classes.valoare_sgr import SGRValueProcessor
-    from classes.valoare_minus import ValoareMinus
-    from classes.format_add_column import FormatAddColumn
-    from classes.excel_data_extractor import ExcelDataExtractor
+    from classes import instrumentation, processor_registry, schema_sniffer
+    from classes.upload_pipeline import enable_copy_on_write, iter_processed_uploads, process_uploads, stream_zip
+    from classes.result_cache import ResultCache
+    from classes.job_queue import JobQueue
+    from classes.upload_spool import UploadSpool
 except Exception as e:
     print(f"Error importing modules: {str(e)}")
 app = Flask(__name__)
+# Number of worker processes used for multi-file uploads (1 = process in the request thread)
+app.config['PROCESS_WORKERS'] = 1
+# Stream multi-file results into the zip response as each file finishes
+app.config['STREAM_ZIP'] = True
+# Processed workbooks are kept here and served again for identical re-uploads
+app.config['RESULT_CACHE_DIR'] = os.path.join(tempfile.gettempdir(), 'excel_processor_cache')
+# Size budget of the result cache in bytes (0 disables it)
+app.config['RESULT_CACHE_MAX_BYTES'] = 512 * 1024 * 1024
+# Seconds between rescans of the cache directory, which pick up the entries the
+# other server processes wrote or evicted
+app.config['RESULT_CACHE_RESCAN_SECONDS'] = 60
+# Uploads at least this large are processed in bounded chunks by the row-local
+# process types (minus, sgr, extract); 0 disables streaming
+app.config['STREAM_PROCESS_MIN_BYTES'] = 20 * 1024 * 1024
+# Hold parsed sheets with categorical and Arrow string columns instead of Python
+# objects: less memory per file for some extra time (see compact_dtypes). Uploads
+# of at least STREAM_PROCESS_MIN_BYTES are then also read in chunks by every
+# process type, which bounds the memory the read itself peaks at
+app.config['COMPACT_DTYPES'] = False
+# Uploaded files are written here while the request is read, unless the whole
+# request is at most UPLOAD_MEMORY_MAX_BYTES; they are removed with the request,
+# or once processed for streamed zips and background jobs
+app.config['UPLOAD_SPOOL_DIR'] = os.path.join(tempfile.gettempdir(), 'excel_processor_uploads')
+app.config['UPLOAD_MEMORY_MAX_BYTES'] = 1024 * 1024
+# Background jobs (POST /jobs) run on this many threads
+app.config['JOB_WORKERS'] = 2
+# Finished job results are kept here for JOB_RESULT_TTL seconds
+app.config['JOB_RESULT_DIR'] = os.path.join(tempfile.gettempdir(), 'excel_processor_jobs')
+app.config['JOB_RESULT_TTL'] = 60 * 60
+# Production server (serve.py): worker processes (0 = one per CPU core), threads
+# per worker, and seconds a request may take before its worker is restarted
+app.config['SERVER_WORKERS'] = 0
+app.config['SERVER_THREADS'] = 4
+app.config['SERVER_TIMEOUT'] = 300
+# Extra modules registering process types (see processor_registry.register_processor)
+app.config['PROCESSOR_MODULES'] = []
+# Create every processor at startup instead of on first use of its process type;
+# a slower start for a faster first request
+app.config['PRELOAD_PROCESSORS'] = False
+# Write Adaos amounts as numeric cells formatted '#,##0.00', keeping each TVA
+# rate's rows in input order, instead of the text cells of earlier versions
+app.config['ADAOS_TYPED'] = False
+# Overridable from the environment, e.g. EXCEL_PROCESSOR_PROCESS_WORKERS=4
+app.config.from_prefixed_env('EXCEL_PROCESSOR')
+
+# Processors are created once, on first use unless preloaded, and shared by all requests
+processor_registry.load_processor_modules(app.config['PROCESSOR_MODULES'])
+processor_registry.configure('adaos', typed=app.config['ADAOS_TYPED'])
+if app.config['PRELOAD_PROCESSORS']:
+    processor_registry.warm_up()
+
+result_cache = None
+job_queue = None
+upload_spool = None
+
+def get_result_cache():
+    """The shared result cache, created on first use; None when disabled"""
+    global result_cache
+    if result_cache is None and app.config['RESULT_CACHE_MAX_BYTES'] > 0:
+        result_cache = ResultCache(app.config['RESULT_CACHE_DIR'], app.config['RESULT_CACHE_MAX_BYTES'],
+                                   app.config['RESULT_CACHE_RESCAN_SECONDS'])
+    return result_cache
+
+def get_job_queue():
+    """The shared background job queue, created on first use"""
+    global job_queue
+    if job_queue is None:
+        job_queue = JobQueue(app.config['JOB_RESULT_DIR'], workers=app.config['JOB_WORKERS'],
+                             ttl=app.config['JOB_RESULT_TTL'])
+    return job_queue
+
+def get_upload_spool():
+    """The shared upload spool, created on first use"""
+    global upload_spool
+    if upload_spool is None:
+        upload_spool = UploadSpool(app.config['UPLOAD_SPOOL_DIR'], app.config['UPLOAD_MEMORY_MAX_BYTES'])
+    return upload_spool
+
+class SpoolingRequest(Request):
+    """Request writing each uploaded file straight to the upload spool instead of holding it in memory"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = get_upload_spool().stream(total_content_length)
+        self.__dict__.setdefault('spool_streams', []).append(stream)
+        return stream
+
+    def close(self):
+        super().close()
+        # Spool files not detached (see detached_results) go away with the request
+        UploadSpool.release(self.__dict__.get('spool_streams', []))
+
+app.request_class = SpoolingRequest
+
+def read_uploads(files):
+    """(filename, SpooledUpload) for each uploaded Excel file, skipping other and empty files"""
+    uploads = []
+    for file in files:
+        # Check if the file has a valid Excel extension
+        if not (file.filename.endswith('.xlsx') or file.filename.endswith('.xls')):
+            print(f"Skipping non-Excel file: {file.filename}")
+            continue
+        # The size comes from the spooled file; nothing is read or copied here
+        upload = UploadSpool.adopt(file.stream)
+        if len(upload) == 0:
+            print(f"Skipping empty file: {file.filename}")
+            continue
+
+        uploads.append((file.filename, upload))
+    return uploads
+
+def detached_results(uploads, results):
+    """results, to be consumed after the request has ended: the uploads' spool files are kept until they are"""
+    for _, upload in uploads:
+        upload.detach()
+
+    def consume():
+        try:
+            yield from results
+        finally:
+            for _, upload in uploads:
+                upload.discard()
+    return consume()
+
+def add_server_timing(response, traces):
+    """Report each file's stage timings in the Server-Timing header.
+
+    Streamed zips send their headers before any file is processed, so only
+    /metrics covers them.
+    """
+    entries = [entry for trace in traces for entry in trace.server_timing()]
+    entries.append(f"total;dur={sum(trace.seconds for trace in traces) * 1000:.1f}")
+    response.headers['Server-Timing'] = ", ".join(entries)
+
+def selected_process_types():
+    """The process types picked in the request form, in order and without repeats; None if any is unknown.
+
+    'auto' routes each upload by its header and stands alone.
+    """
+    process_types = list(dict.fromkeys(request.form.getlist('process_type')))
+    if process_types == [schema_sniffer.AUTO]:
+        return process_types
+    if not process_types or not all(processor_registry.is_registered(process_type) for process_type in process_types):
+        return None
+    return process_types
+
+def rejection_message(rejected):
+    """Why every upload was turned away by the header check"""
+    return "No file can be processed: " + "; ".join(f"{name}: {reason}" for name, reason in rejected)
+
+# Added to the zip of a /process response when some uploads were turned away
+REJECTED_NOTE = "rejected_files.txt"
+
+def rejection_note(rejected) -> bytes:
+    """Contents of REJECTED_NOTE: one 'filename: reason' line per upload turned away"""
+    return "".join(f"{name}: {reason}\n" for name, reason in rejected).encode("utf-8")
+
+def add_rejected_header(response, rejected):
+    """List the uploads turned away by the header check in the X-Rejected-Files header.
+
+    Each 'filename: reason' entry is percent-encoded, as headers are latin-1.
+    """
+    if rejected:
+        response.headers['X-Rejected-Files'] = ", ".join(quote(f"{name}: {reason}", safe=" :")
+                                                         for name, reason in rejected)
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', process_types=processor_registry.labels())
 
 @app.route('/process', methods=['POST'])
 def process_file():
     files = request.files.getlist('file')  # Get all uploaded files
-    process_type = request.form['process_type']
-    
+    # Several process types run each file through all of them, parsing it once
+    process_types = selected_process_types()
+
+    if process_types is None:
+        return "Invalid process type", 400
+
     try:
-        outputs = []
-        filenames = []
-        for file in files:
-            # Check if the file has a valid Excel extension
-            if not (file.filename.endswith('.xlsx') or file.filename.endswith('.xls')):
-                print(f"Skipping non-Excel file: {file.filename}")
-                continue
-            # Check if the file is not empty
-            file.seek(0, io.SEEK_END)
-            file_length = file.tell()
-            file.seek(0)
-            if file_length == 0:
-                print(f"Skipping empty file: {file.filename}")
-                continue
-
-            try:
-                df = pd.read_excel(file, engine='openpyxl')
-                df.name = file.filename
-            
-                # Process the data based on the process_type
-                if process_type == 'adaos':
-                    processor = FormatAddColumn()
-                elif process_type == 'sgr':
-                    processor = SGRValueProcessor()
-                elif process_type == 'minus':
-                    processor = ValoareMinus()
-                elif process_type == 'extract':
-                    processor = ExcelDataExtractor()
-                else:
-                    return "Invalid process type", 400
-                
-                # Process the data
-                result_df = processor.process_dataframe(df)
-                
-                # Save the processed DataFrame to a BytesIO object
-                output = io.BytesIO()
-                result_df.to_excel(output, index=False, engine='openpyxl')
-                output.seek(0)
-                outputs.append(output)
-                # Save the filename for the zip
-                original_filename = file.filename
-                processed_filename = f"{process_type} - {original_filename}"
-                filenames.append(processed_filename)
-            except Exception as e:
-                print(f"Error reading {file.filename}: {e}")
-                continue
+        uploads = read_uploads(files)
+        # Only the headers are read: files of the wrong layout fail here, before the full parse
+        uploads, routes, rejected = schema_sniffer.route_uploads(process_types, uploads)
+        if rejected and not uploads:
+            return rejection_message(rejected), 400
+
+        workers = app.config['PROCESS_WORKERS']
+        cache = get_result_cache()
+        stream_min_bytes = app.config['STREAM_PROCESS_MIN_BYTES']
+        compact = app.config['COMPACT_DTYPES']
+        if app.config['STREAM_ZIP'] and sum(len(modes) for modes in routes) > 1:
+            # The download starts with the first finished file; the archive is never held in memory
+            results = iter_processed_uploads(process_types, uploads, workers=workers, cache=cache,
+                                             stream_min_bytes=stream_min_bytes, routes=routes, compact=compact)
+            # Processing happens while the response is sent, after the request is closed
+            results = detached_results(uploads, results)
+            if rejected:
+                results = itertools.chain(results, [(REJECTED_NOTE, rejection_note(rejected))])
+            response = Response(
+                stream_with_context(stream_zip(results)),
+                mimetype='application/zip',
+                headers={'Content-Disposition': 'attachment; filename=processed_files.zip'}
+            )
+            add_rejected_header(response, rejected)
+            return response
+
+        # Read, process and write each file, in parallel when workers are configured
+        traces = []
+        results = process_uploads(process_types, uploads, workers=workers, cache=cache,
+                                  stream_min_bytes=stream_min_bytes, traces=traces, routes=routes, compact=compact)
+        outputs = [io.BytesIO(data) for _, data in results]
+        filenames = [fname for fname, _ in results]
 
         # These lines should be OUTSIDE the for loop!
         if len(outputs) == 1:
-            return send_file(outputs[0], download_name=filenames[0], as_attachment=True)
+            response = send_file(outputs[0], download_name=filenames[0], as_attachment=True)
+            add_server_timing(response, traces)
+            add_rejected_header(response, rejected)
+            return response
         
         # If multiple files, zip them
         zip_buffer = io.BytesIO()
@@ -81,12 +243,101 @@ def process_file():
             for output, fname in zip(outputs, filenames):
                 output.seek(0)
                 zipf.writestr(fname, output.read())
+            if rejected:
+                zipf.writestr(REJECTED_NOTE, rejection_note(rejected))
         zip_buffer.seek(0)
-        return send_file(zip_buffer, download_name="processed_files.zip", as_attachment=True, mimetype='application/zip')
+        response = send_file(zip_buffer, download_name="processed_files.zip", as_attachment=True, mimetype='application/zip')
+        add_server_timing(response, traces)
+        add_rejected_header(response, rejected)
+        return response
         
     except Exception as e:
         traceback.print_exc()
         return f"An error occurred: {str(e)}", 500
 
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue the uploads for processing in the background; poll GET /jobs/<id> for progress"""
+    process_types = selected_process_types()
+    if process_types is None:
+        return jsonify({"error": "Invalid process type"}), 400
+
+    uploads = read_uploads(request.files.getlist('file'))
+    if not uploads:
+        return jsonify({"error": "No Excel files uploaded"}), 400
+    uploads, routes, rejected = schema_sniffer.route_uploads(process_types, uploads)
+    if not uploads:
+        return jsonify({"error": rejection_message(rejected),
+                        "rejected": [{"name": name, "reason": reason} for name, reason in rejected]}), 400
+
+    # Captured now: the job runs outside the request and app context
+    workers = app.config['PROCESS_WORKERS']
+    cache = get_result_cache()
+    stream_min_bytes = app.config['STREAM_PROCESS_MIN_BYTES']
+    compact = app.config['COMPACT_DTYPES']
+
+    # The job outlives the request, so it takes over the spool files
+    results = detached_results(uploads, iter_processed_uploads(
+        process_types, uploads, workers=workers, cache=cache, stream_min_bytes=stream_min_bytes, routes=routes,
+        compact=compact))
+
+    def runner():
+        return results
+
+    job = get_job_queue().submit(process_types, [filename for filename, _ in uploads], runner,
+                                 routes=routes, rejected=rejected)
+    return jsonify({"id": job.id, "status_url": url_for('job_status', job_id=job.id),
+                    "rejected": job.to_dict()["rejected"]}), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    status = job.to_dict()
+    if job.status == 'done':
+        status['result_url'] = url_for('job_result', job_id=job.id)
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    if job.status != 'done':
+        return jsonify({"error": f"Job is {job.status}"}), 409
+    return send_file(job.result_path, download_name=job.result_name, as_attachment=True,
+                     mimetype=job.result_mimetype)
+
+@app.route('/cache/stats')
+def cache_stats():
+    cache = get_result_cache()
+    if cache is None:
+        return jsonify({"enabled": False})
+    # hits and misses are this process's; entries and bytes cover the shared directory
+    return jsonify({"enabled": True, "pid": os.getpid(), **cache.stats()})
+
+@app.route('/metrics')
+def metrics():
+    """Stage timings, row and byte counts of the processed files, in the Prometheus text format.
+
+    The counts are those of the server process that answers; see serve.py.
+    """
+    extra = {}
+    cache = get_result_cache()
+    if cache is not None:
+        stats = cache.stats()
+        extra['excel_processor_result_cache_hits_total'] = (
+            "counter", "Uploads answered from the result cache" + instrumentation.Metrics.SCOPE, stats['hits'])
+        extra['excel_processor_result_cache_misses_total'] = (
+            "counter", "Uploads not found in the result cache" + instrumentation.Metrics.SCOPE, stats['misses'])
+        extra['excel_processor_result_cache_bytes'] = (
+            "gauge", "Size of the result cache directory, shared by the server processes", stats['bytes'])
+    return Response(instrumentation.metrics.render(extra), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
+    # Development server; serve.py runs the app in production
+    # Needed for the process pool in the packaged executable
+    multiprocessing.freeze_support()
+    enable_copy_on_write()
     app.run(debug=True, host='0.0.0.0')
\ No newline at end of file
@@ -8,59 +8,94 @@ document.addEventListener('DOMContentLoaded', () => {
     return;
   }
 
+  const statusEl = document.getElementById('status');
+  const POLL_INTERVAL_MS = 1000;
+
+  function showStatus(text) {
+    if (statusEl) statusEl.textContent = text;
+  }
+
+  function progressText(job) {
+    let text = `${job.done + job.failed} / ${job.total} files processed`;
+    if (job.failed) text += ` (${job.failed} failed)`;
+    if (job.rejected && job.rejected.length) {
+      text += `; rejected ${job.rejected.map(file => `${file.name}: ${file.reason}`).join('; ')}`;
+    }
+    return text;
+  }
+
+  // Poll the job until it finishes; resolves with the finished job, rejects if it failed
+  function pollJob(statusUrl) {
+    return new Promise((resolve, reject) => {
+      const poll = () => {
+        fetch(statusUrl)
+          .then(response => response.json().then(body => {
+            if (!response.ok) throw new Error(body.error || 'Network response was not OK');
+            return body;
+          }))
+          .then(job => {
+            if (job.status === 'done') return resolve(job);
+            if (job.status === 'failed') throw new Error(job.error || 'Processing failed');
+            showStatus(job.status === 'queued' ? 'Waiting in queue...' : progressText(job));
+            setTimeout(poll, POLL_INTERVAL_MS);
+          })
+          .catch(reject);
+      };
+      poll();
+    });
+  }
+
   processBtn.addEventListener('click', () => {
     const files = fileInput.files;
-    const processType = document.querySelector('input[name="process_type"]:checked').value;
+    // Every checked mode runs on each file; the file is parsed once
+    let processTypes = Array.from(document.querySelectorAll('input[name="process_type"]:checked'), input => input.value);
+    // Auto routes each file by its columns and can't be combined with other modes
+    if (processTypes.includes('auto')) processTypes = ['auto'];
     console.log('Clicked');
     if (!files.length) {
       alert('Please select a file.');
       return;
     }
+    if (!processTypes.length) {
+      alert('Please select at least one mode.');
+      return;
+    }
   
     const formData = new FormData();
     // Append all files to support multiple file uploads
     for (let i = 0; i < files.length; i++) {
         formData.append('file', files[i]);
     }
-    formData.append('process_type', processType);
+    processTypes.forEach(processType => formData.append('process_type', processType));
   
-    fetch('/process', {
+    processBtn.disabled = true;
+    showStatus('Uploading...');
+
+    fetch('/jobs', {
       method: 'POST',
       body: formData
     })
-    .then(response => {
-      if (!response.ok) throw new Error('Network response was not OK');
-      
-      // Extract filename from Content-Disposition header
-      const disposition = response.headers.get('Content-Disposition');
-      let filename = files[0].name; // fallback to original filename
-      
-      if (disposition) {
-        // More robust filename extraction
-        const filenameMatch = disposition.match(/filename\*?=['"]?(?:UTF-\d['"]*)?([^;\r\n"']*)['"]?;?/i);
-        if (filenameMatch && filenameMatch[1]) {
-          filename = filenameMatch[1];
-          console.log('Extracted filename:', filename);
-        }
-      }
-      
-      return response.blob().then(blob => ({ blob, filename }));
-    })
-    .then(({ blob, filename }) => {
-      const url = window.URL.createObjectURL(blob);
+    .then(response => response.json().then(body => {
+      if (!response.ok) throw new Error(body.error || 'Network response was not OK');
+      return body;
+    }))
+    .then(job => pollJob(job.status_url))
+    .then(job => {
+      showStatus(progressText(job));
+      // The result is sent as an attachment, so following the link downloads it
       const a = document.createElement('a');
-      a.href = url;
-      a.download = filename;
+      a.href = job.result_url;
       document.body.appendChild(a);
       a.click();
-      setTimeout(() => {
-        document.body.removeChild(a);
-        window.URL.revokeObjectURL(url);
-      }, 100);
+      setTimeout(() => document.body.removeChild(a), 100);
     })
     .catch(err => {
       console.error('Error processing file:', err);
+      showStatus('');
       alert('Error processing file: ' + err.message);
+    })
+    .finally(() => {
+      processBtn.disabled = false;
     });
   });
 });
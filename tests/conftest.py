@@ -0,0 +1,39 @@
+import io
+import os
+import sys
+import zipfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+# Every request processes its uploads instead of answering from an earlier run's cache
+os.environ.setdefault("EXCEL_PROCESSOR_RESULT_CACHE_MAX_BYTES", "0")
+
+
+def workbook_bytes(df) -> bytes:
+    """df written as an xlsx upload"""
+    from classes.excel_writer import ExcelWriter
+
+    output = io.BytesIO()
+    ExcelWriter.write_frame(df, output)
+    return output.getvalue()
+
+
+def workbook_parts(data: bytes):
+    """The parts of an xlsx file by name, less docProps/core.xml, which holds the time it was written"""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        return {name: archive.read(name) for name in archive.namelist() if name != "docProps/core.xml"}
+
+
+@pytest.fixture
+def case_workbook():
+    """Bytes of the benchmark workbook of a case (see benchmarks/workbooks.py) with the given rows"""
+    from workbooks import CASES
+
+    def make(case, rows=50, seed=0):
+        _, _, generate = CASES[case]
+        return workbook_bytes(generate(rows, seed))
+    return make
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from classes.date_normalizer import DateNormalizer
+from classes.valoare_minus import ValoareMinus
+from classes.valoare_sgr import SGRValueProcessor
+
+SGR_FILENAMES = ["Vanzari M1.xlsx", "Vanzari M2.xlsx", "Vanzari M3.xlsx", "Vanzari AMT.xlsx", "Vanzari.xlsx"]
+
+
+def legacy_sgr(df, filename):
+    """SGRValueProcessor.process_dataframe as it was before the column rules"""
+    configs = SGRValueProcessor.FILE_CONFIGS
+    file_type = next((file_type for file_type in configs if file_type in filename), None)
+    if not file_type:
+        return df
+    subtract_from, subtract_this = configs[file_type]['subtract_from'], configs[file_type]['subtract_this']
+    if subtract_from not in df.columns or subtract_this not in df.columns:
+        return df
+    result_df = df.copy()
+    if 'D' in result_df.columns:
+        result_df['D'] = result_df['D'].astype(str).str.replace('/', '', regex=False)
+    result_df[subtract_from] = pd.to_numeric(result_df[subtract_from], errors='coerce')
+    result_df[subtract_this] = pd.to_numeric(result_df[subtract_this], errors='coerce')
+    cols = list(result_df.columns)
+    fara_sgr_values = result_df[subtract_from] - result_df[subtract_this]
+    cols.insert(cols.index(subtract_from) + 1, 'Fara SGR')
+    result_df = result_df.reindex(columns=cols)
+    result_df['Fara SGR'] = fara_sgr_values
+    if 'H' in result_df.columns and 'I' in result_df.columns:
+        result_df['I'] = pd.to_numeric(result_df['I'], errors='coerce')
+        result_df['H'] = (result_df['I'] / 0.11) + result_df['I']
+    return result_df
+
+
+def legacy_minus(df):
+    """ValoareMinus.process_dataframe as it was before the column rules"""
+    for column in ("Data Ultimei Incasari", "Valoare"):
+        if column not in df.columns:
+            raise KeyError(f"'{column}' not found in DataFrame columns.")
+    df["Data Ultimei Incasari"] = DateNormalizer(errors='coerce').normalize(df["Data Ultimei Incasari"])
+    df["Valoare"] = df["Valoare"].apply(lambda x: -x)
+    return df
+
+
+def random_column(rng, rows, pool):
+    """A column of rows values drawn from a random subset of pool, with the dtype a read would infer"""
+    kinds = rng.choice(len(pool), size=rng.integers(1, len(pool) + 1), replace=False)
+    return pd.Series([pool[i] for i in rng.choice(kinds, rows)], dtype=object).infer_objects()
+
+
+AMOUNTS = [0, 12, 3.5, -7.25, 1e6, np.nan, "4.5", "12", "n/a", ""]
+SGR_TEXT = ["01/02/2024", "2024/03/01", "fara", "", np.nan, 17, 2.5]
+
+
+def random_sgr_frame(rng):
+    rows = int(rng.integers(1, 30))
+    names = [f"Unnamed: {i}" for i in range(22)] + ["D", "H", "I"]
+    # Most frames hold every column, some lose the ones a layout needs
+    kept = [name for name in names if rng.random() < 0.9]
+    rng.shuffle(kept)
+    return pd.DataFrame({name: random_column(rng, rows, SGR_TEXT if name == "D" else AMOUNTS) for name in kept})
+
+
+def random_minus_frame(rng):
+    rows = int(rng.integers(1, 30))
+    dates = [pd.Timestamp("2024-03-01"), pd.Timestamp("2023-12-31 23:59"), "2024-02-29", "2024-02-29 08:30:00",
+             "01/02/2024", "31.12.2023", "", "not a date", np.nan]
+    amounts = [0, 12, -3, 2.75, np.nan, True, -1e9]
+    columns = {
+        "Cod Client": random_column(rng, rows, [1, 2, "C3"]),
+        "Data Ultimei Incasari": random_column(rng, rows, dates),
+        "Valoare": random_column(rng, rows, amounts),
+    }
+    return pd.DataFrame({name: values for name, values in columns.items() if rng.random() < 0.95})
+
+
+@pytest.mark.filterwarnings("ignore:Could not infer format")
+@pytest.mark.parametrize("seed", range(150))
+def test_sgr_rules_match_the_replaced_steps(seed):
+    rng = np.random.default_rng(seed)
+    df = random_sgr_frame(rng)
+    df.name = SGR_FILENAMES[seed % len(SGR_FILENAMES)]
+    expected = legacy_sgr(df.copy(), df.name)
+    actual = SGRValueProcessor().process_dataframe(df)
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+@pytest.mark.filterwarnings("ignore:Could not infer format")
+@pytest.mark.parametrize("seed", range(150))
+def test_minus_rules_match_the_replaced_steps(seed):
+    df = random_minus_frame(np.random.default_rng(seed))
+    try:
+        expected = legacy_minus(df.copy())
+    except KeyError as e:
+        with pytest.raises(KeyError, match=str(e.args[0])):
+            ValoareMinus().process_dataframe(df.copy())
+        return
+    pd.testing.assert_frame_equal(ValoareMinus().process_dataframe(df.copy()), expected)
+
+
+def test_combine_runs_shared_rules_once():
+    from classes.column_rules import Add, ColumnRules, Subtract
+
+    double = Add("a", "a", "a")
+    combined = ColumnRules.combine(ColumnRules(double, Subtract("b", "a", "c")), ColumnRules(Add("a", "a", "a")))
+    assert combined.rules == [double, Subtract("b", "a", "c")]
+    df = combined.apply(pd.DataFrame({"a": [1.0], "c": [0.5]}))
+    assert df.to_dict("list") == {"a": [2.0], "c": [0.5], "b": [1.5]}
+
+
+def test_file_named_after_several_types_gets_each_difference_in_one_pass():
+    from workbooks import sgr_frame
+
+    df = sgr_frame(30, seed=3)
+    df["D"], df["H"], df["I"] = "01/02/2024", 0.0, 1.1
+    combined = df.copy()
+    combined.name = "Vanzari M1 M3.xlsx"
+    combined = SGRValueProcessor().process_dataframe(combined)
+
+    singles = {}
+    for file_type in ("M1", "M3"):
+        single = df.copy()
+        single.name = f"Vanzari {file_type}.xlsx"
+        singles[file_type] = SGRValueProcessor().process_dataframe(single)
+    position = list(df.columns).index("Unnamed: 5") + 1
+    assert list(combined.columns[position:position + 2]) == ["Fara SGR M1", "Fara SGR M3"]
+    for file_type, single in singles.items():
+        pd.testing.assert_series_equal(combined[f"Fara SGR {file_type}"], single["Fara SGR"], check_names=False)
+    # Column H's formula is shared, so it is applied once, not once per type
+    pd.testing.assert_frame_equal(combined.drop(columns=["Fara SGR M1", "Fara SGR M3"]),
+                                  singles["M1"].drop(columns=["Fara SGR"]))
@@ -0,0 +1,70 @@
+import io
+from functools import partialmethod
+
+import pandas as pd
+import pytest
+
+from classes import processor_registry
+from classes.compact_dtypes import arrow_strings_available, compact_frame, string_dtype
+from classes.excel_reader import ExcelReader
+from classes.upload_pipeline import _read_compact, process_upload_modes
+from conftest import workbook_parts
+from workbooks import CASES
+
+
+def assert_same_workbooks(process_types, filename, data, **options):
+    normal = process_upload_modes(process_types, filename, data, **options)
+    compact = process_upload_modes(process_types, filename, data, compact=True, **options)
+    assert [name for name, _ in compact] == [name for name, _ in normal]
+    for (name, expected), (_, actual) in zip(normal, compact):
+        assert workbook_parts(actual) == workbook_parts(expected), name
+
+
+@pytest.mark.parametrize("case", list(CASES))
+@pytest.mark.parametrize("stream_min_bytes", [0, 1])
+def test_compact_mode_writes_the_same_workbooks(case_workbook, case, stream_min_bytes):
+    process_type, filename, _ = CASES[case]
+    assert_same_workbooks([process_type], filename, case_workbook(case, rows=300, seed=1),
+                          stream_min_bytes=stream_min_bytes)
+
+
+@pytest.mark.parametrize("stream_min_bytes", [0, 1])
+def test_compact_mode_writes_the_same_workbooks_for_several_modes(case_workbook, stream_min_bytes):
+    assert_same_workbooks(["sgr", "extract"], "Vanzari M1.xlsx", case_workbook("sgr-M1", rows=300, seed=1),
+                          stream_min_bytes=stream_min_bytes)
+
+
+@pytest.mark.parametrize("stream_min_bytes", [0, 1])
+def test_compact_mode_writes_the_same_workbooks_for_modes_that_do_not_stream(case_workbook, stream_min_bytes):
+    # adaos is not row-local, so with stream_min_bytes the sheet is read in compacted chunks
+    assert_same_workbooks(["adaos", "extract"], "Adaos receptii.xlsx", case_workbook("adaos", rows=300, seed=2),
+                          stream_min_bytes=stream_min_bytes)
+
+
+@pytest.mark.parametrize("case", list(CASES))
+def test_chunked_compact_read_holds_the_whole_read_values(case_workbook, case, monkeypatch):
+    process_type, _, _ = CASES[case]
+    processors = {process_type: processor_registry.get_processor(process_type)}
+    data = case_workbook(case, rows=250, seed=3)
+    # Several chunks, each compacted on its own
+    monkeypatch.setattr(ExcelReader, "read_chunks", partialmethod(ExcelReader.read_chunks, chunk_rows=60))
+    chunked = _read_compact(processors, data)
+
+    processor = processors[process_type]
+    whole = compact_frame(ExcelReader().read(io.BytesIO(data), usecols=processor.column_filter()),
+                          processor.category_columns, processor.exact_columns)
+    assert [str(dtype) for dtype in chunked.dtypes] == [str(dtype) for dtype in whole.dtypes]
+    pd.testing.assert_frame_equal(chunked.astype(object), whole.astype(object))
+
+
+@pytest.mark.skipif(not arrow_strings_available(), reason="pyarrow is not installed")
+def test_text_columns_are_held_as_arrow_strings(case_workbook):
+    processors = {"extract": processor_registry.get_processor("extract")}
+    data = case_workbook("extract-style1", rows=250, seed=4)
+    frames = [_read_compact(processors, data),
+              compact_frame(ExcelReader().read(io.BytesIO(data)), processors["extract"].category_columns)]
+    for df in frames:
+        strings = [name for name in df.columns if df[name].dtype == string_dtype()]
+        assert strings
+        assert all(pd.api.types.infer_dtype(df[name], skipna=True) == "string" for name in strings)
+    assert_same_workbooks(["extract"], "Style1.xlsx", data)
@@ -0,0 +1,66 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from classes.date_normalizer import DateNormalizer
+from classes.format_add_column import FormatAddColumn
+from classes.valoare_minus import ValoareMinus
+
+# Columns the processors formatted with pd.to_datetime(errors='coerce') before the normalizer
+OLD_COLUMNS = [
+    ["2024-01-15 00:00:00", "2024-02-01 13:45:00", None, "2024-03-31 23:59:59"],
+    ["2024-01-15", None, "2024-02-01", np.nan],
+    [datetime.datetime(2024, 1, 15), None, datetime.datetime(2024, 2, 1, 13, 45)],
+    ["2024-01-15T08:30:00", "2024-02-01T13:45:00", None],
+    ["not a date", "2024-01-15 00:00:00", None],
+]
+
+
+def old_format(values, output_format):
+    return pd.to_datetime(values, errors='coerce').dt.strftime(output_format)
+
+
+@pytest.mark.filterwarnings("ignore:Could not infer format")
+@pytest.mark.parametrize("column", OLD_COLUMNS)
+@pytest.mark.parametrize("output_format", ['%Y%m%d', '%d/%m/%Y'])
+def test_coerce_matches_pd_to_datetime(column, output_format):
+    values = pd.Series(column, dtype=object)
+    normalized = DateNormalizer(output_format, errors='coerce').normalize(values)
+    pd.testing.assert_series_equal(normalized, old_format(values, output_format).astype(object))
+
+
+def test_day_first_times_and_missing_values():
+    values = pd.Series(["15/01/2024 10:30", "01.02.2024 13:45:00", None, pd.NaT, "2024-03-01T08:00:00.250"],
+                       dtype=object)
+    normalized = DateNormalizer(errors='coerce').normalize(values).tolist()
+    assert normalized[:2] + normalized[4:] == ["20240115", "20240201", "20240301"]
+    assert DateNormalizer(errors='coerce').normalize(values)[2:4].isna().all()
+    # Without coercing, missing values stay as they were
+    assert DateNormalizer().normalize(values).tolist()[2] is None
+
+
+def test_minus_dates_match_old_output():
+    df = pd.DataFrame({"Data Ultimei Incasari": pd.Series(OLD_COLUMNS[0], dtype=object),
+                       "Valoare": [1.5, -2.0, 3.0, 0.0]})
+    expected = old_format(df["Data Ultimei Incasari"], '%Y%m%d')
+    result = ValoareMinus().process_dataframe(df.copy())
+    pd.testing.assert_series_equal(result["Data Ultimei Incasari"], expected.astype(object))
+
+
+def test_adaos_dates_match_old_output():
+    df = pd.DataFrame({"Data NIR": pd.Series(OLD_COLUMNS[0], dtype=object),
+                       "Data": pd.Series(OLD_COLUMNS[1], dtype=object)})
+    result = FormatAddColumn().format_data(df.copy())
+    for column in ("Data NIR", "Data"):
+        pd.testing.assert_series_equal(result[column], old_format(df[column], '%d/%m/%Y').astype(object))
+
+
+def test_normalizes_under_copy_on_write():
+    # serve.py turns copy-on-write on, which makes to_numpy() views read-only
+    values = pd.Series(["15/02/2024", "not a date", 45000, 10 ** 9, None, datetime.datetime(2024, 1, 2)],
+                       dtype=object)
+    expected = DateNormalizer().normalize(values)
+    with pd.option_context("mode.copy_on_write", True):
+        pd.testing.assert_series_equal(DateNormalizer().normalize(values), expected)
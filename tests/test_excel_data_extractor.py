@@ -0,0 +1,76 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from classes.excel_data_extractor import ExcelDataExtractor
+from conftest import workbook_bytes, workbook_parts
+
+EXTRACT_CASES = ["extract-style1", "extract-style2", "extract-style3"]
+FILENAMES = ["Achizitii M1.xlsx", "Achizitii AMT M2.xlsx", "Achizitii AUTOSERVIRE.xlsx", "achizitii.xlsx"]
+
+# Cell values the Style 1 columns are drawn from: numbers, text, blanks and
+# values int() and the date rule trip over
+POOLS = {
+    "Numar Factura": [17, 250_001, "F-12", "", np.nan, 3.0],
+    "Data Document": [pd.Timestamp("2024-03-01"), pd.Timestamp("2023-12-31 10:15"), "2024-02-29",
+                      "01/02/2024", "", np.nan],
+    "Valoare Achizitie": [0, 12.5, 1999.99, -3.25, "12,50", np.nan],
+    "Nume": ["Alfa SRL", "Beta & Co", "", np.nan, 42],
+    "CUI/CNP": ["RO123456", "123456", "RO 998877", 445566, "", np.nan],
+    "TVA Achizitie": [19, 9, 5, 0, "19", "0", "", "abc", 19.0, np.nan],
+    "Procent TVA": [19, 9, 0, "5", "x", np.nan],
+}
+
+
+def random_frame(rng, rows):
+    """A Style 1 sheet whose columns each hold a random mix of the pool values, or go missing"""
+    columns = {}
+    for name, pool in POOLS.items():
+        if rng.random() < 0.1:
+            continue
+        kinds = rng.choice(len(pool), size=rng.integers(1, len(pool) + 1), replace=False)
+        values = [pool[i] for i in rng.choice(kinds, rows)]
+        column = pd.Series(values, dtype=object)
+        # Uniform columns get the dtype pd.read_excel would give them
+        columns[name] = column.infer_objects()
+    return pd.DataFrame(columns)
+
+
+def no_fallback(*args):
+    # Failed derives from BaseException, so extract_data does not swallow it
+    pytest.fail("The columnar extraction fell back to the row-wise one")
+
+
+def extract(df, filename, columnar):
+    extractor = ExcelDataExtractor(columnar=columnar)
+    if columnar:
+        # A fallback would compare the row-wise path with itself
+        extractor._extract_rows = no_fallback
+    df = df.copy()
+    df.name = filename
+    return extractor.process_dataframe(df)
+
+
+def assert_same_output(df, filename):
+    rows = extract(df, filename, columnar=False)
+    columns = extract(df, filename, columnar=True)
+    pd.testing.assert_frame_equal(columns, rows)
+    assert workbook_parts(workbook_bytes(columns)) == workbook_parts(workbook_bytes(rows))
+
+
+@pytest.mark.parametrize("case", EXTRACT_CASES)
+def test_columnar_output_matches_row_wise_on_benchmark_sheets(case):
+    from workbooks import CASES
+
+    _, filename, generate = CASES[case]
+    df = pd.read_excel(io.BytesIO(workbook_bytes(generate(200, 0))))
+    assert_same_output(df, filename)
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_columnar_output_matches_row_wise_on_random_sheets(seed):
+    rng = np.random.default_rng(seed)
+    df = random_frame(rng, int(rng.integers(1, 40)))
+    assert_same_output(df, FILENAMES[seed % len(FILENAMES)])
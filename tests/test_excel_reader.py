@@ -0,0 +1,162 @@
+import datetime
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from classes.excel_reader import NA_STRINGS, ExcelReader
+
+# The readers must give what pandas' own openpyxl reader gives for the same sheet
+ENGINES = [pytest.param(engine, marks=pytest.mark.skipif(
+    engine == "calamine" and not ExcelReader.calamine_available(), reason="python-calamine is not installed"))
+    for engine in ExcelReader.ENGINES]
+CHUNK_ROWS = [1, 2, 3, 7, 1000]
+
+# Sheets as rows of cell values, the first row being the header
+SHEETS = {
+    # Columns whose cell types change down the sheet, so chunks see different kinds
+    "mixed": [
+        ["ints then text", "floats and NA strings", "NA strings only", "numbers as text"],
+        [1, 1.5, "NA", "1"], [2, "NA", None, "2.5"], [3, 2.5, "None", "3"], [4, "n/a", "nan", "x1"],
+        ["x", None, "", "4"], [6, "null", "NULL", "5"], [7, 3.0, "<NA>", "NaN"], [None, "#N/A", "-nan", "6"],
+    ],
+    "all NA": [
+        ["empty", "NA text", "value"],
+        [None, "NA", 1], [None, None, 2], [None, "n/a", 3], [None, "", 4],
+    ],
+    "bools and ints across chunks": [
+        ["bools then ints", "ints then bools", "bools then blanks", "bool text", "0/1 and bools"],
+        [True, 1, True, "True", 0], [False, 0, False, "False", 1], [True, 2, True, "TRUE", False],
+        [1, True, None, "false", True], [0, False, None, None, 1], [None, 5, None, "True", 0],
+    ],
+    "dates": [
+        ["datetimes", "dates", "with times", "dates and text", "dates and blanks"],
+        [datetime.datetime(2024, 1, 2), datetime.date(2024, 1, 2), datetime.datetime(2024, 1, 2, 10, 30),
+         datetime.datetime(2024, 3, 4), None],
+        [datetime.datetime(2023, 12, 31), datetime.date(2023, 12, 31), datetime.datetime(2023, 12, 31, 23, 59, 59),
+         "02/03/2024", datetime.datetime(2024, 5, 6)],
+        [datetime.datetime(2024, 2, 29), datetime.date(2024, 2, 29), datetime.datetime(2024, 2, 29, 0, 0, 1),
+         None, None],
+        [datetime.datetime(2020, 6, 1), datetime.date(2020, 6, 1), datetime.datetime(2020, 6, 1, 12),
+         "soon", datetime.datetime(2024, 7, 8)],
+    ],
+    "blank rows and headers": [
+        ["Valoare", None, "Valoare", "Unnamed: 1", 5],
+        [1, "a", 2.5, None, "x"], [None, None, None, None, None], [3, "b", None, 4, None, "past the header"],
+        [None, None, None, None, None], [5, "c", 6.5, 7, 8], [None, None, None, None, None],
+    ],
+}
+
+# Cell values random sheets are drawn from, by kind
+POOLS = {
+    "int": [0, 1, 2, 17, -5, 10 ** 12],
+    "float": [0.5, -2.25, 3.0, 1e-3],
+    "bool": [True, False],
+    "text": ["abc", "RO123", "True", "false", "1", "2.5", " x "],
+    "na": [None, "NA", "n/a", "", "null", "#N/A"],
+    "date": [datetime.datetime(2024, 1, 2), datetime.datetime(2024, 2, 3, 10, 30), datetime.date(2023, 12, 31)],
+}
+
+
+def workbook(rows) -> bytes:
+    book = Workbook()
+    sheet = book.active
+    for row in rows:
+        sheet.append(row)
+    output = io.BytesIO()
+    book.save(output)
+    return output.getvalue()
+
+
+def random_sheet(rng):
+    """Rows of a sheet whose columns run through one to three segments, each of one or two cell kinds"""
+    rows, columns = int(rng.integers(1, 25)), int(rng.integers(1, 6))
+    header = [[None, "", "a", "b", "Valoare", 5][int(i)] for i in rng.integers(0, 6, columns)]
+    segments = [[list(rng.choice(list(POOLS), size=rng.integers(1, 3), replace=False))
+                 for _ in range(rng.integers(1, 4))] for _ in range(columns)]
+    sheet = [header]
+    for r in range(rows):
+        row = []
+        for column in segments:
+            kinds = column[min(r * len(column) // rows, len(column) - 1)]
+            pool = POOLS[kinds[rng.integers(len(kinds))]]
+            row.append(pool[rng.integers(len(pool))])
+        sheet.append([None] * columns if rng.random() < 0.05 else row)
+    return sheet
+
+
+def kept(name):
+    return str(name).startswith(("V", "U", "d", "b"))
+
+
+def pandas_read(data, usecols=None):
+    return pd.read_excel(io.BytesIO(data), engine="openpyxl", usecols=usecols)
+
+
+def assert_matches_pandas(data, engine, chunk_rows, usecols=None):
+    expected = pandas_read(data, usecols)
+    reader = ExcelReader(engine)
+    pd.testing.assert_frame_equal(reader.read(io.BytesIO(data), usecols=usecols), expected)
+    # read_chunks reads with openpyxl whatever the engine
+    chunks = list(reader.read_chunks(io.BytesIO(data), chunk_rows=chunk_rows, usecols=usecols))
+    pd.testing.assert_frame_equal(pd.concat(chunks) if chunks else pd.DataFrame(), expected)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("sheet", list(SHEETS))
+def test_read_matches_pandas(engine, sheet):
+    data = workbook(SHEETS[sheet])
+    pd.testing.assert_frame_equal(ExcelReader(engine).read(io.BytesIO(data)), pandas_read(data))
+    pd.testing.assert_frame_equal(ExcelReader(engine).read(io.BytesIO(data), usecols=kept),
+                                  pandas_read(data, kept))
+
+
+@pytest.mark.parametrize("chunk_rows", CHUNK_ROWS)
+@pytest.mark.parametrize("sheet", list(SHEETS))
+def test_chunks_concatenate_to_the_pandas_read(chunk_rows, sheet):
+    data = workbook(SHEETS[sheet])
+    for usecols in (None, kept):
+        chunks = list(ExcelReader().read_chunks(io.BytesIO(data), chunk_rows=chunk_rows, usecols=usecols))
+        assert all(len(chunk) <= chunk_rows for chunk in chunks)
+        pd.testing.assert_frame_equal(pd.concat(chunks), pandas_read(data, usecols))
+
+
+@pytest.mark.filterwarnings("ignore:Could not infer format")
+@pytest.mark.parametrize("seed", range(80))
+def test_random_sheets_match_pandas(seed):
+    rng = np.random.default_rng(seed)
+    data = workbook(random_sheet(rng))
+    engine = ExcelReader.ENGINES[seed % len(ExcelReader.ENGINES)]
+    if engine == "calamine" and not ExcelReader.calamine_available():
+        engine = "auto"
+    assert_matches_pandas(data, engine, chunk_rows=CHUNK_ROWS[seed % 4])
+    assert_matches_pandas(data, engine, chunk_rows=2, usecols=kept)
+
+
+@pytest.mark.parametrize("sheet", list(SHEETS))
+def test_chunks_under_copy_on_write(sheet):
+    # serve.py turns copy-on-write on, which makes to_numpy() views read-only
+    data = workbook(SHEETS[sheet] + [[True, "False", None, False, "TRUE"]])
+    with pd.option_context("mode.copy_on_write", True):
+        for chunk_rows in CHUNK_ROWS:
+            chunks = ExcelReader().read_chunks(io.BytesIO(data), chunk_rows=chunk_rows)
+            pd.testing.assert_frame_equal(pd.concat(chunks), pandas_read(data))
+
+
+def test_empty_sheet():
+    data = workbook([])
+    for engine in ("openpyxl-stream", "openpyxl"):
+        assert ExcelReader(engine).read(io.BytesIO(data)).empty
+    assert list(ExcelReader().read_chunks(io.BytesIO(data))) == []
+
+
+@pytest.mark.skipif(not ExcelReader.calamine_available(), reason="python-calamine is not installed")
+def test_auto_reads_with_calamine_when_installed():
+    assert ExcelReader().resolve_engine() == "calamine"
+
+
+def test_na_strings_match_pandas_defaults():
+    parsers = pytest.importorskip("pandas._libs.parsers")
+    assert NA_STRINGS == parsers.STR_NA_VALUES
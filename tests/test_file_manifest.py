@@ -0,0 +1,132 @@
+import json
+import os
+
+import pytest
+
+from classes.file_manifest import FileManifest
+
+
+@pytest.fixture
+def folders(tmp_path):
+    """An input file and its processed output, and the output folder holding the manifest"""
+    (tmp_path / "in").mkdir()
+    (tmp_path / "out").mkdir()
+    input_path = tmp_path / "in" / "a.xlsx"
+    input_path.write_bytes(b"first content")
+    output_path = tmp_path / "out" / "Processed--a.xlsx"
+    output_path.write_bytes(b"output")
+    return str(input_path), str(output_path), str(tmp_path / "out")
+
+
+def recorded(folders, version="v1"):
+    input_path, output_path, folder = folders
+    manifest = FileManifest(folder, version)
+    manifest.record(input_path, output_path)
+    return manifest
+
+
+def touch(path, seconds=10):
+    """Move path's mtime forward without changing its content"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10 ** 9))
+
+
+def test_unrecorded_file_is_not_processed(folders):
+    input_path, _, folder = folders
+    assert not FileManifest(folder, "v1").is_processed(input_path)
+
+
+def test_recorded_file_is_processed_across_runs(folders):
+    input_path, _, folder = folders
+    recorded(folders)
+    assert FileManifest(folder, "v1").is_processed(input_path)
+
+
+def test_size_change_is_detected(folders):
+    input_path, _, _ = folders
+    manifest = recorded(folders)
+    with open(input_path, "ab") as f:
+        f.write(b" and more")
+    assert not manifest.is_processed(input_path)
+
+
+def test_same_size_content_change_is_detected(folders):
+    input_path, _, _ = folders
+    manifest = recorded(folders)
+    with open(input_path, "wb") as f:
+        f.write(b"other content")
+    touch(input_path)
+    assert not manifest.is_processed(input_path)
+
+
+def test_touched_unchanged_file_costs_one_hash(folders, monkeypatch):
+    input_path, _, folder = folders
+    recorded(folders)
+    touch(input_path)
+    hashes = []
+    monkeypatch.setattr(FileManifest, "file_hash",
+                        staticmethod(lambda path, hash=FileManifest.file_hash: hashes.append(path) or hash(path)))
+
+    manifest = FileManifest(folder, "v1")
+    assert manifest.is_processed(input_path)
+    assert hashes == [input_path]
+    # The new mtime is saved, so later checks skip the hash
+    assert FileManifest(folder, "v1").is_processed(input_path)
+    assert hashes == [input_path]
+
+
+def test_version_bump_reprocesses(folders):
+    input_path, _, folder = folders
+    recorded(folders, "v1")
+    assert not FileManifest(folder, "v2").is_processed(input_path)
+    recorded(folders, "v2")
+    assert FileManifest(folder, "v2").is_processed(input_path)
+    assert not FileManifest(folder, "v1").is_processed(input_path)
+
+
+def test_missing_output_reprocesses(folders):
+    input_path, output_path, _ = folders
+    manifest = recorded(folders)
+    os.remove(output_path)
+    assert not manifest.is_processed(input_path)
+
+
+def test_save_is_atomic(folders, monkeypatch):
+    input_path, output_path, folder = folders
+    manifest = recorded(folders)
+    before = open(manifest.path, encoding="utf-8").read()
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(json, "dump", lambda obj, f, **kwargs: (f.write('{"entries": {'), fail()))
+    with pytest.raises(OSError):
+        manifest.record(input_path, output_path)
+
+    assert open(manifest.path, encoding="utf-8").read() == before
+    # The half-written temporary file is removed
+    assert sorted(os.listdir(folder)) == sorted([FileManifest.FILENAME, "Processed--a.xlsx"])
+    assert FileManifest(folder, "v1").is_processed(input_path)
+
+
+@pytest.mark.parametrize("content", ["", "{not json", '{"entries": {', "[1, 2]", "null", "{}",
+                                     '{"entries": [1]}', '{"entries": {"a.xlsx": 1}}'])
+def test_unreadable_manifest_starts_empty(folders, content):
+    input_path, output_path, folder = folders
+    with open(os.path.join(folder, FileManifest.FILENAME), "w", encoding="utf-8") as f:
+        f.write(content)
+
+    manifest = FileManifest(folder, "v1")
+    assert manifest.entries == {}
+    assert not manifest.is_processed(input_path)
+    # Recording rewrites it
+    manifest.record(input_path, output_path)
+    assert FileManifest(folder, "v1").is_processed(input_path)
+
+
+def test_missing_folder_is_created_on_save(tmp_path, folders):
+    input_path, output_path, _ = folders
+    manifest = FileManifest(str(tmp_path / "new" / "out"), "v1")
+    assert manifest.entries == {}
+    manifest.record(input_path, output_path)
+    assert os.path.exists(manifest.path)
@@ -0,0 +1,233 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+from classes import processor_registry
+from classes.format_add_column import FormatAddColumn
+from classes.result_cache import ResultCache
+from classes.upload_pipeline import _initialize_worker, process_upload
+from conftest import workbook_bytes
+from workbooks import adaos_frame
+
+# The rates the summary covered before it took every rate in the data
+LEGACY_RATES = {"%19": 0.19, "%9": 0.09, "%21": 0.21, "%11": 0.11}
+
+
+def legacy_adaos(df):
+    """FormatAddColumn.process_dataframe as it was before the summary took every rate"""
+    processor = FormatAddColumn()
+    df = processor.drop_columns(processor.fix_column(processor.format_data(df)))
+    df = df.copy()
+    df['% TVA VANZARE'] = df['% TVA VANZARE'].apply(FormatAddColumn.correct_format)
+    df = df.dropna(subset=['% TVA VANZARE'])
+    df.loc[:, 'Numeric_TVA'] = df['% TVA VANZARE'].str.extract(r'(\d+)')[0].astype(float)
+    df = df.sort_values(by='Numeric_TVA', ascending=True).drop(columns=['Numeric_TVA'])
+    split_dfs = {value: df[df['% TVA VANZARE'] == value].reset_index(drop=True)
+                 for value in df['% TVA VANZARE'].unique()}
+    merged_df = pd.concat(split_dfs.values(), ignore_index=True)
+
+    summary_data = []
+    for key, split_df in split_dfs.items():
+        if key not in LEGACY_RATES:
+            continue
+        rate = LEGACY_RATES[key]
+        purchases = split_df['Valoare Achizitie'].str.replace(',', '').astype(float).sum()
+        sale_tva = split_df['Valoare TVA.1'].astype(float).sum()
+        summary_data.append([key, purchases, purchases * rate, sale_tva / rate, sale_tva,
+                             split_df['Adaos'].astype(float).sum()])
+
+    width = len(merged_df.columns)
+    rows = [[""] * width for _ in range(3)]
+    rows.append(FormatAddColumn.SUMMARY_COLUMNS + [""] * (width - 6))
+    rows.extend(list(row) + [""] * (width - 6) for row in summary_data)
+    return pd.concat([merged_df, pd.DataFrame(rows, columns=merged_df.columns)], ignore_index=True)
+
+
+def random_adaos_frame(rng, rates):
+    """adaos_frame with its '% TVA VANZARE' drawn from rates, plus a few invalid ones"""
+    rows = int(rng.integers(1, 60))
+    df = adaos_frame(rows, seed=int(rng.integers(1 << 31)))
+    values = np.array(rates + ["", "n/a", None], dtype=object)
+    weights = np.array([1.0] * len(rates) + [0.05] * 3)
+    df['% TVA VANZARE'] = rng.choice(values, rows, p=weights / weights.sum())
+    return df
+
+
+def data_rows(df):
+    """The rows of a processed frame above its three spacing rows"""
+    blank = (df.astype(str) == "").all(axis=1).to_numpy()
+    end = next((i for i in range(len(df) - 2) if blank[i:i + 3].all()), len(df))
+    return df.iloc[:end].reset_index(drop=True)
+
+
+def summary_rows(df):
+    """The summary table below a processed frame's data, with its own headers"""
+    summary = df.iloc[len(data_rows(df)) + 4:, :6]
+    summary.columns = FormatAddColumn.SUMMARY_COLUMNS
+    return summary.reset_index(drop=True)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_default_output_matches_legacy_on_legacy_rates(seed):
+    rng = np.random.default_rng(seed)
+    df = random_adaos_frame(rng, [0.19, 0.09, 19, 9, 21, 11, "19%", 0.21, 0.11])
+    expected = legacy_adaos(df.copy())
+    result = FormatAddColumn().process_dataframe(df.copy())
+    # The legacy sums ran per split, the summary sums per group: the same values in the same order
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-12)
+
+
+def test_summary_covers_every_rate():
+    df = adaos_frame(200, seed=3)
+    df['% TVA VANZARE'] = np.resize(np.array([19, 5, 0, 0.09, 21], dtype=object), len(df))
+    summary = summary_rows(FormatAddColumn().process_dataframe(df))
+
+    assert list(summary['% TVA VANZARE']) == ["%0", "%5", "%9", "%19", "%21"]
+    zero, five = summary.iloc[0], summary.iloc[1]
+    assert zero['Total Valoare Achizitie TVA'] == 0
+    assert pd.isna(zero['Total Valoare Vanzare'])
+    assert five['Total Valoare Vanzare'] == pytest.approx(five['Total Valoare Vanzare TVA'] / 0.05)
+
+
+def test_build_summary_totals_each_rate_in_order_of_appearance():
+    df = pd.DataFrame({
+        '% TVA VANZARE': ["%9", "%19", "%9", "%0"],
+        'Valoare Achizitie': ["1,000.00", "10.00", "2.50", "4.00"],
+        'Valoare TVA.1': [9.0, 19.0, 0.9, 0.0],
+        'Adaos': [1.0, 2.0, 3.0, 4.0],
+    })
+    summary = FormatAddColumn().build_summary(df)
+
+    assert list(summary['% TVA VANZARE']) == ["%9", "%19", "%0"]
+    assert list(summary['Total Valoare Achizitie']) == [1002.5, 10.0, 4.0]
+    assert summary['Total Valoare Achizitie TVA'].tolist() == pytest.approx([1002.5 * 0.09, 1.9, 0.0])
+    assert summary['Total Valoare Vanzare'].tolist()[:2] == pytest.approx([110.0, 100.0])
+    assert list(summary['Total Adaos']) == [4.0, 2.0, 4.0]
+    # Typed frames hold the rates as ints
+    typed = FormatAddColumn().build_summary(df.assign(**{'% TVA VANZARE': [9, 19, 9, 0]}))
+    pd.testing.assert_frame_equal(typed, summary)
+
+
+def test_build_summary_needs_its_columns():
+    assert FormatAddColumn().build_summary(pd.DataFrame({'% TVA VANZARE': ["%9"]})) is None
+
+
+def test_sort_by_rate_is_stable_and_drops_invalid_rates():
+    df = pd.DataFrame({
+        '% TVA VANZARE': [19, "9%", 0.19, "x", 0.09, None, 5, 19],
+        'id': range(8),
+    }, index=[7, 3, 5, 1, 0, 2, 4, 6])
+    sorted_df = FormatAddColumn().sort_by_rate(df)
+
+    assert list(sorted_df['% TVA VANZARE']) == [5, 9, 9, 19, 19, 19]
+    assert list(sorted_df['id']) == [6, 1, 4, 0, 2, 7]
+    assert sorted_df.index.equals(pd.RangeIndex(6))
+    assert sorted_df['% TVA VANZARE'].dtype == np.int64
+
+
+def test_split_sorted_slices_each_rate():
+    sorted_df = pd.DataFrame({'% TVA VANZARE': [0, 5, 5, 9, 19, 19, 19], 'id': range(7)})
+    splits = FormatAddColumn.split_sorted(sorted_df)
+
+    assert list(splits) == [0, 5, 9, 19]
+    assert [list(split['id']) for split in splits.values()] == [[0], [1, 2], [3], [4, 5, 6]]
+    assert pd.concat(splits.values()).equals(sorted_df)
+    assert FormatAddColumn.split_sorted(sorted_df.iloc[:0]) == {}
+
+
+def as_values(rows):
+    """Data rows with the amounts the default output formats as text parsed back, and the rates as labels"""
+    rows = rows.copy()
+    for col in FormatAddColumn.CURRENCY_COLUMNS:
+        rows[col] = pd.to_numeric(rows[col].astype(str).str.replace(',', '', regex=False))
+    rows['% TVA VANZARE'] = rows['% TVA VANZARE'].astype(str)
+    return rows.astype({'Adaos': float, 'Valoare TVA.1': float})
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_typed_output_holds_the_default_values(seed):
+    rng = np.random.default_rng(seed)
+    df = random_adaos_frame(rng, [0.19, 0.09, 0.05, 0, 19, 9, 5, 21, 11, "19%"])
+    # 'Valoare TVA' passes through untouched: it numbers the input rows
+    df['Valoare TVA'] = np.arange(len(df))
+    default = FormatAddColumn().process_dataframe(df.copy())
+    typed = FormatAddColumn(typed=True).process_dataframe(df.copy())
+
+    # The rows of a rate are summed in another order, so the totals may differ in the last bit
+    typed_summary, default_summary = summary_rows(typed), summary_rows(default)
+    assert list(typed_summary['% TVA VANZARE']) == list(default_summary['% TVA VANZARE'])
+    pd.testing.assert_frame_equal(typed_summary.iloc[:, 1:].astype(float), default_summary.iloc[:, 1:].astype(float),
+                                  check_exact=False, rtol=1e-12)
+    default_rows, typed_rows = as_values(data_rows(default)), as_values(data_rows(typed))
+    assert list(typed_rows['% TVA VANZARE']) == list(default_rows['% TVA VANZARE'])
+    # The typed rows keep their input order within each rate; the default
+    # ones are in whatever order an unstable sort left them
+    assert (typed_rows.groupby('% TVA VANZARE', sort=False)['Valoare TVA'].diff().dropna() > 0).all()
+    pd.testing.assert_frame_equal(typed_rows.sort_values('Valoare TVA', ignore_index=True),
+                                  default_rows.sort_values('Valoare TVA', ignore_index=True))
+
+
+def test_column_filter_reads_what_the_output_needs():
+    data = workbook_bytes(adaos_frame(80, seed=5))
+    for typed in (False, True):
+        processor = FormatAddColumn(typed=typed)
+        filtered = pd.read_excel(io.BytesIO(data), usecols=processor.column_filter())
+        assert not set(filtered.columns) & set(FormatAddColumn.DROP_COLUMNS)
+        expected = processor.process_dataframe(pd.read_excel(io.BytesIO(data)))
+        pd.testing.assert_frame_equal(processor.process_dataframe(filtered), expected)
+
+
+def written_cells(data):
+    """(value, number format) of the first data row's cells, by header"""
+    sheet = load_workbook(io.BytesIO(data)).active
+    headers = [cell.value for cell in sheet[1]]
+    return {header: (cell.value, cell.number_format) for header, cell in zip(headers, sheet[2])}
+
+
+@pytest.fixture
+def adaos_options():
+    """Restores the adaos processor's options after a test that configures it"""
+    saved = processor_registry.options().get('adaos', {})
+    yield
+    processor_registry.configure('adaos', **saved)
+
+
+def test_written_amounts_are_text_unless_typed(adaos_options):
+    data = workbook_bytes(adaos_frame(30, seed=2))
+
+    processor_registry.configure('adaos')
+    cells = written_cells(process_upload('adaos', 'Adaos.xlsx', data)[1])
+    assert all(isinstance(cells[col][0], str) for col in FormatAddColumn.CURRENCY_COLUMNS)
+    assert isinstance(cells['% TVA VANZARE'][0], str)
+
+    processor_registry.configure('adaos', typed=True)
+    assert processor_registry.get_processor('adaos').typed
+    cells = written_cells(process_upload('adaos', 'Adaos.xlsx', data)[1])
+    for col in FormatAddColumn.CURRENCY_COLUMNS:
+        assert isinstance(cells[col][0], float)
+        assert cells[col][1] == FormatAddColumn.CURRENCY_FORMAT
+    assert cells['% TVA VANZARE'][0].startswith("%")
+
+
+def test_typed_option_is_part_of_the_cache_key(adaos_options):
+    processor_registry.configure('adaos')
+    default = ResultCache.make_key('adaos', 'Adaos.xlsx', b"data")
+    processor_registry.configure('adaos', typed=True)
+    assert ResultCache.make_key('adaos', 'Adaos.xlsx', b"data") != default
+    assert ResultCache.make_key('sgr', 'Adaos.xlsx', b"data") == ResultCache.make_key('sgr', 'Adaos.xlsx', b"data")
+
+
+def test_pool_workers_get_the_options(adaos_options):
+    processor_registry.configure('adaos')
+    _initialize_worker([], {'adaos': {'typed': True}})
+    assert processor_registry.get_processor('adaos').typed
+
+
+def test_server_leaves_the_legacy_output_on_by_default():
+    import server
+
+    assert server.app.config['ADAOS_TYPED'] is False
+    assert processor_registry.options()['adaos'] == {'typed': False}
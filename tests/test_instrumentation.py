@@ -0,0 +1,44 @@
+import http.client
+import threading
+import uuid
+
+from werkzeug.serving import make_server
+
+from classes.instrumentation import FileTrace
+
+DIACRITIC_NAME = 'Încasări ș "sold".xlsx'
+
+
+def test_server_timing_fits_latin1_headers():
+    trace = FileTrace("minus", DIACRITIC_NAME)
+    with trace.stage("read"):
+        pass
+    entries = trace.server_timing()
+    assert entries[0].startswith("read;dur=")
+    for entry in entries:
+        entry.encode("latin-1")
+    assert 'desc="%C3%8Enc' in entries[0]
+
+
+def test_process_sends_diacritic_filename_over_a_real_server(case_workbook):
+    from server import app
+
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"process_type\"\r\n\r\nminus\r\n"
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"Incasari.xlsx\"; "
+            f"filename*=UTF-8''%C3%8Encas%C4%83ri%20%C8%99.xlsx\r\n\r\n").encode()
+    body += case_workbook("minus") + f"\r\n--{boundary}--\r\n".encode()
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=60)
+        connection.request("POST", "/process", body, {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+        response = connection.getresponse()
+        data = response.read()
+    finally:
+        server.shutdown()
+    assert response.status == 200
+    assert data[:2] == b"PK"
+    assert "%C3%8Encas%C4%83ri" in response.getheader("Server-Timing")
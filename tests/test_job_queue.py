@@ -0,0 +1,235 @@
+import io
+import json
+import os
+import threading
+import time
+import zipfile
+
+import pytest
+
+import server
+from classes.job_queue import Job, JobQueue
+from classes.upload_pipeline import result_name
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs"), workers=2, ttl=60)
+    yield queue
+    queue.shutdown()
+
+
+def wait(queue, job_id, timeout=30):
+    """The job once it has finished"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job is not None and job.finished is not None:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def saved_state(queue, job_id):
+    with open(os.path.join(queue.directory, job_id, JobQueue.STATE_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_single_result_is_kept_as_it_is(queue):
+    job = queue.submit(["minus"], ["a.xlsx"], lambda: [(result_name("minus", "a.xlsx"), b"workbook")])
+    job = wait(queue, job.id)
+
+    assert job.status == "done"
+    assert job.result_name == "minus - a.xlsx"
+    with open(job.result_path, "rb") as f:
+        assert f.read() == b"workbook"
+    assert job.to_dict()["done"] == 1
+
+
+def test_several_results_are_zipped(queue):
+    names = ["a.xlsx", "b.xlsx"]
+    job = queue.submit(["minus"], names, lambda: [(result_name("minus", name), name.encode()) for name in names])
+    job = wait(queue, job.id)
+
+    assert job.result_name == "processed_files.zip"
+    with zipfile.ZipFile(job.result_path) as archive:
+        assert archive.read("minus - b.xlsx") == b"b.xlsx"
+
+
+@pytest.mark.parametrize("produced, expected", [
+    (["a", "b", "c"], ["done", "done", "done"]),
+    (["b", "c"], ["failed", "done", "done"]),
+    (["a", "c"], ["done", "failed", "done"]),
+    (["a"], ["done", "failed", "failed"]),
+    ([], ["failed", "failed", "failed"]),
+])
+def test_track_marks_uploads_without_results_failed(queue, produced, expected):
+    names = ["a", "b", "c"]
+    job = queue.submit(["minus"], names, lambda: [(result_name("minus", name), b"x") for name in produced])
+    job = wait(queue, job.id)
+
+    assert [f["status"] for f in job.files] == expected
+    counts = job.to_dict()
+    assert (counts["done"], counts["failed"], counts["pending"]) == (len(produced), 3 - len(produced), 0)
+    assert job.status == ("done" if produced else "failed")
+
+
+def test_track_counts_each_mode_of_an_upload(queue):
+    routes = [["minus", "sgr"], ["sgr"]]
+    results = [result_name("sgr", "a"), result_name("sgr", "b")]
+    job = queue.submit(["minus", "sgr"], ["a", "b"], lambda: [(name, b"x") for name in results], routes=routes)
+    job = wait(queue, job.id)
+
+    # a lost its minus result but kept its sgr one
+    assert [f["status"] for f in job.files] == ["done", "done"]
+    assert [f["process_type"] for f in job.files] == ["minus+sgr", "sgr"]
+
+
+def test_progress_is_saved_as_results_arrive(queue):
+    release = threading.Event()
+    states = []
+
+    def runner():
+        yield result_name("minus", "a"), b"x"
+        release.wait(10)
+        yield result_name("minus", "b"), b"x"
+
+    job = queue.submit(["minus"], ["a", "b"], runner)
+    deadline = time.time() + 10
+    while time.time() < deadline and not states:
+        state = saved_state(queue, job.id)
+        if [f["status"] for f in state["files"]] == ["done", "pending"]:
+            states.append(state)
+        time.sleep(0.01)
+    release.set()
+
+    assert states and states[0]["status"] == "running"
+    assert saved_state(queue, wait(queue, job.id).id)["status"] == "done"
+
+
+def test_failing_runner_fails_the_job(queue):
+    def runner():
+        yield result_name("minus", "a"), b"x"
+        raise RuntimeError("worker crashed")
+
+    job = wait(queue, queue.submit(["minus"], ["a", "b"], runner).id)
+
+    assert job.status == "failed"
+    assert job.error == "worker crashed"
+    assert [f["status"] for f in job.files] == ["done", "failed"]
+    assert job.result_path is None
+
+
+def test_job_without_results_fails(queue):
+    job = wait(queue, queue.submit(["minus"], ["a"], lambda: []).id)
+    assert job.status == "failed"
+    assert job.error == "No file could be processed"
+
+
+def test_another_process_reads_the_job_from_disk(queue):
+    job = wait(queue, queue.submit(["minus"], ["a"], lambda: [(result_name("minus", "a"), b"x")]).id)
+    other = JobQueue(queue.directory, ttl=60)
+    try:
+        loaded = other.get(job.id)
+        assert loaded.to_dict() == job.to_dict()
+        assert loaded.result_path == job.result_path
+        assert other.get("0" * 32) is None
+        assert other.get("../" + job.id) is None
+    finally:
+        other.shutdown()
+
+
+def test_finished_jobs_expire_after_the_ttl(queue, monkeypatch):
+    job = wait(queue, queue.submit(["minus"], ["a"], lambda: [(result_name("minus", "a"), b"x")]).id)
+    job_dir = os.path.join(queue.directory, job.id)
+    other = JobQueue(queue.directory, ttl=60)
+
+    finished = job.finished
+    monkeypatch.setattr(time, "time", lambda: finished + 61)
+    # Another process sees it expired before sweeping it from disk
+    assert other.get(job.id) is None
+    assert queue.get(job.id) is None
+    assert not os.path.exists(job_dir)
+    other.shutdown()
+
+
+def test_abandoned_jobs_of_other_processes_are_swept(queue, monkeypatch):
+    abandoned = Job(["minus"], ["a"])
+    os.makedirs(os.path.join(queue.directory, abandoned.id))
+    with open(os.path.join(queue.directory, abandoned.id, JobQueue.STATE_FILE), "w", encoding="utf-8") as f:
+        json.dump(abandoned.state(), f)
+
+    now = time.time()
+    queue.expire()
+    assert os.path.exists(os.path.join(queue.directory, abandoned.id))
+    monkeypatch.setattr(time, "time", lambda: now + queue.ttl + queue.SWEEP_INTERVAL + 1)
+    queue.expire()
+    assert not os.path.exists(os.path.join(queue.directory, abandoned.id))
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """A test client whose job queue works in tmp_path"""
+    queue = JobQueue(str(tmp_path / "jobs"), workers=1, ttl=60)
+    monkeypatch.setattr(server, "job_queue", queue)
+    yield server.app.test_client()
+    queue.shutdown()
+
+
+def post_job(client, files, process_type="auto"):
+    data = {"process_type": process_type, "file": [(io.BytesIO(content), name) for name, content in files]}
+    return client.post("/jobs", data=data, content_type="multipart/form-data")
+
+
+def poll(client, status_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = client.get(status_url).get_json()
+        if status["status"] in ("done", "failed"):
+            return status
+        time.sleep(0.05)
+    raise AssertionError("Job did not finish")
+
+
+def test_job_routes(client, case_workbook):
+    response = post_job(client, [("Sold clienti.xlsx", case_workbook("minus")),
+                                 ("Vanzari M1.xlsx", case_workbook("sgr-M1")),
+                                 ("notes.xlsx", b"not a workbook")])
+    assert response.status_code == 202
+    submitted = response.get_json()
+    assert [r["name"] for r in submitted["rejected"]] == ["notes.xlsx"]
+
+    status = poll(client, submitted["status_url"])
+    assert status["status"] == "done"
+    assert (status["total"], status["done"], status["failed"]) == (2, 2, 0)
+    assert [f["process_type"] for f in status["files"]] == ["minus", "sgr"]
+
+    result = client.get(status["result_url"])
+    assert result.status_code == 200
+    assert result.mimetype == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(result.data)) as archive:
+        assert sorted(archive.namelist()) == ["minus - Sold clienti.xlsx", "sgr - Vanzari M1.xlsx"]
+
+
+def test_job_routes_reject_bad_submissions(client):
+    assert post_job(client, [("a.xlsx", b"x")], process_type="nope").status_code == 400
+    assert post_job(client, []).status_code == 400
+    response = post_job(client, [("notes.xlsx", b"not a workbook")])
+    assert response.status_code == 400
+    assert response.get_json()["rejected"][0]["name"] == "notes.xlsx"
+
+
+def test_job_status_and_result_of_unknown_or_unfinished_jobs(client):
+    assert client.get("/jobs/" + "0" * 32).status_code == 404
+    assert client.get("/jobs/" + "0" * 32 + "/result").status_code == 404
+
+    release = threading.Event()
+    job = server.job_queue.submit(["minus"], ["a"], lambda: (release.wait(10), [])[1])
+    try:
+        response = client.get(f"/jobs/{job.id}/result")
+        assert response.status_code == 409
+        assert client.get(f"/jobs/{job.id}").get_json()["status"] in ("queued", "running")
+    finally:
+        release.set()
+    assert poll(client, f"/jobs/{job.id}")["status"] == "failed"
+    assert client.get(f"/jobs/{job.id}/result").status_code == 409
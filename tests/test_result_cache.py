@@ -0,0 +1,78 @@
+import os
+import time
+
+from classes.result_cache import ResultCache
+
+
+def directory_bytes(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def test_writes_and_stats_do_not_rescan_the_directory(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path), max_bytes=1000)
+    listings = []
+    monkeypatch.setattr(os, "listdir", lambda path, listdir=os.listdir: listings.append(path) or listdir(path))
+    for i in range(12):
+        cache.put("minus", f"upload{i}.xlsx", b"input %d" % i, b"x" * 200)
+    stats = cache.stats()
+
+    assert listings == []
+    assert (stats["entries"], stats["bytes"]) == (5, 1000)
+    assert directory_bytes(tmp_path) == 1000
+    assert cache.get("minus", "upload7.xlsx", b"input 7") == b"x" * 200
+    assert cache.get("minus", "upload6.xlsx", b"input 6") is None
+
+
+def test_rewriting_an_entry_counts_it_once(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1000)
+    cache.put("minus", "a.xlsx", b"a", b"x" * 300)
+    cache.put("minus", "a.xlsx", b"a", b"y" * 100)
+    assert (cache.stats()["entries"], cache.stats()["bytes"]) == (1, 100)
+
+
+def test_index_survives_restarts(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1000)
+    for i in range(3):
+        cache.put("minus", f"upload{i}.xlsx", b"input %d" % i, b"x" * 200)
+    cache.get("minus", "upload0.xlsx", b"input 0")
+
+    restarted = ResultCache(str(tmp_path), max_bytes=500)
+    # upload1 was the least recently used
+    assert restarted.stats()["entries"] == 2
+    assert restarted.get("minus", "upload1.xlsx", b"input 1") is None
+    assert restarted.get("minus", "upload0.xlsx", b"input 0") == b"x" * 200
+
+
+def test_budget_holds_across_processes_after_a_rescan(tmp_path, monkeypatch):
+    # One cache per server process, all over the same directory
+    caches = [ResultCache(str(tmp_path), max_bytes=1000) for _ in range(3)]
+    for i in range(12):
+        caches[i % 3].put("minus", f"upload{i}.xlsx", b"input %d" % i, b"x" * 200)
+    # Each process kept its own entries in budget
+    assert directory_bytes(tmp_path) == 2400
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    caches[0].put("minus", "upload12.xlsx", b"input 12", b"x" * 200)
+    assert directory_bytes(tmp_path) <= 1000
+    # The most recent entries survive, whichever process wrote them
+    assert caches[1].get("minus", "upload11.xlsx", b"input 11") == b"x" * 200
+    assert caches[2].get("minus", "upload0.xlsx", b"input 0") is None
+    assert caches[2].stats()["bytes"] <= 1000
+
+
+def test_entry_evicted_by_another_process_is_a_miss(tmp_path):
+    first, second = ResultCache(str(tmp_path), 10_000), ResultCache(str(tmp_path), 10_000)
+    first.put("minus", "a.xlsx", b"a", b"result")
+    assert second.get("minus", "a.xlsx", b"a") == b"result"
+    os.remove(os.path.join(str(tmp_path), ResultCache.make_key("minus", "a.xlsx", b"a") + ResultCache.SUFFIX))
+
+    assert second.get("minus", "a.xlsx", b"a") is None
+    assert second.stats()["entries"] == 0
+
+
+def test_entry_written_by_another_process_is_a_hit(tmp_path):
+    writer, reader = ResultCache(str(tmp_path), 10_000), ResultCache(str(tmp_path), 10_000)
+    writer.put("sgr", "Vanzari M1.xlsx", b"data", b"result")
+    assert reader.get("sgr", "Vanzari M1.xlsx", b"data") == b"result"
+    assert reader.stats()["hits"] == 1
@@ -0,0 +1,95 @@
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+from openpyxl import Workbook
+
+from classes import processor_registry
+from classes.schema_sniffer import AUTO, SchemaIndex, route_upload, sniff_header
+from workbooks import minus_frame
+
+
+def minus_export_with_blank_columns() -> bytes:
+    """A Minus export whose notes run on under blank headers out to column U, as SGR reports have them"""
+    df = minus_frame(20).drop(columns="Scadenta (zile)")
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(list(df.columns))
+    for row in df.itertuples(index=False):
+        sheet.append(list(row) + [None] * 15 + ["nota"])
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def test_named_columns_beat_blank_headers_on_a_tie():
+    data = minus_export_with_blank_columns()
+    columns = sniff_header(data).columns
+    assert {"Unnamed: 5", "Unnamed: 20"} <= set(columns)
+    assert route_upload([AUTO], "Sold clienti.xlsx", data) == (["minus"], None)
+
+
+def test_sgr_report_still_routes_to_sgr(case_workbook):
+    assert route_upload([AUTO], "Vanzari M1.xlsx", case_workbook("sgr-M1")) == (["sgr"], None)
+
+
+def sheet_with_header(header) -> bytes:
+    workbook = Workbook()
+    sheet = workbook.active
+    for column, value in enumerate(header, start=1):
+        if value:
+            sheet.cell(row=1, column=column, value=value)
+    for column in range(1, len(header) + 1):
+        sheet.cell(row=2, column=column, value=column)
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("header", [
+    # Blank cells where the SGR subtraction columns used to be keyed
+    ["", "", "Cod", "Denumire", "Cantitate", ""] + [f"Col {i}" for i in range(6, 20)] + [""],
+    # A blank header that stops short of the deposit columns
+    [""] * 15,
+])
+def test_blank_header_cells_alone_do_not_route_to_sgr(header):
+    data = sheet_with_header(header)
+    assert route_upload([AUTO], "Vanzari M1.xlsx", data) == (None, "The columns match no known layout")
+
+
+@pytest.mark.parametrize("width", [19, 21, 24])
+def test_blank_header_row_out_to_the_deposit_column_routes_to_sgr(width):
+    assert route_upload([AUTO], "Vanzari M1.xlsx", sheet_with_header([""] * width)) == (["sgr"], None)
+
+
+def test_builtin_schemas_are_the_ones_the_processors_declare():
+    for process_type, (module, _) in processor_registry.BUILTIN_PROCESSORS.items():
+        processor_registry.load_processor_modules([module])
+        processor = processor_registry.get_processor(process_type)
+        assert processor.schemas == processor_registry.BUILTIN_SCHEMAS[process_type], process_type
+        assert processor_registry.schemas(process_type) == processor.schemas
+
+
+def test_matching_creates_no_processor(monkeypatch):
+    def fail(process_type):
+        raise AssertionError(f"created the {process_type} processor")
+
+    monkeypatch.setattr(processor_registry, "get_processor", fail)
+    index = SchemaIndex()
+    assert index.matches(["Cod Client", "Data Ultimei Incasari", "Valoare"]) == {"minus": (2, 2)}
+    assert index.declares_schema("sgr")
+
+
+def test_routing_imports_no_processor_module(tmp_path, case_workbook):
+    path = tmp_path / "Vanzari M1.xlsx"
+    path.write_bytes(case_workbook("sgr-M1"))
+    modules = [module for module, _ in processor_registry.BUILTIN_PROCESSORS.values()]
+    script = (f"import sys\n"
+              f"from classes.schema_sniffer import AUTO, route_upload\n"
+              f"assert route_upload([AUTO], 'Vanzari M1.xlsx', open({str(path)!r}, 'rb').read()) == (['sgr'], None)\n"
+              f"print([module for module in {modules!r} if module in sys.modules])\n")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", script], cwd=root, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
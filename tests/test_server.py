@@ -0,0 +1,39 @@
+import io
+import zipfile
+from urllib.parse import unquote
+
+import pytest
+
+from server import REJECTED_NOTE, app
+
+
+def post_process(files, process_type="auto"):
+    data = {"process_type": process_type, "file": [(io.BytesIO(content), name) for name, content in files]}
+    return app.test_client().post("/process", data=data, content_type="multipart/form-data")
+
+
+@pytest.mark.parametrize("stream_zip", [True, False])
+def test_rejected_uploads_are_listed_in_the_zip(case_workbook, monkeypatch, stream_zip):
+    monkeypatch.setitem(app.config, "STREAM_ZIP", stream_zip)
+    response = post_process([("Sold clienti.xlsx", case_workbook("minus")),
+                             ("Vanzari M1.xlsx", case_workbook("sgr-M1")),
+                             ("Încasări.xlsx", b"not a workbook")])
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert len(archive.namelist()) == 3
+        note = archive.read(REJECTED_NOTE).decode("utf-8")
+    assert note.startswith("Încasări.xlsx: Not a readable xlsx workbook")
+    assert unquote(response.headers["X-Rejected-Files"]) == note.strip()
+
+
+def test_rejected_uploads_are_listed_beside_a_single_result(case_workbook):
+    response = post_process([("Sold clienti.xlsx", case_workbook("minus")), ("notes.xlsx", b"not a workbook")])
+    assert response.status_code == 200
+    assert response.data[:2] == b"PK"
+    assert unquote(response.headers["X-Rejected-Files"]).startswith("notes.xlsx: Not a readable xlsx workbook")
+
+
+def test_no_header_when_nothing_is_rejected(case_workbook):
+    response = post_process([("Sold clienti.xlsx", case_workbook("minus"))])
+    assert response.status_code == 200
+    assert "X-Rejected-Files" not in response.headers
@@ -0,0 +1,72 @@
+import io
+
+import pandas as pd
+import pytest
+
+from classes.upload_pipeline import _mode_frame, process_upload_modes, process_upload_stream
+
+
+def read_result(data):
+    return pd.read_excel(io.BytesIO(data))
+
+
+@pytest.mark.parametrize("stream_min_bytes", [0, 1])
+def test_failing_mode_drops_only_itself(case_workbook, stream_min_bytes):
+    data = case_workbook("sgr-M1")
+    # The sheet has none of the minus columns
+    results = process_upload_modes(["sgr", "extract", "minus"], "Vanzari M1.xlsx", data,
+                                   stream_min_bytes=stream_min_bytes)
+    assert [name for name, _ in results] == ["sgr - Vanzari M1.xlsx", "extract - Vanzari M1.xlsx"]
+
+
+def test_streamed_results_match_whole_sheet(case_workbook):
+    data = case_workbook("sgr-M1", rows=120)
+    whole = process_upload_modes(["sgr", "extract"], "Vanzari M1.xlsx", data)
+    streamed = process_upload_modes(["sgr", "extract"], "Vanzari M1.xlsx", data, stream_min_bytes=1)
+    assert [name for name, _ in whole] == [name for name, _ in streamed]
+    for (_, expected), (_, actual) in zip(whole, streamed):
+        pd.testing.assert_frame_equal(read_result(actual), read_result(expected))
+
+
+def test_single_stream_raises_the_processor_error(case_workbook):
+    from classes import processor_registry
+
+    with pytest.raises(KeyError):
+        process_upload_stream(processor_registry.get_processor("minus"), "Vanzari M1.xlsx",
+                              case_workbook("sgr-M1"), io.BytesIO())
+
+
+class ValoareProcessor:
+    def column_filter(self):
+        return lambda name: name == "Valoare"
+
+
+class WholeSheetProcessor:
+    def column_filter(self):
+        return None
+
+
+@pytest.mark.parametrize("copy_on_write", [True, False])
+def test_mode_frames_leave_the_parsed_sheet_intact(copy_on_write):
+    df = pd.DataFrame({"Valoare": [1.0, 2.0]})
+    df.name = "sheet"
+    with pd.option_context("mode.copy_on_write", copy_on_write):
+        frame = _mode_frame(df, WholeSheetProcessor(), modes=2)
+        frame.loc[0, "Valoare"] = -1.0
+    assert df["Valoare"].tolist() == [1.0, 2.0]
+
+
+@pytest.mark.filterwarnings("error::pandas.errors.SettingWithCopyWarning")
+def test_mode_frames_are_not_flagged_as_slices():
+    df = pd.DataFrame({"Valoare": [1.0, 2.0], "Other": ["a", "b"]})
+    df.name = "sheet"
+    with pd.option_context("mode.copy_on_write", False):
+        frame = _mode_frame(df, ValoareProcessor(), modes=2)
+        frame["Valoare"] = frame["Valoare"].round()
+    assert list(frame.columns) == ["Valoare"]
+
+
+def test_processing_does_not_set_pandas_options(case_workbook):
+    with pd.option_context("mode.copy_on_write", False):
+        process_upload_modes(["sgr", "extract"], "Vanzari M1.xlsx", case_workbook("sgr-M1"))
+        assert pd.options.mode.copy_on_write is False
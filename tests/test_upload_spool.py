@@ -0,0 +1,193 @@
+import hashlib
+import io
+import os
+import pickle
+import time
+import zipfile
+
+import pandas as pd
+import pytest
+
+import server
+from classes.upload_spool import UploadSpool, _MappedFile, open_upload, upload_digest
+from conftest import workbook_bytes
+
+
+def spooled(spool, content, total_content_length):
+    """The upload of content written to a stream of spool, as werkzeug writes it"""
+    stream = spool.stream(total_content_length)
+    stream.write(content)
+    return UploadSpool.adopt(stream), stream
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return UploadSpool(str(tmp_path / "spool"), memory_max_bytes=1024)
+
+
+def spool_files(spool):
+    return sorted(os.listdir(spool.directory))
+
+
+def test_small_upload_stays_in_memory(spool):
+    upload, stream = spooled(spool, b"small", 100)
+
+    assert isinstance(stream, io.BytesIO)
+    assert (len(upload), upload.data, upload.path) == (5, b"small", None)
+    with upload.open() as f:
+        assert f.read() == b"small"
+    assert upload.digest() == hashlib.sha256(b"small").digest()
+    upload.detach()
+    upload.discard()
+    assert spool_files(spool) == []
+
+
+@pytest.mark.parametrize("total_content_length", [1025, None])
+def test_large_upload_is_spooled_and_mapped(spool, total_content_length):
+    content = workbook_bytes(pd.DataFrame({"Valoare": range(500)}))
+    upload, stream = spooled(spool, content, total_content_length)
+
+    assert stream.closed
+    assert upload.data is None and len(upload) == len(content)
+    assert spool_files(spool) == [os.path.basename(upload.path)]
+    with upload.open() as f:
+        assert isinstance(f, _MappedFile)
+        assert f.read() == content
+        pd.testing.assert_frame_equal(pd.read_excel(f), pd.DataFrame({"Valoare": range(500)}))
+    assert upload_digest(upload) == hashlib.sha256(content).digest()
+
+    # A worker process gets the path, not the contents
+    pickled = pickle.dumps(upload)
+    assert len(pickled) < 1024
+    with open_upload(pickle.loads(pickled)) as f:
+        assert zipfile.ZipFile(f).testzip() is None
+
+
+def test_mapped_file_reads_like_a_file(spool):
+    content = bytes(range(256)) * 8
+    upload, _ = spooled(spool, content, None)
+    with upload.open() as f:
+        assert f.seekable() and f.readable()
+        assert f.read(10) == content[:10]
+        assert f.seek(5, io.SEEK_CUR) == 15 and f.tell() == 15
+        buffer = bytearray(20)
+        assert f.readinto(buffer) == 20 and bytes(buffer) == content[15:35]
+        assert f.seek(-4, io.SEEK_END) == len(content) - 4
+        assert f.read(100) == content[-4:]
+        assert f.read() == b""
+        with pytest.raises(OSError):
+            f.seek(-1)
+
+
+def test_empty_spooled_upload(spool):
+    upload, _ = spooled(spool, b"", None)
+    assert len(upload) == 0
+    with upload.open() as f:
+        assert f.read() == b""
+    assert upload.digest() == hashlib.sha256(b"").digest()
+
+
+def test_release_removes_spool_files_but_detached_ones(spool):
+    kept, kept_stream = spooled(spool, b"k" * 2000, None)
+    dropped, dropped_stream = spooled(spool, b"d" * 2000, None)
+    kept.detach()
+    assert kept.path.endswith(".kept")
+
+    UploadSpool.release([kept_stream, dropped_stream, io.BytesIO()])
+    assert spool_files(spool) == [os.path.basename(kept.path)]
+    with kept.open() as f:
+        assert f.read() == b"k" * 2000
+
+    kept.discard()
+    kept.discard()
+    assert spool_files(spool) == []
+
+
+def test_stale_spool_files_are_removed_on_start(spool):
+    upload, _ = spooled(spool, b"x" * 2000, None)
+    other = os.path.join(spool.directory, "not-ours.bin")
+    open(other, "wb").close()
+    stale = time.time() - UploadSpool.STALE_SECONDS - 1
+    for path in (upload.path, other):
+        os.utime(path, (stale, stale))
+
+    UploadSpool(spool.directory, 1024)
+    assert spool_files(spool) == ["not-ours.bin"]
+
+
+def test_foreign_streams_are_read_into_memory():
+    stream = io.BufferedRandom(io.BytesIO())
+    stream.write(b"abc")
+    upload = UploadSpool.adopt(stream)
+    assert (upload.data, upload.path, len(upload)) == (b"abc", None, 3)
+
+
+@pytest.fixture
+def server_spool(tmp_path, monkeypatch):
+    """The server's upload spool in tmp_path, spooling every upload to disk"""
+    spool = UploadSpool(str(tmp_path / "spool"), memory_max_bytes=0)
+    monkeypatch.setattr(server, "upload_spool", spool)
+    return spool
+
+
+def post_process(files):
+    data = {"process_type": "minus", "file": [(io.BytesIO(content), name) for name, content in files]}
+    return server.app.test_client().post("/process", data=data, content_type="multipart/form-data")
+
+
+@pytest.mark.parametrize("stream_zip", [True, False])
+def test_requests_remove_their_spool_files(server_spool, case_workbook, monkeypatch, stream_zip):
+    monkeypatch.setitem(server.app.config, "STREAM_ZIP", stream_zip)
+    response = post_process([("a.xlsx", case_workbook("minus")), ("b.xlsx", case_workbook("minus", seed=1))])
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert len(archive.namelist()) == 2
+    response.close()
+    assert spool_files(server_spool) == []
+
+
+def test_failed_requests_remove_their_spool_files(server_spool, case_workbook, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("processing failed")
+
+    monkeypatch.setattr(server, "process_uploads", fail)
+    monkeypatch.setitem(server.app.config, "STREAM_ZIP", False)
+    response = post_process([("a.xlsx", case_workbook("minus"))])
+    assert response.status_code == 500
+    assert spool_files(server_spool) == []
+
+
+@pytest.mark.parametrize("consumed", [1, 2])
+def test_detached_uploads_are_discarded_however_the_results_end(spool, consumed):
+    spooled_uploads = [spooled(spool, b"x" * 2000, None) for _ in range(2)]
+    uploads = [(name, upload) for name, (upload, _) in zip("ab", spooled_uploads)]
+
+    def results():
+        yield "a", b"1"
+        raise RuntimeError("worker crashed")
+
+    detached = server.detached_results(uploads, results())
+    # Still there once the request has released its streams
+    UploadSpool.release([stream for _, stream in spooled_uploads])
+    assert len(spool_files(spool)) == 2
+    if consumed == 2:
+        with pytest.raises(RuntimeError):
+            list(detached)
+    else:
+        next(detached)
+        # A client disconnecting mid-download closes the generator
+        detached.close()
+    assert spool_files(spool) == []
+
+
+def test_never_consumed_results_leave_their_spool_files_to_the_stale_sweep(spool):
+    upload, stream = spooled(spool, b"x" * 2000, None)
+    uploads = [("a", upload)]
+    server.detached_results(uploads, iter([])).close()
+    UploadSpool.release([stream])
+
+    assert len(spool_files(spool)) == 1
+    stale = time.time() - UploadSpool.STALE_SECONDS - 1
+    os.utime(uploads[0][1].path, (stale, stale))
+    UploadSpool(spool.directory, 1024)
+    assert spool_files(spool) == []
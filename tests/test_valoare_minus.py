@@ -0,0 +1,207 @@
+import datetime
+import re
+
+import numpy as np
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from classes.valoare_minus import ValoareMinus
+
+HEADERS = ["Cod Client", "Data Ultimei Incasari", "Valoare", "Nume Client", "Total Valoare"]
+
+
+class FakeSheet:
+    """The part of an xlwings sheet the Minus batch mode uses, over a dict of cells.
+
+    Counts the value writes (writes) and records the cells they touched (written).
+    """
+
+    def __init__(self, rows):
+        self.cells_by_position = {(r, c): value for r, row in enumerate(rows, start=1)
+                                  for c, value in enumerate(row, start=1) if value is not None}
+        self.number_formats = {}
+        self.writes = 0
+        self.written = set()
+
+    @property
+    def used_range(self):
+        rows = max((r for r, _ in self.cells_by_position), default=1)
+        columns = max((c for _, c in self.cells_by_position), default=1)
+        return FakeRange(self, (1, 1), (rows, columns))
+
+    def range(self, first, last=None):
+        if isinstance(first, str):
+            first, _, last = first.partition(":")
+            first = self._position(first)
+            last = self._position(last) if last else first
+        return FakeRange(self, first, last or first)
+
+    def cells(self, row, col):
+        if isinstance(col, str):
+            col = self._position(f"{col}1")[1]
+        return FakeRange(self, (row, col), (row, col))
+
+    @staticmethod
+    def _position(address):
+        letters, row = re.fullmatch(r"([A-Z]+)(\d+)", address).groups()
+        col = 0
+        for letter in letters:
+            col = col * 26 + ord(letter) - 64
+        return int(row), col
+
+    def column(self, col, rows):
+        return [self.cells_by_position.get((row, col)) for row in range(1, rows + 1)]
+
+
+class FakeRange:
+    def __init__(self, sheet, first, last, ndim=None):
+        self.sheet, self.first, self.last, self.ndim = sheet, first, last, ndim
+
+    @property
+    def positions(self):
+        return [[(r, c) for c in range(self.first[1], self.last[1] + 1)]
+                for r in range(self.first[0], self.last[0] + 1)]
+
+    @property
+    def last_cell(self):
+        return type("Cell", (), {"row": self.last[0], "column": self.last[1]})
+
+    @property
+    def columns(self):
+        return type("Columns", (), {"count": self.last[1] - self.first[1] + 1})
+
+    def options(self, ndim=None):
+        return FakeRange(self.sheet, self.first, self.last, ndim)
+
+    @property
+    def value(self):
+        values = [self.sheet.cells_by_position.get(position) for row in self.positions for position in row]
+        return values[0] if len(values) == 1 and self.ndim is None else values
+
+    @value.setter
+    def value(self, value):
+        rows = value if isinstance(value, list) else [[value]]
+        self.sheet.writes += 1
+        for positions, values in zip(self.positions, rows):
+            for position, cell_value in zip(positions, values):
+                # Excel stores digit-only text as a number, as xlwings writes it
+                if isinstance(cell_value, str) and cell_value.isdigit():
+                    cell_value = int(cell_value)
+                self.sheet.written.add(position)
+                if cell_value is None:
+                    self.sheet.cells_by_position.pop(position, None)
+                else:
+                    self.sheet.cells_by_position[position] = cell_value
+
+    @property
+    def number_format(self):
+        return self.sheet.number_formats.get(self.first)
+
+    @number_format.setter
+    def number_format(self, number_format):
+        for row in self.positions:
+            for position in row:
+                self.sheet.number_formats[position] = number_format
+
+
+# Values of the amount columns: numbers, text, dates, and no blanks (a blank ends the column)
+AMOUNT_CELLS = [12, -3.5, 0, 1e6, 7.25, "n/a", "1/2", "12", datetime.datetime(2024, 1, 2), True]
+DATE_CELLS = [datetime.datetime(2024, 1, 2), datetime.datetime(2023, 12, 31, 10, 30), "15/02/2024",
+              "2024-03-01", 45000, "not a date", None]
+
+
+def random_rows(rng):
+    rows = [HEADERS]
+    count = int(rng.integers(1, 40))
+    # A blank stops the negation; the cells below it stay as they are
+    blank_at = int(rng.integers(2, count + 3))
+    for row in range(2, count + 2):
+        amounts = [AMOUNT_CELLS[int(i)] for i in rng.integers(0, len(AMOUNT_CELLS), 2)]
+        if row == blank_at:
+            amounts[int(rng.integers(2))] = None
+        rows.append([row, DATE_CELLS[int(rng.integers(len(DATE_CELLS)))], amounts[0],
+                     f"Client {row}", amounts[1]])
+    return rows
+
+
+def run_xlwings_path(rows, bulk):
+    processor = ValoareMinus(bulk=bulk)
+    processor.ws = FakeSheet(rows)
+    processor.process_single_file()
+    return processor.ws
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_bulk_matches_cell_by_cell(seed):
+    rows = random_rows(np.random.default_rng(seed))
+    bulk, cells = run_xlwings_path(rows, bulk=True), run_xlwings_path(rows, bulk=False)
+
+    assert bulk.cells_by_position == cells.cells_by_position
+    assert bulk.number_formats == cells.number_formats
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_bulk_writes_only_numeric_cells_once_per_run(seed):
+    rows = random_rows(np.random.default_rng(seed))
+    sheet = run_xlwings_path(rows, bulk=True)
+
+    amount_cells = {(r, c) for r in range(2, len(rows) + 1) for c in (3, 5)}
+    written = sheet.written & amount_cells
+    assert all(isinstance(rows[r - 1][c - 1], (int, float)) for r, c in written)
+    runs = 0
+    for col in (3, 5):
+        column = [r for r, c in sorted(written) if c == col]
+        runs += sum(1 for i, row in enumerate(column) if i == 0 or column[i - 1] != row - 1)
+    # One write per date column, then one per run of numeric amounts
+    assert sheet.writes == 1 + runs
+
+
+def test_negate_numbers():
+    negated, numeric = ValoareMinus.negate_numbers([1, "x", None, -2.5, True, datetime.date(2024, 1, 2)])
+
+    assert list(numeric) == [True, False, False, True, True, False]
+    assert list(negated[:4]) == [-1, "x", None, 2.5]
+
+
+def workbook_file(path, rows):
+    book = Workbook()
+    sheet = book.active
+    for row in rows:
+        sheet.append(row)
+    sheet["F2"] = "=C2*2"
+    book.save(path)
+    return path
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_headless_matches_the_xlwings_path(tmp_path, seed):
+    rows = random_rows(np.random.default_rng(seed))
+    output = tmp_path / "Minus--input.xlsx"
+    ValoareMinus().process_file_headless(str(workbook_file(tmp_path / "input.xlsx", rows)), str(output))
+
+    expected = run_xlwings_path(rows, bulk=True)
+    sheet = load_workbook(output).worksheets[0]
+    for col in range(1, len(HEADERS) + 1):
+        values = [sheet.cell(row=row, column=col).value for row in range(1, len(rows) + 1)]
+        assert values == expected.column(col, len(rows)), HEADERS[col - 1]
+    date_rows = range(2, len(rows) + 1)
+    assert all(sheet.cell(row=row, column=2).number_format == "General"
+               for row in date_rows if rows[row - 1][1] is not None)
+    # Cells it does not rewrite keep their formulas
+    assert sheet["F2"].value == "=C2*2"
+
+
+def test_headless_batch_skips_unchanged_files(tmp_path):
+    rows = random_rows(np.random.default_rng(0))
+    processor = ValoareMinus(batch_engine="openpyxl")
+    processor.input_folder, processor.output_folder = str(tmp_path / "in"), str(tmp_path / "out")
+    (tmp_path / "in").mkdir()
+    workbook_file(tmp_path / "in" / "a.xlsx", rows)
+
+    processor.process_files()
+    output = tmp_path / "out" / "Minus--a.xlsx"
+    first = output.stat().st_mtime_ns
+    processor.process_files()
+
+    assert output.stat().st_mtime_ns == first
+    assert load_workbook(output).worksheets[0].cell(row=1, column=3).value == "Valoare"